@@ -0,0 +1,54 @@
+"""启动服务：python -m app
+
+通过环境变量选择 uvicorn 的事件循环和 HTTP 解析器：
+- EVENT_LOOP: auto（已安装 uvloop 时使用 uvloop）、asyncio 或 uvloop
+- HTTP_PARSER: auto（已安装 httptools 时使用 httptools）、h11 或 httptools
+
+显式指定 uvloop / httptools 但未安装时直接报错，而不是静默退回默认实现。
+安装方式：pip install 'deepclaude[uvloop]'（或 uvicorn[standard]）。
+"""
+
+import importlib.util
+import os
+import sys
+
+from app.config import load_env
+
+load_env()
+
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8000"))
+EVENT_LOOP = os.getenv("EVENT_LOOP", "auto")
+HTTP_PARSER = os.getenv("HTTP_PARSER", "auto")
+
+_CHOICES = {
+    "EVENT_LOOP": ("auto", "asyncio", "uvloop"),
+    "HTTP_PARSER": ("auto", "h11", "httptools"),
+}
+_OPTIONAL_MODULES = {"uvloop": "uvloop", "httptools": "httptools"}
+
+
+def _check(name: str, value: str) -> str:
+    if value not in _CHOICES[name]:
+        raise SystemExit(f"{name} 必须是 {' / '.join(_CHOICES[name])} 之一，当前为 {value}")
+    module = _OPTIONAL_MODULES.get(value)
+    if module and importlib.util.find_spec(module) is None:
+        raise SystemExit(f"{name}={value} 需要安装 {module}: pip install 'deepclaude[uvloop]'")
+    return value
+
+
+def main() -> None:
+    import uvicorn
+
+    uvicorn.run(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        loop=_check("EVENT_LOOP", EVENT_LOOP),
+        http=_check("HTTP_PARSER", HTTP_PARSER),
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
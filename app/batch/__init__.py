@@ -0,0 +1,5 @@
+"""批量请求处理包"""
+
+from .batch_runner import BatchRunner, interactive_traffic
+
+__all__ = ["BatchRunner", "interactive_traffic"]
@@ -0,0 +1,286 @@
+"""批量请求执行器
+
+接收 JSONL 格式的一组聊天请求，以受限并发通过现有流水线执行，
+按完成顺序以 JSONL 流式返回结果。每个结果同时追加写入本地任务文件，
+使用相同 job_id 重新提交时跳过已经成功完成的条目。同一 job_id 同时只能有一个任务在执行。
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from contextlib import aclosing
+from pathlib import Path
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.utils.logger import logger
+
+# 所有批量任务共享的最大并发数
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# 交互流量繁忙时批量任务至少保留的并发数
+BATCH_MIN_CONCURRENCY = int(os.getenv("BATCH_MIN_CONCURRENCY", "1"))
+# 任务文件目录
+BATCH_JOB_DIR = os.getenv("BATCH_JOB_DIR", "batch_jobs")
+
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+BatchHandler = Callable[[dict], Awaitable[dict]]
+
+
+class TrafficGate:
+    """在交互流量与批量流量之间分配并发
+
+    批量任务可用的并发数 = max(最小并发, 总并发 - 正在进行的交互请求数)，
+    交互请求增加时批量任务不再启动新条目，直到交互流量回落。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = BATCH_CONCURRENCY,
+        min_concurrency: int = BATCH_MIN_CONCURRENCY,
+    ):
+        self.concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.interactive_inflight = 0
+        self.batch_inflight = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # 延迟创建，确保绑定到运行中的事件循环
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def batch_capacity(self) -> int:
+        return max(self.min_concurrency, self.concurrency - self.interactive_inflight)
+
+    async def _notify(self) -> None:
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def interactive_started(self) -> None:
+        self.interactive_inflight += 1
+
+    async def interactive_finished(self) -> None:
+        self.interactive_inflight -= 1
+        await self._notify()
+
+    async def acquire_batch_slot(self) -> None:
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: self.batch_inflight < self.batch_capacity()
+            )
+            self.batch_inflight += 1
+
+    async def release_batch_slot(self) -> None:
+        self.batch_inflight -= 1
+        await self._notify()
+
+
+# 全局流量分配实例
+interactive_traffic = TrafficGate()
+
+
+class BatchRunner:
+    """批量任务执行器"""
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        job_dir: str = BATCH_JOB_DIR,
+        gate: TrafficGate = interactive_traffic,
+    ):
+        """初始化执行器
+
+        Args:
+            handler: 执行单个非流式聊天请求的协程函数，参数为请求体，返回 OpenAI 格式响应
+            job_dir: 任务文件目录
+            gate: 与交互流量共享的并发分配器
+        """
+        self.handler = handler
+        self.job_dir = Path(job_dir)
+        self.gate = gate
+        # 正在执行的任务，同一任务文件只由一个任务追加写入
+        self._active_jobs = set()
+
+    @staticmethod
+    def new_job_id() -> str:
+        return f"batch_{hex(int(time.time() * 1000))[2:]}"
+
+    def is_active(self, job_id: str) -> bool:
+        return job_id in self._active_jobs
+
+    def job_path(self, job_id: str) -> Path:
+        if not JOB_ID_PATTERN.match(job_id):
+            raise ValueError(f"无效的 job_id: {job_id}")
+        return self.job_dir / f"{job_id}.jsonl"
+
+    @staticmethod
+    def parse_items(payload: bytes) -> List[Tuple[str, dict]]:
+        """解析 JSONL 请求
+
+        每行可以是完整的聊天请求体，也可以是 {"custom_id": ..., "body": {...}} 形式。
+        未指定 custom_id 时使用行号。
+
+        Returns:
+            List[Tuple[str, dict]]: (custom_id, 请求体) 列表
+
+        Raises:
+            ValueError: 某一行不是合法的 JSON 对象或 custom_id 重复
+        """
+        items = []
+        seen = set()
+        for index, line in enumerate(payload.decode("utf-8").splitlines()):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {index + 1} 行不是合法的 JSON: {e}")
+            if not isinstance(entry, dict):
+                raise ValueError(f"第 {index + 1} 行必须是 JSON 对象")
+
+            body = entry["body"] if isinstance(entry.get("body"), dict) else entry
+            custom_id = str(entry.get("custom_id", index))
+            if custom_id in seen:
+                raise ValueError(f"重复的 custom_id: {custom_id}")
+            seen.add(custom_id)
+            items.append((custom_id, {**body, "stream": False}))
+        return items
+
+    def load_results(self, job_id: str) -> Dict[str, dict]:
+        """读取任务文件中已记录的结果，同一 custom_id 以最后一条为准"""
+        path = self.job_path(job_id)
+        results = {}
+        if not path.exists():
+            return results
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程在写入过程中退出时最后一行可能不完整
+                    continue
+                results[record["custom_id"]] = record
+        return results
+
+    async def _run_item(self, custom_id: str, body: dict) -> dict:
+        await self.gate.acquire_batch_slot()
+        try:
+            response = await self.handler(body)
+            if "error" in response and "choices" not in response:
+                return {"custom_id": custom_id, "status": "failed", "error": response["error"]}
+            return {"custom_id": custom_id, "status": "completed", "response": response}
+        except Exception as e:
+            logger.error(f"批量条目 {custom_id} 执行失败: {e}")
+            return {"custom_id": custom_id, "status": "failed", "error": str(e)}
+        finally:
+            await self.gate.release_batch_slot()
+
+    @staticmethod
+    def _encode(record: dict) -> str:
+        """把结果编码为一行 JSON，响应无法序列化时改为失败结果"""
+        try:
+            return json.dumps(record, ensure_ascii=False) + "\n"
+        except (TypeError, ValueError) as e:
+            logger.error(f"批量条目 {record['custom_id']} 的结果无法序列化: {e}")
+            record = {"custom_id": record["custom_id"], "status": "failed", "error": str(e)}
+            return json.dumps(record, ensure_ascii=False) + "\n"
+
+    @staticmethod
+    async def _write_job_file(path: Path, lines: asyncio.Queue) -> None:
+        """把结果依次追加到任务文件，直到收到 None；文件操作在线程中执行"""
+        job_file = None
+        try:
+            job_file = await asyncio.to_thread(open, path, "a", encoding="utf-8")
+        except OSError as e:
+            logger.error(f"无法打开批量任务文件 {path}: {e}")
+        try:
+            while (line := await lines.get()) is not None:
+                if job_file is None:
+                    continue
+                try:
+                    await asyncio.to_thread(_append_line, job_file, line)
+                except OSError as e:
+                    logger.error(f"写入批量任务文件 {path} 失败: {e}")
+        finally:
+            if job_file is not None:
+                await asyncio.to_thread(job_file.close)
+
+    async def run(self, job_id: str, payload: bytes) -> AsyncGenerator[bytes, None]:
+        """执行批量任务
+
+        Args:
+            job_id: 任务 ID，相同 ID 重新提交时跳过已成功的条目
+            payload: JSONL 请求内容
+
+        Yields:
+            bytes: 每行一个结果的 JSONL，先输出已完成的历史结果，再按完成顺序输出新结果；
+                同一 job_id 的任务正在执行时只输出一行错误
+        """
+        if job_id in self._active_jobs:
+            error = {"error": f"批量任务 {job_id} 正在执行"}
+            yield (json.dumps(error, ensure_ascii=False) + "\n").encode("utf-8")
+            return
+        self._active_jobs.add(job_id)
+        try:
+            async with aclosing(self._run(job_id, payload)) as lines:
+                async for line in lines:
+                    yield line
+        finally:
+            self._active_jobs.discard(job_id)
+
+    async def _run(self, job_id: str, payload: bytes) -> AsyncGenerator[bytes, None]:
+        items = self.parse_items(payload)
+        path = self.job_path(job_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        finished = {
+            custom_id: record
+            for custom_id, record in (await asyncio.to_thread(self.load_results, job_id)).items()
+            if record.get("status") == "completed"
+        }
+        pending = [(cid, body) for cid, body in items if cid not in finished]
+        logger.info(
+            f"批量任务 {job_id}: 共 {len(items)} 条, 已完成 {len(items) - len(pending)} 条"
+        )
+
+        for custom_id, _ in items:
+            if custom_id in finished:
+                yield (json.dumps(finished[custom_id], ensure_ascii=False) + "\n").encode("utf-8")
+
+        # 固定数量的工作协程从共享迭代器中取条目，条目数再多也不会一次创建大量任务；
+        # 结果在完成时立即交给写入协程落盘，与客户端读取速度无关
+        pending_iter = iter(pending)
+        results: asyncio.Queue = asyncio.Queue()
+        lines: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(self._write_job_file(path, lines))
+
+        async def worker():
+            for custom_id, body in pending_iter:
+                line = self._encode(await self._run_item(custom_id, body))
+                lines.put_nowait(line)
+                await results.put(line.encode("utf-8"))
+
+        workers = [
+            asyncio.create_task(worker())
+            for _ in range(min(self.gate.concurrency, len(pending)))
+        ]
+        try:
+            for _ in range(len(pending)):
+                yield await results.get()
+        finally:
+            # 客户端断开时取消尚未完成的条目，已完成的结果保留在任务文件中
+            for task in workers:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            lines.put_nowait(None)
+            await writer
+
+
+def _append_line(job_file, line: str) -> None:
+    job_file.write(line)
+    job_file.flush()
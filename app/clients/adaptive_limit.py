@@ -0,0 +1,191 @@
+"""按上游地址自适应调整并发上限（AIMD）
+
+每个上游地址维护一个并发上限，请求在发起连接前申请名额，上游流结束后归还；
+超出上限的请求在本地按优先级排队，而不是发给会拒绝它们的上游。
+- 加性增加：上游正常返回首个 chunk 且 TTFT 没有明显上升时，上限增加
+  ADAPTIVE_LIMIT_INCREASE / 上限，即每轮满并发的请求大约增加 ADAPTIVE_LIMIT_INCREASE；
+  并发没有用到上限的一半时不增加，避免空闲时上限无限增长
+- 乘性减少：上游返回 429 / 529 / 5xx、首 token 停滞，或近期 TTFT（短期 EWMA）超过
+  长期基线的 ADAPTIVE_LIMIT_TTFT_TOLERANCE 倍时，上限乘以 ADAPTIVE_LIMIT_BACKOFF；
+  ADAPTIVE_LIMIT_COOLDOWN 秒内最多减少一次，一波集中的 429 只会减半一次
+- 上限限制在 [ADAPTIVE_LIMIT_MIN, ADAPTIVE_LIMIT_MAX] 之间，减少时已发出的请求不受影响
+
+当前上限导出为 upstream_concurrency_limit 指标，每次调整记录在最近 ADAPTIVE_LIMIT_HISTORY 条历史中，
+可通过管理接口 GET /admin/upstream-limits 查看。
+"""
+
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+from .scheduler import PRIORITIES, Lease, _SlotPool, upstream_scheduler
+
+# 是否启用自适应并发上限
+ADAPTIVE_LIMIT_ENABLED = os.getenv("ADAPTIVE_LIMIT_ENABLED", "false").lower() == "true"
+# 初始上限及上下限
+ADAPTIVE_LIMIT_INITIAL = float(os.getenv("ADAPTIVE_LIMIT_INITIAL", "16"))
+ADAPTIVE_LIMIT_MIN = float(os.getenv("ADAPTIVE_LIMIT_MIN", "1"))
+ADAPTIVE_LIMIT_MAX = float(os.getenv("ADAPTIVE_LIMIT_MAX", "256"))
+# 每轮满并发的请求增加的上限
+ADAPTIVE_LIMIT_INCREASE = float(os.getenv("ADAPTIVE_LIMIT_INCREASE", "1"))
+# 过载时上限乘以的系数
+ADAPTIVE_LIMIT_BACKOFF = float(os.getenv("ADAPTIVE_LIMIT_BACKOFF", "0.5"))
+# 近期 TTFT 超过基线的倍数时视为过载
+ADAPTIVE_LIMIT_TTFT_TOLERANCE = float(os.getenv("ADAPTIVE_LIMIT_TTFT_TOLERANCE", "2"))
+# 两次减少之间的最短间隔（秒）
+ADAPTIVE_LIMIT_COOLDOWN = float(os.getenv("ADAPTIVE_LIMIT_COOLDOWN", "2"))
+# 每个上游保留的调整历史条数
+ADAPTIVE_LIMIT_HISTORY = int(os.getenv("ADAPTIVE_LIMIT_HISTORY", "200"))
+
+# 视为过载的状态码（529 为 Anthropic 的 overloaded）
+OVERLOAD_STATUSES = frozenset({429, 529})
+# TTFT 短期和长期 EWMA 的系数，以及开始比较前需要的样本数
+_FAST_ALPHA = 0.3
+_SLOW_ALPHA = 0.02
+_MIN_TTFT_SAMPLES = 20
+
+
+def is_overload_status(status: int) -> bool:
+    return status in OVERLOAD_STATUSES or status >= 500
+
+
+class AdaptiveLimit:
+    """单个上游地址的 AIMD 并发上限"""
+
+    def __init__(
+        self,
+        upstream: str,
+        initial: float = ADAPTIVE_LIMIT_INITIAL,
+        minimum: float = ADAPTIVE_LIMIT_MIN,
+        maximum: float = ADAPTIVE_LIMIT_MAX,
+        increase: float = ADAPTIVE_LIMIT_INCREASE,
+        backoff: float = ADAPTIVE_LIMIT_BACKOFF,
+        tolerance: float = ADAPTIVE_LIMIT_TTFT_TOLERANCE,
+        cooldown: float = ADAPTIVE_LIMIT_COOLDOWN,
+        history: int = ADAPTIVE_LIMIT_HISTORY,
+    ):
+        self.upstream = upstream
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.limit = min(max(initial, minimum), maximum)
+        # 本地排队沿用调度器的优先级顺序
+        self.pool = _SlotPool(
+            {"upstream": upstream}, int(self.limit), upstream_scheduler.policy,
+            upstream_scheduler.weights, preempt=False, prefix="upstream_limit",
+        )
+        self.ttft_fast: Optional[float] = None
+        self.ttft_slow: Optional[float] = None
+        self.ttft_samples = 0
+        self._last_decrease = float("-inf")
+        # (时间戳, 调整后的上限, 原因)
+        self.history: Deque[Tuple[float, float, str]] = deque(maxlen=history)
+        self.history.append((time.time(), self.limit, "initial"))
+
+    @property
+    def inflight(self) -> int:
+        return len(self.pool.holders)
+
+    async def acquire(self) -> Lease:
+        return await self.pool.lease()
+
+    def _set(self, limit: float, reason: str) -> None:
+        limit = min(max(limit, self.minimum), self.maximum)
+        previous = int(self.limit)
+        self.limit = limit
+        if int(limit) != previous:
+            self.history.append((time.time(), limit, reason))
+            self.pool.resize(int(limit))
+
+    def on_first_token(self, ttft: float) -> None:
+        """上游返回首个 chunk：TTFT 明显上升时减少，否则加性增加"""
+        if self.ttft_slow is None:
+            self.ttft_fast = self.ttft_slow = ttft
+        else:
+            self.ttft_fast += _FAST_ALPHA * (ttft - self.ttft_fast)
+            self.ttft_slow += _SLOW_ALPHA * (ttft - self.ttft_slow)
+        self.ttft_samples += 1
+        if (
+            self.ttft_samples >= _MIN_TTFT_SAMPLES
+            and self.ttft_fast > self.ttft_slow * self.tolerance
+        ):
+            self.on_overload("ttft")
+            # 重新积累证据，持续偏高时下一个冷却期后再减少
+            self.ttft_fast = self.ttft_slow
+            return
+        # 并发没有用到上限的一半时，上游是否还能承受更多并发无从得知
+        if self.inflight * 2 >= self.limit:
+            self._set(self.limit + self.increase / self.limit, "increase")
+
+    def on_overload(self, reason: str) -> None:
+        """上游过载，冷却期内只减少一次"""
+        now = time.monotonic()
+        metrics.inc("upstream_overload_signals_total", upstream=self.upstream, reason=reason)
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._set(self.limit * self.backoff, reason)
+        metrics.inc("upstream_limit_decreases_total", upstream=self.upstream, reason=reason)
+        logger.warning(
+            f"上游 {self.upstream} 过载（{reason}），并发上限降为 {int(self.limit)}"
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": {name: self.pool.waiting_count(name) for name in PRIORITIES},
+            "ttft_recent": self.ttft_fast,
+            "ttft_baseline": self.ttft_slow,
+            "history": [
+                {"time": ts, "limit": round(limit, 2), "reason": reason}
+                for ts, limit, reason in self.history
+            ],
+        }
+
+
+class AdaptiveLimits:
+    """各上游地址的自适应并发上限"""
+
+    def __init__(self, enabled: bool = ADAPTIVE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.limits: Dict[str, AdaptiveLimit] = {}
+
+    def get(self, upstream: str) -> Optional[AdaptiveLimit]:
+        """上游地址对应的上限，未启用时返回 None"""
+        if not self.enabled:
+            return None
+        limit = self.limits.get(upstream)
+        if limit is None:
+            limit = self.limits[upstream] = AdaptiveLimit(upstream)
+        return limit
+
+    def oldest_wait(self, upstream: str) -> float:
+        """在该上游的上限前排队最久的请求已等待的时间（秒）"""
+        limit = self.limits.get(upstream)
+        return 0.0 if limit is None else limit.pool.oldest_wait()
+
+    def snapshot(self) -> dict:
+        return {upstream: limit.snapshot() for upstream, limit in self.limits.items()}
+
+
+adaptive_limits = AdaptiveLimits()
+
+
+def _collect_limit_metrics():
+    for upstream, limit in adaptive_limits.limits.items():
+        labels = {"upstream": upstream}
+        yield "upstream_concurrency_limit", labels, limit.limit
+        yield "upstream_concurrency_inflight", labels, limit.inflight
+        for priority in PRIORITIES:
+            yield "upstream_limit_waiting", {**labels, "priority": priority}, limit.pool.waiting_count(priority)
+
+
+metrics.register_collector(_collect_limit_metrics)
@@ -1,14 +1,30 @@
 """基础客户端类,定义通用接口"""
 
+import os
 from abc import ABC, abstractmethod
-from typing import AsyncGenerator, Optional
+from contextlib import aclosing
+from typing import AsyncGenerator, Optional, Sequence
 
 import aiohttp
-from aiohttp.client_exceptions import ClientError, ServerTimeoutError
+from aiohttp.client_exceptions import ClientConnectionError, ClientError, ServerTimeoutError
 
 import asyncio
 
+from app.utils.event_loop import OFFLOAD_JSON_BYTES, messages_size, run_cpu
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.prompt_prefix import encode_body
+from app.utils.tracing import current_trace
+
+from .adaptive_limit import adaptive_limits, is_overload_status
+from .circuit_breaker import CircuitOpenError, circuit_breakers
+from .deadline import DeadlineExceededError, capped_timeout, current_deadline, wait_until
+from .scheduler import upstream_scheduler
+from .stall import StreamStalledError, latency_tracker
+from .transports import Transport, UpstreamStatusError, get_transport
+
+# 上游在发送首个 token 前停滞或连接失败时的重试次数，依次使用 fallback_urls 中的地址
+STALL_RETRIES = int(os.getenv("STALL_RETRIES", "1"))
 
 
 class BaseClient(ABC):
@@ -21,11 +37,16 @@ class BaseClient(ABC):
     # TODO: 默认时间的设置涉及到模型推理速度，需要根据实际情况进行调整
     DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=600, connect=10, sock_read=500)
 
+    # 请求追踪中对应的阶段名，None 表示不记录
+    trace_stage: Optional[str] = None
+
     def __init__(
         self,
         api_key: str,
         api_url: str,
         timeout: Optional[aiohttp.ClientTimeout] = None,
+        transport: Optional[Transport] = None,
+        fallback_urls: Sequence[str] = (),
     ):
         """初始化基础客户端
 
@@ -33,10 +54,14 @@ class BaseClient(ABC):
             api_key: API密钥
             api_url: API地址
             timeout: 请求超时设置,None则使用默认值
+            transport: 上游传输,None则使用共享的 aiohttp 传输
+            fallback_urls: 上游停滞或连接失败时依次尝试的备用地址（需与 api_url 使用相同的接口格式）
         """
         self.api_key = api_key
         self.api_url = api_url
+        self.fallback_urls = list(fallback_urls)
         self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self.transport = transport or get_transport()
 
     async def _make_request(
         self, headers: dict, data: dict, timeout: Optional[aiohttp.ClientTimeout] = None,
@@ -55,32 +80,180 @@ class BaseClient(ABC):
 
         Raises:
             aiohttp.ClientError: Client error
+            StreamStalledError: No first token or next chunk within the learned timeout
+                after data was received or all retries were used
+            DeadlineExceededError: The deadline in current_deadline passed while queueing
+                or waiting for upstream data
+            CircuitOpenError: The circuit breaker of every endpoint tried is open
             ServerTimeoutError: Server timeout
             Exception: Other exceptions
         """
         request_timeout = timeout or self.timeout
+        stage = self.trace_stage or type(self).__name__
+        # Deadline of the pipeline stage this request belongs to (loop time)
+        request_deadline = current_deadline.get()
+        if request_deadline is not None and asyncio.get_running_loop().time() >= request_deadline:
+            raise DeadlineExceededError(stage)
+
+        # Record stage timings and propagate the trace id upstream
+        trace = current_trace.get() if self.trace_stage else None
+        on_connect = None
+        if trace is not None:
+            trace.start_span(stage)
+            headers = {**headers, "traceparent": trace.traceparent()}
+            on_connect = lambda: trace.event(f"{stage}_connect")  # noqa: E731
+
+        # Non-streaming responses arrive in one piece, only the transport timeouts apply
+        detect_stalls = data.get("stream", True) is not False
+        # Every request body uses the same encoding so upstream prefix caches see identical
+        # bytes; large histories are encoded in the CPU executor. The bytes are reused across retries
+        size = messages_size(data.get("messages"))
+        if OFFLOAD_JSON_BYTES and size >= OFFLOAD_JSON_BYTES:
+            data = await run_cpu("json_encode", size, OFFLOAD_JSON_BYTES, encode_body, data)
+        else:
+            data = encode_body(data)
+        endpoints = [self.api_url, *self.fallback_urls]
+        attempts = STALL_RETRIES + 1
+        loop = asyncio.get_running_loop()
+        stage_started = loop.time()
+        lease = None
 
         try:
-            connector = aiohttp.TCPConnector(limit=100, force_close=True)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.post(
-                    self.api_url, headers=headers, json=data, timeout=request_timeout
-                ) as response:
-                    # Check response status
-                    if not response.ok:
-                        error_text = await response.text()
-                        error_msg = f"API request failed: Status code {response.status}, Error: {error_text}"
-                        logger.error(error_msg)
-                        raise ClientError(error_msg)
-
-                    # Stream response content with cancellation check
-                    async for chunk in response.content.iter_any():
-                        if cancel_event and cancel_event.is_set():
-                            logger.info("Request cancelled, stopping stream")
-                            break
-                            
-                        if chunk:  # Filter empty chunks
+            # Wait for an upstream slot by priority; queueing time is not part of the TTFT budget
+            lease = await wait_until(request_deadline, upstream_scheduler.acquire(stage), stage)
+            attempt = 0
+            while attempt < attempts:
+                url = endpoints[attempt % len(endpoints)]
+                # Fail fast (or move on to the next endpoint) while this upstream's breaker is open
+                breaker = circuit_breakers.get(url)
+                if breaker is not None and not breaker.allow():
+                    metrics.inc("upstream_circuit_rejections_total", upstream=url, stage=stage)
+                    if attempt + 1 >= attempts:
+                        raise CircuitOpenError(url)
+                    attempt += 1
+                    continue
+                limit = adaptive_limits.get(url)
+                permit = None
+                last_data = None
+
+                try:
+                    # Queue locally while the adaptive limit for this upstream is reached
+                    if limit is not None:
+                        permit = await wait_until(request_deadline, limit.acquire(), stage)
+                    started = loop.time()
+                    deadline = None
+                    if detect_stalls:
+                        deadline = started + latency_tracker.timeout("ttft", url, stage)
+                    attempt_timeout = request_timeout
+                    if request_deadline is not None:
+                        attempt_timeout = capped_timeout(request_timeout, request_deadline - started)
+
+                    # Stream response content with cancellation check; aclosing returns
+                    # the pooled connection as soon as the caller stops reading
+                    async with aclosing(
+                        self.transport.stream(url, headers, data, attempt_timeout, on_connect)
+                    ) as chunks:
+                        while True:
+                            # Only the wait for upstream data is timed, never the caller
+                            capped = request_deadline is not None and (
+                                deadline is None or request_deadline <= deadline
+                            )
+                            try:
+                                async with asyncio.timeout_at(request_deadline if capped else deadline):
+                                    chunk = await anext(chunks)
+                            except StopAsyncIteration:
+                                break
+                            except TimeoutError:
+                                if capped:
+                                    raise DeadlineExceededError(stage) from None
+                                kind = "ttft" if last_data is None else "gap"
+                                metrics.inc(
+                                    "upstream_stalls_total", upstream=url, stage=stage, kind=kind
+                                )
+                                raise StreamStalledError(
+                                    url, stage, kind, deadline - (last_data or started)
+                                )
+
+                            if cancel_event and cancel_event.is_set():
+                                logger.info("Request cancelled, stopping stream")
+                                break
+
+                            if not chunk:  # Filter empty chunks
+                                continue
+
+                            # Keep-alives (SSE comments, Anthropic pings) do not count as data
+                            if not chunk.startswith((b":", b"event: ping")):
+                                now = loop.time()
+                                # Buffered data is returned without waiting, check the deadline explicitly
+                                if request_deadline is not None and now >= request_deadline:
+                                    raise DeadlineExceededError(stage)
+                                if last_data is None:
+                                    latency_tracker.observe("ttft", url, stage, now - started)
+                                    if limit is not None:
+                                        limit.on_first_token(now - started)
+                                    if breaker is not None:
+                                        breaker.on_success()
+                                        breaker = None
+                                    if trace is not None:
+                                        trace.event(f"{stage}_first_token")
+                                else:
+                                    latency_tracker.observe("gap", url, stage, now - last_data)
+                                last_data = now
+                                if detect_stalls:
+                                    deadline = now + latency_tracker.timeout("gap", url, stage)
+                            if lease is not None and not lease.started:
+                                # Once the caller has seen data the slot can no longer be preempted
+                                lease.mark_started()
                             yield chunk
+                    return
+
+                except asyncio.CancelledError:
+                    if lease is None or not lease.take_preemption():
+                        raise
+                    # A higher priority request took the slot before any data was passed on;
+                    # queue again and restart the same attempt
+                    await lease.reacquire()
+                    continue
+
+                except UpstreamStatusError as e:
+                    if is_overload_status(e.status):
+                        if limit is not None:
+                            limit.on_overload(str(e.status))
+                        if breaker is not None:
+                            breaker.on_failure(str(e.status))
+                            breaker = None
+                    elif breaker is not None:
+                        # The upstream answered; a rejected request says nothing about its health
+                        breaker.on_success()
+                        breaker = None
+                    raise
+
+                except (StreamStalledError, ClientConnectionError) as e:
+                    if limit is not None and isinstance(e, StreamStalledError) and e.kind == "ttft":
+                        limit.on_overload("stall")
+                    if breaker is not None:
+                        breaker.on_failure("stall" if isinstance(e, StreamStalledError) else "connect")
+                        breaker = None
+                    # Retry or fail over only while no data has been passed on
+                    if last_data is not None or attempt + 1 >= attempts:
+                        raise
+                    next_url = endpoints[(attempt + 1) % len(endpoints)]
+                    logger.warning(
+                        f"{stage} upstream failed before first token ({e}), retrying with {next_url}"
+                    )
+                    metrics.inc("upstream_retries_total", upstream=url, stage=stage)
+                    attempt += 1
+
+                finally:
+                    if permit is not None:
+                        permit.release()
+                    if breaker is not None:
+                        # Cancelled before the upstream answered (or a half-open probe was preempted)
+                        breaker.on_abandon()
+
+        except DeadlineExceededError:
+            # Expected outcome for the caller, logged by the pipeline
+            raise
 
         except ServerTimeoutError as e:
             error_msg = f"Request timeout: {str(e)}"
@@ -97,6 +270,14 @@ class BaseClient(ABC):
             logger.error(error_msg)
             raise
 
+        finally:
+            if lease is not None:
+                lease.release()
+            if trace is not None:
+                trace.end_span(stage)
+            if self.trace_stage:
+                metrics.observe("upstream_stage_seconds", loop.time() - stage_started, stage=stage)
+
     @abstractmethod
     async def stream_chat(
         self, messages: list, model: str
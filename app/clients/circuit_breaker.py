@@ -0,0 +1,139 @@
+"""按上游地址的熔断器
+
+上游连续失败（429 / 529 / 5xx、连接失败、首 token 停滞）达到 CIRCUIT_BREAKER_FAILURES 次后熔断，
+CIRCUIT_BREAKER_COOLDOWN 秒内发往该地址的请求直接失败（有备用地址时改用备用地址），
+不再等待一个大概率失败的上游。冷却结束后放行一个探测请求（半开）：
+探测请求收到首个 chunk 则恢复，否则重新熔断。
+
+流水线可以在熔断时改用配置的降级流水线（见 app/pipeline/fallback.py）。
+当前状态导出为 circuit_breaker_state 指标（0 正常，1 熔断，2 半开）。
+"""
+
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+# 是否启用熔断
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "false").lower() == "true"
+# 连续失败多少次后熔断
+CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))
+# 熔断持续时间（秒），之后放行一个探测请求
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """上游地址处于熔断状态"""
+
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        super().__init__(f"上游 {upstream} 处于熔断状态")
+
+
+class CircuitBreaker:
+    """单个上游地址的熔断器"""
+
+    def __init__(
+        self,
+        upstream: str,
+        failures: int = CIRCUIT_BREAKER_FAILURES,
+        cooldown: float = CIRCUIT_BREAKER_COOLDOWN,
+    ):
+        self.upstream = upstream
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # 半开状态下是否已有探测请求
+        self.probing = False
+
+    def _transition(self, state: str, reason: str) -> None:
+        self.state = state
+        metrics.inc("circuit_breaker_transitions_total", upstream=self.upstream, state=state)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            logger.warning(f"上游 {self.upstream} 熔断（{reason}），{self.cooldown:.0f} 秒后探测")
+        else:
+            logger.info(f"上游 {self.upstream} 熔断状态变为 {state}")
+
+    def available(self) -> bool:
+        """是否可以发起请求，不改变状态"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.probing
+
+    def allow(self) -> bool:
+        """发起请求前调用，冷却结束后第一个调用的请求成为探测请求"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self._transition(HALF_OPEN, "cooldown")
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def on_success(self) -> None:
+        """上游返回了首个 chunk"""
+        self.failures = 0
+        self.probing = False
+        if self.state != CLOSED:
+            self._transition(CLOSED, "probe")
+
+    def on_failure(self, reason: str) -> None:
+        self.failures += 1
+        self.probing = False
+        metrics.inc("circuit_breaker_failures_total", upstream=self.upstream, reason=reason)
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+            self._transition(OPEN, reason)
+
+    def on_abandon(self) -> None:
+        """请求在有结果之前被取消，半开状态下允许下一个请求探测"""
+        self.probing = False
+
+
+class CircuitBreakers:
+    """各上游地址的熔断器"""
+
+    def __init__(self, enabled: bool = CIRCUIT_BREAKER_ENABLED):
+        self.enabled = enabled
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, upstream: str) -> Optional[CircuitBreaker]:
+        """上游地址对应的熔断器，未启用时返回 None"""
+        if not self.enabled:
+            return None
+        breaker = self.breakers.get(upstream)
+        if breaker is None:
+            breaker = self.breakers[upstream] = CircuitBreaker(upstream)
+        return breaker
+
+    def available(self, upstreams: Iterable[str]) -> bool:
+        """是否至少有一个地址可以发起请求"""
+        if not self.enabled:
+            return True
+        return any(
+            upstream not in self.breakers or self.breakers[upstream].available()
+            for upstream in upstreams
+        )
+
+
+circuit_breakers = CircuitBreakers()
+
+
+def _collect_breaker_metrics():
+    for upstream, breaker in circuit_breakers.breakers.items():
+        yield "circuit_breaker_state", {"upstream": upstream}, _STATE_VALUES[breaker.state]
+
+
+metrics.register_collector(_collect_breaker_metrics)
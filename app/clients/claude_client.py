@@ -1,34 +1,50 @@
 """Claude API 客户端"""
 
 import json
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional, Sequence
 
+from app.utils.chat_request import SamplingParams
 from app.utils.logger import logger
+from app.utils.prompt_prefix import (
+    ANTHROPIC_PROMPT_CACHE,
+    UPSTREAM_STREAM_USAGE,
+    mark_cache_breakpoints,
+    record_cache_usage,
+)
 
 from .base_client import BaseClient
+from .transports import Transport
 
 
 class ClaudeClient(BaseClient):
+    trace_stage = "answer"
+
     def __init__(
         self,
         api_key: str,
         api_url: str = "https://api.anthropic.com/v1/messages",
         provider: str = "anthropic",
+        transport: Optional[Transport] = None,
+        fallback_urls: Sequence[str] = (),
     ):
         """初始化 Claude 客户端
 
         Args:
             api_key: Claude API密钥
             api_url: Claude API地址
-            is_openrouter: 是否使用 OpenRouter API
+            provider: Claude 提供商, anthropic / openrouter / oneapi
+            transport: 上游传输,None则使用共享的 aiohttp 传输
+            fallback_urls: 上游停滞或连接失败时依次尝试的备用地址
         """
-        super().__init__(api_key, api_url)
+        super().__init__(
+            api_key, api_url, transport=transport, fallback_urls=fallback_urls
+        )
         self.provider = provider
 
     async def stream_chat(
         self,
         messages: list,
-        model_arg: tuple[float, float, float, float],
+        params: SamplingParams,
         model: str,
         stream: bool = True,
         system_prompt: str = None,
@@ -37,15 +53,15 @@ class ClaudeClient(BaseClient):
 
         Args:
             messages: 消息列表
-            model_arg: 模型参数元组[temperature, top_p, presence_penalty, frequency_penalty]
+            params: 采样参数
             model: 模型名称。如果是 OpenRouter, 会自动转换为 'anthropic/claude-3.5-sonnet' 格式
             stream: 是否使用流式输出，默认为 True
             system_prompt: 系统提示
 
         Yields:
             tuple[str, str]: (内容类型, 内容)
-                内容类型: "answer"
-                内容: 实际的文本内容
+                内容类型: "answer" 或 "usage"
+                内容: 实际的文本内容；"usage" 时为上游报告的 CacheUsage
         """
 
         if self.provider == "openrouter":
@@ -59,21 +75,23 @@ class ClaudeClient(BaseClient):
                 "X-Title": "DeepClaude",  # OpenRouter 需要
             }
 
-            # 传递 OpenRouterOneAPI system prompt
+            # 传递 OpenRouterOneAPI system prompt（不修改调用方的消息列表，重试时不会重复插入）
             if system_prompt:
-                messages.insert(0, {"role": "system", "content": system_prompt})
+                messages = [{"role": "system", "content": system_prompt}, *messages]
 
             data = {
                 "model": model,  # OpenRouter 使用 anthropic/claude-3.5-sonnet 格式
                 "messages": messages,
                 "stream": stream,
                 "temperature": 1
-                if model_arg[0] < 0 or model_arg[0] > 1
-                else model_arg[0],
-                "top_p": model_arg[1],
-                "presence_penalty": model_arg[2],
-                "frequency_penalty": model_arg[3],
+                if params.temperature < 0 or params.temperature > 1
+                else params.temperature,
+                "top_p": params.top_p,
+                "presence_penalty": params.presence_penalty,
+                "frequency_penalty": params.frequency_penalty,
             }
+            if stream and UPSTREAM_STREAM_USAGE:
+                data["stream_options"] = {"include_usage": True}
             
         elif self.provider == "oneapi":
             headers = {
@@ -81,21 +99,23 @@ class ClaudeClient(BaseClient):
                 "Content-Type": "application/json",
             }
 
-            # 传递 OneAPI system prompt
+            # 传递 OneAPI system prompt（不修改调用方的消息列表，重试时不会重复插入）
             if system_prompt:
-                messages.insert(0, {"role": "system", "content": system_prompt})
+                messages = [{"role": "system", "content": system_prompt}, *messages]
 
             data = {
                 "model": model,
                 "messages": messages,
                 "stream": stream,
                 "temperature": 1
-                if model_arg[0] < 0 or model_arg[0] > 1
-                else model_arg[0],
-                "top_p": model_arg[1],
-                "presence_penalty": model_arg[2],
-                "frequency_penalty": model_arg[3],
+                if params.temperature < 0 or params.temperature > 1
+                else params.temperature,
+                "top_p": params.top_p,
+                "presence_penalty": params.presence_penalty,
+                "frequency_penalty": params.frequency_penalty,
             }
+            if stream and UPSTREAM_STREAM_USAGE:
+                data["stream_options"] = {"include_usage": True}
                 
         elif self.provider == "anthropic":
             headers = {
@@ -111,18 +131,20 @@ class ClaudeClient(BaseClient):
                 "max_tokens": 8192,
                 "stream": stream,
                 "temperature": 1
-                if model_arg[0] < 0 or model_arg[0] > 1
-                else model_arg[0],  # Claude仅支持temperature与top_p
-                "top_p": model_arg[1],
+                if params.temperature < 0 or params.temperature > 1
+                else params.temperature,  # Claude仅支持temperature与top_p
+                "top_p": params.top_p,
             }
             
             # Anthropic 原生 API 支持 system 参数
             if system_prompt:
                 data["system"] = system_prompt
+            if ANTHROPIC_PROMPT_CACHE:
+                data = mark_cache_breakpoints(data)
         else:
             raise ValueError(f"不支持的Claude Provider: {self.provider}")
 
-        logger.debug(f"开始对话：{data}")
+        logger.debug("开始对话：%s", data)
 
         if stream:
             async for chunk in self._make_request(headers, data):
@@ -138,10 +160,22 @@ class ClaudeClient(BaseClient):
 
                         try:
                             data = json.loads(json_str)
+                            # 输入 token 用量（含缓存命中）：Anthropic 在 message_start 中，
+                            # OpenAI 格式在最后一个 chunk 中
+                            usage = data.get("usage") or (
+                                data.get("message", {}).get("usage")
+                                if data.get("type") == "message_start"
+                                else None
+                            )
+                            if usage and data.get("type") != "message_delta":
+                                usage = record_cache_usage(self.trace_stage, model, usage)
+                                if usage is not None:
+                                    yield "usage", usage
                             if self.provider in ("openrouter", "oneapi"):
                                 # OpenRouter/OneApi 格式
+                                # 最后的 usage chunk 中 choices 为空列表
                                 content = (
-                                    data.get("choices", [{}])[0]
+                                    (data.get("choices") or [{}])[0]
                                     .get("delta", {})
                                     .get("content", "")
                                 )
@@ -164,6 +198,9 @@ class ClaudeClient(BaseClient):
             async for chunk in self._make_request(headers, data):
                 try:
                     response = json.loads(chunk.decode("utf-8"))
+                    usage = record_cache_usage(self.trace_stage, model, response.get("usage"))
+                    if usage is not None:
+                        yield "usage", usage
                     if self.provider in ("openrouter", "oneapi"):
                         content = (
                             response.get("choices", [{}])[0]
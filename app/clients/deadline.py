@@ -0,0 +1,127 @@
+"""请求截止时间
+
+客户端可以通过 X-Request-Timeout 请求头或请求体的 timeout 字段（秒，从收到请求开始计算）
+指定截止时间，都指定时取较短者；都未指定时使用 REQUEST_DEADLINE_DEFAULT（0 表示不限制），
+超过 REQUEST_DEADLINE_MAX 的值按其截断。
+
+流水线把截止时间分给各阶段：最终回答之前的阶段共用前 DEADLINE_REASONING_SHARE 的时间
+（可在 models.yaml 中按流水线用 reasoning_share 覆盖），份额用完时保留已收到的推理内容，
+回答阶段照常开始；回答阶段使用剩余的全部时间，到达截止时间时结束请求。
+
+当前阶段的截止时间保存在 current_deadline 中（事件循环时间），上游客户端据此限制名额排队、
+等待上游数据的时间以及上游请求的超时设置，到达时抛出 DeadlineExceededError 并断开上游连接。
+"""
+
+import asyncio
+import math
+import os
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+import aiohttp
+
+# 未指定截止时间的请求使用的秒数，0 表示不限制
+REQUEST_DEADLINE_DEFAULT = float(os.getenv("REQUEST_DEADLINE_DEFAULT", "0"))
+# 截止时间的上限（秒），0 表示不限制
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", "0"))
+# 最终回答之前的阶段占用的时间比例
+DEADLINE_REASONING_SHARE = float(os.getenv("DEADLINE_REASONING_SHARE", "0.5"))
+# 上游请求的超时比剩余时间多出的秒数，保证由截止时间本身先触发
+DEADLINE_GRACE = 1.0
+
+# 当前阶段的截止时间（事件循环时间），None 表示不限制
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+T = TypeVar("T")
+
+
+class DeadlineExceededError(Exception):
+    """请求到达截止时间"""
+
+    def __init__(self, stage: Optional[str] = None):
+        self.stage = stage
+        where = f"{stage} 阶段" if stage else "请求"
+        super().__init__(f"{where}已超过截止时间")
+
+
+def deadline_exceeded(error: Optional[BaseException]) -> bool:
+    """错误是否由截止时间引起，客户端可能把它包装为其他异常"""
+    while error is not None:
+        if isinstance(error, DeadlineExceededError):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _seconds(value, name: str) -> float:
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        seconds = math.nan
+    if not (math.isfinite(seconds) and seconds > 0):
+        raise ValueError(f"{name} 必须是大于 0 的秒数")
+    return seconds
+
+
+def resolve_deadline(
+    header: Optional[str], timeout: Optional[float], start: Optional[float] = None
+) -> Optional[float]:
+    """请求的截止时间（事件循环时间），不限制时返回 None
+
+    Args:
+        header: X-Request-Timeout 请求头
+        timeout: 请求体中的 timeout 字段
+        start: 收到请求的时间，None 表示当前时间
+
+    Raises:
+        ValueError: 请求头或 timeout 不是大于 0 的秒数
+    """
+    limits = []
+    if header:
+        limits.append(_seconds(header, "X-Request-Timeout"))
+    if timeout is not None:
+        limits.append(_seconds(timeout, "timeout"))
+    seconds = min(limits) if limits else REQUEST_DEADLINE_DEFAULT
+    if REQUEST_DEADLINE_MAX > 0:
+        seconds = min(seconds, REQUEST_DEADLINE_MAX) if seconds > 0 else REQUEST_DEADLINE_MAX
+    if seconds <= 0:
+        return None
+    if start is None:
+        start = asyncio.get_running_loop().time()
+    return start + seconds
+
+
+def split_deadline(deadline: Optional[float], share: float) -> Optional[float]:
+    """最终回答之前的阶段的截止时间：剩余时间的 share 部分"""
+    if deadline is None:
+        return None
+    now = asyncio.get_running_loop().time()
+    return now + max(deadline - now, 0.0) * share
+
+
+def capped_timeout(timeout: aiohttp.ClientTimeout, remaining: float) -> aiohttp.ClientTimeout:
+    """上游请求的超时设置不超过剩余时间"""
+    limit = max(remaining, 0.0) + DEADLINE_GRACE
+
+    def cap(value: Optional[float]) -> float:
+        return limit if value is None else min(value, limit)
+
+    return aiohttp.ClientTimeout(
+        total=cap(timeout.total),
+        connect=cap(timeout.connect),
+        sock_read=cap(timeout.sock_read),
+        sock_connect=cap(timeout.sock_connect),
+    )
+
+
+async def wait_until(deadline: Optional[float], awaitable: Awaitable[T], stage: str) -> T:
+    """等待 awaitable，到达截止时间时取消并抛出 DeadlineExceededError"""
+    if deadline is None:
+        return await awaitable
+    try:
+        async with asyncio.timeout_at(deadline) as timeout:
+            return await awaitable
+    except TimeoutError:
+        if timeout.expired():
+            raise DeadlineExceededError(stage) from None
+        raise
@@ -1,66 +1,110 @@
 """DeepSeek API 客户端"""
 
 import json
-from typing import AsyncGenerator
+import re
+from json.decoder import scanstring
+from typing import AsyncGenerator, Optional, Sequence
 
 from app.utils.logger import logger
+from app.utils.prompt_prefix import record_cache_usage
 
 from .base_client import BaseClient
+from .think_tag_parser import ThinkTagParser
+from .transports import Transport
+
+_REASONING_KEY = b'"reasoning_content":'
+_CHOICES_KEY = b'"choices":'
+# 字符串中的引号均已转义，因此匹配到的一定是真正的键
+_REPLACED_KEYS = re.compile(rb'"(?:id|created|model)"\s*:')
+
+
+def reasoning_frame(payload: bytes, head: bytes) -> Optional[tuple[bytes, str]]:
+    """不解析 JSON，直接把原生推理 chunk 转换为输出 chunk
+
+    只查找 "reasoning_content" 的字符串值，并把上游的 "choices" 及之后的字节原样拼接在
+    head（本服务的 id / object / created / model）之后。上游的 id / created / model
+    位于 "choices" 之后时会与 head 重复，此时不走直通。
+
+    Args:
+        payload: 上游 data: 之后的 JSON 字节
+        head: 以 'data: {' 开头、以逗号和空格结尾的 chunk 头部
+
+    Returns:
+        (输出 chunk, 推理文本)；不是非空推理内容或格式不符合预期时返回 None，
+        由调用方按普通方式解析
+    """
+    start = payload.find(_REASONING_KEY)
+    if start < 0:
+        return None
+    begin = start + len(_REASONING_KEY)
+    while payload[begin : begin + 1] == b" ":
+        begin += 1
+    if payload[begin : begin + 1] != b'"':
+        return None  # null：推理阶段已结束
+
+    choices = payload.find(_CHOICES_KEY)
+    if choices < 0 or _REPLACED_KEYS.search(payload, choices):
+        return None
+    # 从开始引号之后解码字符串，scanstring 处理转义并在结束引号处停止
+    try:
+        text = scanstring(payload[begin + 1 :].decode("utf-8"), 0)[0]
+    except ValueError:
+        return None
+    if not text:
+        return None
+    return head + payload[choices:] + b"\n\n", text
 
 
 class DeepSeekClient(BaseClient):
+    trace_stage = "reasoning"
+
     def __init__(
         self,
         api_key: str,
         api_url: str = "https://api.siliconflow.cn/v1/chat/completions",
+        think_tags: tuple[str, str] = ("<think>", "</think>"),
+        think_implicit_open: bool = False,
+        transport: Optional[Transport] = None,
+        fallback_urls: Sequence[str] = (),
     ):
         """初始化 DeepSeek 客户端
 
         Args:
             api_key: DeepSeek API密钥
             api_url: DeepSeek API地址
+            think_tags: 非原生推理模型的 (开始标签, 结束标签)
+            think_implicit_open: 非原生推理模型是否省略开始标签
+            transport: 上游传输,None则使用共享的 aiohttp 传输
+            fallback_urls: 上游停滞或连接失败时依次尝试的备用地址
         """
-        super().__init__(api_key, api_url)
-
-    def _process_think_tag_content(self, content: str) -> tuple[bool, str]:
-        """处理包含 think 标签的内容
-
-        Args:
-            content: 需要处理的内容字符串
-
-        Returns:
-            tuple[bool, str]:
-                bool: 是否检测到完整的 think 标签对
-                str: 处理后的内容
-        """
-        has_start = "<think>" in content
-        has_end = "</think>" in content
-
-        if has_start and has_end:
-            return True, content
-        elif has_start:
-            return False, content
-        elif not has_start and not has_end:
-            return False, content
-        else:
-            return True, content
+        super().__init__(
+            api_key, api_url, transport=transport, fallback_urls=fallback_urls
+        )
+        self.think_tags = think_tags
+        self.think_implicit_open = think_implicit_open
 
     async def stream_chat(
         self,
         messages: list,
         model: str = "deepseek-ai/DeepSeek-R1",
         is_origin_reasoning: bool = True,
-    ) -> AsyncGenerator[tuple[str, str], None]:
+        frame_head: Optional[bytes] = None,
+    ) -> AsyncGenerator[tuple, None]:
         """流式对话
 
         Args:
             messages: 消息列表
             model: 模型名称
+            is_origin_reasoning: 是否通过 reasoning_content 字段返回推理内容，
+                为 False 时从 content 中按推理标签解析
+            frame_head: 推理 chunk 直通模式的 chunk 头部（见 reasoning_frame），
+                仅对原生推理格式生效
 
         Yields:
-            tuple[str, str]: (内容类型, 内容)
-                内容类型: "reasoning" 或 "content"
-                内容: 实际的文本内容
+            tuple: (内容类型, 内容)
+                内容类型: "reasoning"、"content"、"reasoning_frame" 或 "usage"
+                内容: 实际的文本内容；"reasoning_frame" 时为 (输出 chunk, 推理文本)，
+                    "usage" 时为上游报告的 CacheUsage
         """
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -73,84 +117,76 @@ class DeepSeekClient(BaseClient):
             "stream": True,
         }
 
-        logger.debug(f"开始流式对话：{data}")
+        logger.debug("开始流式对话：%s", data)
 
-        accumulated_content = ""
-        is_collecting_think = False
+        think_parser = None
+        if not is_origin_reasoning:
+            frame_head = None
+            think_parser = ThinkTagParser(
+                *self.think_tags, implicit_open=self.think_implicit_open
+            )
 
+        # 按行缓存，SSE 行（以及其中的多字节字符）可能被拆分到多个网络 chunk 中
+        buffer = b""
         async for chunk in self._make_request(headers, data):
-            chunk_str = chunk.decode("utf-8")
-
-            try:
-                lines = chunk_str.splitlines()
-                for line in lines:
-                    if line.startswith("data: "):
-                        json_str = line[len("data: ") :]
-                        if json_str == "[DONE]":
-                            return
-
-                        data = json.loads(json_str)
-                        if (
-                            data
-                            and data.get("choices")
-                            and data["choices"][0].get("delta")
-                        ):
-                            delta = data["choices"][0]["delta"]
-
-                            if is_origin_reasoning:
-                                # 处理 reasoning_content
-                                if delta.get("reasoning_content"):
-                                    content = delta["reasoning_content"]
-                                    logger.debug(f"提取推理内容：{content}")
-                                    yield "reasoning", content
-
-                                if delta.get("reasoning_content") is None and delta.get(
-                                    "content"
-                                ):
-                                    content = delta["content"]
-                                    logger.info(
-                                        f"提取内容信息，推理阶段结束: {content}"
-                                    )
-                                    yield "content", content
-                            else:
-                                # 处理其他模型的输出
-                                if delta.get("content"):
-                                    content = delta["content"]
-                                    if content == "":  # 只跳过完全空的字符串
-                                        continue
-                                    logger.debug(f"非原生推理内容：{content}")
-                                    accumulated_content += content
-
-                                    # 检查累积的内容是否包含完整的 think 标签对
-                                    is_complete, processed_content = (
-                                        self._process_think_tag_content(
-                                            accumulated_content
-                                        )
-                                    )
-
-                                    if "<think>" in content and not is_collecting_think:
-                                        # 开始收集推理内容
-                                        logger.debug(f"开始收集推理内容：{content}")
-                                        is_collecting_think = True
-                                        yield "reasoning", content
-                                    elif is_collecting_think:
-                                        if "</think>" in content:
-                                            # 推理内容结束
-                                            logger.debug(f"推理内容结束：{content}")
-                                            is_collecting_think = False
-                                            yield "reasoning", content
-                                            # 输出空的 content 来触发 Claude 处理
-                                            yield "content", ""
-                                            # 重置累积内容
-                                            accumulated_content = ""
-                                        else:
-                                            # 继续收集推理内容
-                                            yield "reasoning", content
-                                    else:
-                                        # 普通内容
-                                        yield "content", content
-
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON 解析错误: {e}")
-            except Exception as e:
-                logger.error(f"处理 chunk 时发生错误: {e}")
+            buffer += chunk
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()
+
+            for raw_line in lines:
+                line = raw_line.strip()
+                if not line.startswith(b"data: "):
+                    continue
+                payload = line[6:]
+                if payload == b"[DONE]":
+                    if think_parser:
+                        for item in think_parser.finish():
+                            yield item
+                    return
+
+                if frame_head is not None:
+                    frame = reasoning_frame(payload, frame_head)
+                    if frame is not None:
+                        yield "reasoning_frame", frame
+                        continue
+
+                try:
+                    data = json.loads(payload)
+                except json.JSONDecodeError as e:
+                    logger.error(f"JSON 解析错误: {e}")
+                    continue
+
+                # 上游缓存命中统计，通常在最后一个 chunk 中（推理阶段提前结束时收不到）
+                if data and data.get("usage"):
+                    usage = record_cache_usage(self.trace_stage, model, data["usage"])
+                    if usage is not None:
+                        yield "usage", usage
+
+                if not (
+                    data and data.get("choices") and data["choices"][0].get("delta")
+                ):
+                    continue
+                delta = data["choices"][0]["delta"]
+
+                if think_parser is None:
+                    # 处理 reasoning_content
+                    if delta.get("reasoning_content"):
+                        content = delta["reasoning_content"]
+                        logger.debug("提取推理内容：%s", content)
+                        yield "reasoning", content
+
+                    if delta.get("reasoning_content") is None and delta.get(
+                        "content"
+                    ):
+                        content = delta["content"]
+                        logger.info(f"提取内容信息，推理阶段结束: {content}")
+                        yield "content", content
+                elif delta.get("content"):
+                    # 处理其他模型的输出，推理标签可能被拆分在多个 delta 中
+                    for content_type, content in think_parser.feed(delta["content"]):
+                        if content or content_type == "content":
+                            yield content_type, content
+
+        if think_parser:
+            for item in think_parser.finish():
+                yield item
@@ -1,13 +1,16 @@
 """OpenAI 兼容格式的客户端类,用于处理符合 OpenAI API 格式的服务"""
 
 import json
-from typing import AsyncGenerator, Optional, Union, Dict, Any, List
+from typing import AsyncGenerator, Optional, Sequence, Union, Dict, Any, List
 
 import aiohttp
 from aiohttp.client_exceptions import ClientError
 
 from app.clients.base_client import BaseClient
+from app.clients.stall import StreamStalledError
+from app.clients.transports import Transport
 from app.utils.logger import logger
+from app.utils.prompt_prefix import UPSTREAM_STREAM_USAGE, record_cache_usage
 
 
 class OpenAICompatibleClient(BaseClient):
@@ -16,11 +19,15 @@ class OpenAICompatibleClient(BaseClient):
     用于处理符合 OpenAI API 格式的服务,如 Gemini 等
     """
 
+    trace_stage = "answer"
+
     def __init__(
         self,
         api_key: str,
         api_url: str,
         timeout: Optional[aiohttp.ClientTimeout] = None,
+        transport: Optional[Transport] = None,
+        fallback_urls: Sequence[str] = (),
     ):
         """初始化 OpenAI 兼容客户端
 
@@ -28,8 +35,10 @@ class OpenAICompatibleClient(BaseClient):
             api_key: API密钥
             api_url: API地址
             timeout: 请求超时设置,None则使用默认值
+            transport: 上游传输,None则使用共享的 aiohttp 传输
+            fallback_urls: 上游停滞或连接失败时依次尝试的备用地址
         """
-        super().__init__(api_key, api_url, timeout)
+        super().__init__(api_key, api_url, timeout, transport, fallback_urls)
 
     def _get_headers(self) -> Dict[str, str]:
         """获取请求头
@@ -83,7 +92,9 @@ class OpenAICompatibleClient(BaseClient):
                 response_chunks.append(chunk)
             
             response_text = b"".join(response_chunks).decode("utf-8")
-            return json.loads(response_text)
+            response = json.loads(response_text)
+            record_cache_usage(self.trace_stage, model, response.get("usage"))
+            return response
 
         except Exception as e:
             error_msg = f"Chat请求失败: {str(e)}"
@@ -100,7 +111,7 @@ class OpenAICompatibleClient(BaseClient):
             model: 模型名称
 
         Yields:
-            tuple[str, str]: (role, content) 消息元组
+            tuple[str, str]: (role, content) 消息元组；上游报告用量时为 ("usage", CacheUsage)
 
         Raises:
             ClientError: 请求错误
@@ -113,6 +124,8 @@ class OpenAICompatibleClient(BaseClient):
             "messages": processed_messages,
             "stream": True,
         }
+        if UPSTREAM_STREAM_USAGE:
+            data["stream_options"] = {"include_usage": True}
 
         buffer = ""
         try:
@@ -133,18 +146,28 @@ class OpenAICompatibleClient(BaseClient):
                         json_str = line[6:].strip()
                         try:
                             response = json.loads(json_str)
+                            if response.get("usage"):
+                                usage = record_cache_usage(
+                                    self.trace_stage, model, response["usage"]
+                                )
+                                if usage is not None:
+                                    yield "usage", usage
                             if (
                                 "choices" in response
                                 and len(response["choices"]) > 0
                                 and "delta" in response["choices"][0]
                             ):
                                 delta = response["choices"][0]["delta"]
-                                if "content" in delta:
-                                    yield "assistant", delta["content"]
+                                # 角色 chunk 中 content 可能为 null
+                                content = delta.get("content")
+                                if isinstance(content, str) and content:
+                                    yield "assistant", content
                         except json.JSONDecodeError as e:
                             logger.error(f"JSON解析错误: {str(e)}, 原始数据: {json_str}")
                             continue
 
+        except StreamStalledError:
+            raise
         except Exception as e:
             error_msg = f"Stream chat请求失败: {str(e)}"
             logger.error(error_msg)
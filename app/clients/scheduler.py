@@ -0,0 +1,315 @@
+"""上游并发名额的优先级调度
+
+每个上游阶段（reasoning / answer）有固定数量的并发名额（SCHEDULER_SLOTS，可按阶段覆盖，
+例如 SCHEDULER_SLOTS_REASONING=16），请求在发起上游连接前申请名额，上游流结束后归还。
+名额不足时按优先级等待：
+- weighted: 加权公平（stride 调度），各优先级按 SCHEDULER_WEIGHTS 的比例获得空出的名额，
+  低优先级不会被饿死
+- strict: 严格优先级，只要有高优先级请求在等待，低优先级请求就不会获得名额
+
+启用 SCHEDULER_PREEMPT 时，高优先级请求到达且没有空闲名额时，可以抢占一个低优先级请求的名额，
+前提是该请求尚未向调用方输出任何数据（上游还没有返回首个 chunk）。被抢占的请求断开上游连接
+并重新排队，拿到名额后从头重新发起，调用方只会看到更长的首 token 时间。
+
+请求的优先级保存在 current_priority 中，由接口层根据 API 密钥（SCHEDULER_KEY_PRIORITIES）、
+X-Priority 请求头或路由（批量接口固定为 low）设置。SCHEDULER_SLOTS 为 0 时不调度。
+"""
+
+import asyncio
+import os
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+# 优先级从高到低
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+
+# 每个上游阶段的并发名额，0 表示不调度
+SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", "0"))
+# 调度策略：weighted 或 strict
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "weighted")
+# 加权公平调度时各优先级的权重
+SCHEDULER_WEIGHTS = os.getenv("SCHEDULER_WEIGHTS", "high:8,normal:4,low:1")
+# 是否抢占尚未开始输出的低优先级请求
+SCHEDULER_PREEMPT = os.getenv("SCHEDULER_PREEMPT", "false").lower() == "true"
+# API 密钥对应的默认优先级，格式 "密钥:优先级"，逗号分隔
+SCHEDULER_KEY_PRIORITIES = os.getenv("SCHEDULER_KEY_PRIORITIES", "")
+
+# 当前请求的优先级，在任务内设置只影响本任务及其创建的子任务
+current_priority: ContextVar[str] = ContextVar("current_priority", default=DEFAULT_PRIORITY)
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        name, sep, setting = item.strip().rpartition(":")
+        if sep and name:
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    weights = {name: 1.0 for name in PRIORITIES}
+    for name, weight in _parse_pairs(value).items():
+        if name not in PRIORITIES:
+            raise ValueError(f"SCHEDULER_WEIGHTS 中未知的优先级: {name}")
+        weights[name] = float(weight)
+        if weights[name] <= 0:
+            raise ValueError(f"SCHEDULER_WEIGHTS 中 {name} 的权重必须大于 0")
+    return weights
+
+
+_KEY_PRIORITIES = {
+    key: priority for key, priority in _parse_pairs(SCHEDULER_KEY_PRIORITIES).items()
+    if priority in PRIORITIES
+}
+
+
+def resolve_priority(api_key: Optional[str], header: Optional[str] = None) -> str:
+    """请求的优先级：X-Priority 请求头优先，其次是密钥的配置，最后是默认优先级"""
+    if header:
+        header = header.strip().lower()
+        if header in PRIORITIES:
+            return header
+    if api_key:
+        return _KEY_PRIORITIES.get(api_key, DEFAULT_PRIORITY)
+    return DEFAULT_PRIORITY
+
+
+class Lease:
+    """一个请求持有（或等待）的名额"""
+
+    __slots__ = ("pool", "priority", "task", "future", "enqueued", "started", "preempted")
+
+    def __init__(self, pool: "_SlotPool", priority: str):
+        self.pool = pool
+        self.priority = priority
+        self.task: Optional[asyncio.Task] = None
+        self.future: Optional[asyncio.Future] = None
+        self.enqueued = 0.0
+        # 已向调用方输出数据后不再可以抢占
+        self.started = False
+        self.preempted = False
+
+    def mark_started(self) -> None:
+        self.started = True
+
+    def take_preemption(self) -> bool:
+        """在捕获到 CancelledError 时调用，判断取消是否来自抢占
+
+        是抢占（且没有其他取消请求）时撤销取消并返回 True，调用方应重新排队后重试；
+        否则返回 False，调用方照常传播 CancelledError。
+        """
+        if self.preempted and self.task is not None and self.task.uncancel() == 0:
+            self.preempted = False
+            return True
+        return False
+
+    async def reacquire(self) -> None:
+        """被抢占后重新排队，排在同一优先级的最前面"""
+        await self.pool.acquire(self, front=True)
+
+    def release(self) -> None:
+        self.pool.release(self)
+
+
+class _SlotPool:
+    """按优先级排队的名额池，labels 用作指标标签（例如上游阶段或地址）"""
+
+    def __init__(
+        self,
+        labels: Dict[str, str],
+        slots: int,
+        policy: str,
+        weights: Dict[str, float],
+        preempt: bool,
+        prefix: str = "scheduler",
+    ):
+        self.labels = labels
+        # 指标名前缀：<prefix>_wait_seconds、<prefix>_abandoned_total
+        self.prefix = prefix
+        self.slots = slots
+        self.policy = policy
+        self.weights = weights
+        self.preempt = preempt
+        self.holders: List[Lease] = []
+        self.waiting: Dict[str, Deque[Lease]] = {name: deque() for name in PRIORITIES}
+        # stride 调度：每个优先级的虚拟时间，获得名额时增加 1 / 权重
+        self._pass: Dict[str, float] = {name: 0.0 for name in PRIORITIES}
+        self._virtual = 0.0
+
+    def _pick(self) -> Optional[str]:
+        """下一个获得名额的优先级"""
+        candidates = [name for name in PRIORITIES if self.waiting[name]]
+        if not candidates:
+            return None
+        if self.policy == "strict":
+            return candidates[0]
+        return min(candidates, key=lambda name: (self._pass[name], PRIORITIES.index(name)))
+
+    def _grant(self, lease: Lease) -> None:
+        loop = asyncio.get_running_loop()
+        self.holders.append(lease)
+        self._virtual = self._pass[lease.priority]
+        self._pass[lease.priority] += 1.0 / self.weights[lease.priority]
+        metrics.observe(
+            f"{self.prefix}_wait_seconds", loop.time() - lease.enqueued,
+            priority=lease.priority, **self.labels,
+        )
+        lease.future.set_result(None)
+
+    def _dispatch(self) -> None:
+        while len(self.holders) < self.slots:
+            priority = self._pick()
+            if priority is None:
+                return
+            lease = self.waiting[priority].popleft()
+            if lease.future.done():  # 等待期间被取消
+                continue
+            self._grant(lease)
+
+    def _preempt_for(self, lease: Lease) -> None:
+        """抢占一个优先级更低、尚未开始输出的请求"""
+        rank = PRIORITIES.index(lease.priority)
+        victims = [
+            holder for holder in self.holders
+            if PRIORITIES.index(holder.priority) > rank
+            and not holder.started and not holder.preempted and holder.task is not None
+        ]
+        if not victims:
+            return
+        # 优先抢占优先级最低、最晚获得名额的请求
+        victim = max(victims, key=lambda h: (PRIORITIES.index(h.priority), self.holders.index(h)))
+        victim.preempted = True
+        self.holders.remove(victim)
+        metrics.inc("scheduler_preemptions_total", priority=victim.priority, **self.labels)
+        logger.info(f"{self.labels} 的 {victim.priority} 请求被 {lease.priority} 请求抢占，重新排队")
+        victim.task.cancel()
+
+    async def acquire(self, lease: Lease, front: bool = False) -> None:
+        """排队等待名额
+
+        Args:
+            lease: 申请名额的请求
+            front: 排在同一优先级的最前面（被抢占后重新排队）
+        """
+        loop = asyncio.get_running_loop()
+        lease.task = asyncio.current_task()
+        while True:
+            lease.future = loop.create_future()
+            lease.enqueued = loop.time()
+            queue = self.waiting[lease.priority]
+            if not queue:
+                # 空闲后重新开始排队的优先级不能积攒之前的份额
+                self._pass[lease.priority] = max(self._pass[lease.priority], self._virtual)
+            if front:
+                queue.appendleft(lease)
+            else:
+                queue.append(lease)
+            if self.preempt and len(self.holders) >= self.slots:
+                self._preempt_for(lease)
+            self._dispatch()
+            try:
+                await lease.future
+                return
+            except asyncio.CancelledError:
+                if lease.future.done() and not lease.future.cancelled():
+                    # 获得名额后还没开始请求就被抢占，直接重新排队
+                    if lease.take_preemption():
+                        front = True
+                        continue
+                    self.release(lease)
+                else:
+                    lease.future.cancel()
+                    metrics.inc(f"{self.prefix}_abandoned_total", priority=lease.priority, **self.labels)
+                raise
+
+    def release(self, lease: Lease) -> None:
+        if lease in self.holders:
+            self.holders.remove(lease)
+        self._dispatch()
+
+    def resize(self, slots: int) -> None:
+        """调整名额数，增加时立即放行排队的请求；减少时已持有的名额不收回"""
+        self.slots = slots
+        self._dispatch()
+
+    def waiting_count(self, priority: str) -> int:
+        return sum(1 for lease in self.waiting[priority] if not lease.future.done())
+
+    def oldest_wait(self) -> float:
+        """排队最久的请求已等待的时间（秒），没有排队时为 0"""
+        now = asyncio.get_running_loop().time()
+        return max(
+            (now - lease.enqueued for queue in self.waiting.values()
+             for lease in queue if not lease.future.done()),
+            default=0.0,
+        )
+
+    async def lease(self) -> Lease:
+        """按当前请求的优先级申请名额"""
+        lease = Lease(self, current_priority.get())
+        await self.acquire(lease)
+        return lease
+
+
+class UpstreamScheduler:
+    """按上游阶段分配并发名额"""
+
+    def __init__(
+        self,
+        slots: int = SCHEDULER_SLOTS,
+        policy: str = SCHEDULER_POLICY,
+        weights: str = SCHEDULER_WEIGHTS,
+        preempt: bool = SCHEDULER_PREEMPT,
+    ):
+        if policy not in ("weighted", "strict"):
+            raise ValueError(f"SCHEDULER_POLICY 必须是 weighted 或 strict，当前为 {policy}")
+        self.slots = slots
+        self.policy = policy
+        self.weights = _parse_weights(weights)
+        self.preempt = preempt
+        # 未启用调度的阶段记为 None
+        self.pools: Dict[str, Optional[_SlotPool]] = {}
+
+    def _pool(self, stage: str) -> Optional[_SlotPool]:
+        if stage not in self.pools:
+            value = os.getenv(f"SCHEDULER_SLOTS_{stage.upper()}")
+            slots = int(value) if value else self.slots
+            self.pools[stage] = (
+                _SlotPool({"stage": stage}, slots, self.policy, self.weights, self.preempt)
+                if slots > 0 else None
+            )
+        return self.pools[stage]
+
+    def oldest_wait(self, stage: str) -> float:
+        """该阶段排队最久的请求已等待的时间（秒），未启用调度时为 0"""
+        pool = self._pool(stage)
+        return 0.0 if pool is None else pool.oldest_wait()
+
+    async def acquire(self, stage: str) -> Optional[Lease]:
+        """按当前请求的优先级申请名额，该阶段未启用调度时返回 None"""
+        pool = self._pool(stage)
+        if pool is None:
+            return None
+        return await pool.lease()
+
+
+upstream_scheduler = UpstreamScheduler()
+
+
+def _collect_scheduler_metrics():
+    for stage, pool in upstream_scheduler.pools.items():
+        if pool is None:
+            continue
+        yield "scheduler_slots", {"stage": stage}, pool.slots
+        yield "scheduler_slots_in_use", {"stage": stage}, len(pool.holders)
+        for priority in PRIORITIES:
+            yield "scheduler_waiting", {"stage": stage, "priority": priority}, pool.waiting_count(priority)
+
+
+metrics.register_collector(_collect_scheduler_metrics)
@@ -0,0 +1,139 @@
+"""上游停滞检测
+
+对每个上游地址和阶段（reasoning / answer）分别统计首 token 时间（TTFT）和相邻数据 chunk
+之间的间隔，超时时间取观测到的 p99 乘以 STALL_MULTIPLIER，并限制在 [下限, 上限] 之间；
+样本不足时直接使用上限。SSE 注释（keep-alive）不计为数据，因此只发送心跳的上游同样会被
+判定为停滞。
+
+上限和下限可按阶段覆盖，例如 STALL_TTFT_CAP_REASONING=300 只对推理阶段生效。
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Dict, Tuple
+
+from aiohttp.client_exceptions import ServerTimeoutError
+
+from app.utils.metrics import metrics
+
+# 未积累足够样本时使用的上限，同时也是学习到的超时的上限（秒）
+STALL_TTFT_CAP = float(os.getenv("STALL_TTFT_CAP", "120"))
+STALL_GAP_CAP = float(os.getenv("STALL_GAP_CAP", "60"))
+# 学习到的超时的下限（秒）
+STALL_TTFT_FLOOR = float(os.getenv("STALL_TTFT_FLOOR", "10"))
+STALL_GAP_FLOOR = float(os.getenv("STALL_GAP_FLOOR", "5"))
+# 超时 = p99 * STALL_MULTIPLIER
+STALL_MULTIPLIER = float(os.getenv("STALL_MULTIPLIER", "3"))
+# 开始使用学习值所需的最少样本数
+STALL_MIN_SAMPLES = int(os.getenv("STALL_MIN_SAMPLES", "20"))
+# 每个上游和阶段保留的样本数
+STALL_WINDOW = int(os.getenv("STALL_WINDOW", "1000"))
+# 新增多少样本后重新计算分位数
+_RECOMPUTE_EVERY = 50
+
+
+class StreamStalledError(ServerTimeoutError):
+    """上游在超时时间内没有发送新的数据"""
+
+    def __init__(self, upstream: str, stage: str, kind: str, timeout: float):
+        self.upstream = upstream
+        self.stage = stage
+        self.kind = kind
+        self.timeout = timeout
+        what = "首个 token" if kind == "ttft" else "下一个 chunk"
+        super().__init__(f"上游 {stage} 阶段停滞: {timeout:.1f} 秒内未收到{what}")
+
+
+def _stage_setting(name: str, stage: str, default: float) -> float:
+    value = os.getenv(f"{name}_{stage.upper()}")
+    return float(value) if value else default
+
+
+class _Series:
+    """滑动窗口样本及缓存的超时值"""
+
+    __slots__ = ("samples", "pending", "timeout")
+
+    def __init__(self, cap: float):
+        self.samples = deque(maxlen=STALL_WINDOW)
+        self.pending = 0
+        self.timeout = cap
+
+
+class LatencyTracker:
+    """按上游和阶段学习 TTFT 与 chunk 间隔的超时时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str, str], _Series] = {}
+        self._limits: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def _bounds(self, kind: str, stage: str) -> Tuple[float, float]:
+        """(下限, 上限)"""
+        bounds = self._limits.get((kind, stage))
+        if bounds is None:
+            if kind == "ttft":
+                bounds = (
+                    _stage_setting("STALL_TTFT_FLOOR", stage, STALL_TTFT_FLOOR),
+                    _stage_setting("STALL_TTFT_CAP", stage, STALL_TTFT_CAP),
+                )
+            else:
+                bounds = (
+                    _stage_setting("STALL_GAP_FLOOR", stage, STALL_GAP_FLOOR),
+                    _stage_setting("STALL_GAP_CAP", stage, STALL_GAP_CAP),
+                )
+            self._limits[(kind, stage)] = bounds
+        return bounds
+
+    def _get(self, kind: str, upstream: str, stage: str) -> _Series:
+        key = (kind, upstream, stage)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, _Series(self._bounds(kind, stage)[1]))
+        return series
+
+    def observe(self, kind: str, upstream: str, stage: str, seconds: float) -> None:
+        """记录一次 TTFT（kind="ttft"）或 chunk 间隔（kind="gap"）"""
+        series = self._get(kind, upstream, stage)
+        series.samples.append(seconds)
+        series.pending += 1
+        if series.pending >= _RECOMPUTE_EVERY or (
+            len(series.samples) == STALL_MIN_SAMPLES and series.pending
+        ):
+            self._recompute(series, kind, stage)
+
+    def _recompute(self, series: _Series, kind: str, stage: str) -> None:
+        series.pending = 0
+        floor, cap = self._bounds(kind, stage)
+        if len(series.samples) < STALL_MIN_SAMPLES:
+            series.timeout = cap
+            return
+        ordered = sorted(series.samples)
+        p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+        series.timeout = min(cap, max(floor, p99 * STALL_MULTIPLIER))
+
+    def timeout(self, kind: str, upstream: str, stage: str) -> float:
+        """当前的超时时间（秒）"""
+        return self._get(kind, upstream, stage).timeout
+
+    def snapshot(self):
+        for (kind, upstream, stage), series in list(self._series.items()):
+            yield kind, upstream, stage, series.timeout, len(series.samples)
+
+
+latency_tracker = LatencyTracker()
+
+
+def _collect_stall_metrics():
+    series = list(latency_tracker.snapshot())
+    for kind, upstream, stage, timeout, _ in series:
+        labels = {"upstream": upstream, "stage": stage, "kind": kind}
+        yield "upstream_stall_timeout_seconds", labels, timeout
+    for kind, upstream, stage, _, samples in series:
+        labels = {"upstream": upstream, "stage": stage, "kind": kind}
+        yield "upstream_latency_samples", labels, samples
+
+
+metrics.register_collector(_collect_stall_metrics)
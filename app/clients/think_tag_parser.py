@@ -0,0 +1,106 @@
+"""非原生推理模型的 <think> 标签流式解析"""
+
+from typing import List, Tuple
+
+# 解析状态
+BEFORE = 0  # 尚未遇到开始标签，只收到空白或开始标签的前缀
+REASONING = 1  # 位于开始与结束标签之间
+AFTER = 2  # 推理结束（或模型没有输出推理），其余内容均为正文
+
+
+class ThinkTagParser:
+    """增量解析夹在开始/结束标签之间的推理内容
+
+    标签可以被任意拆分到多个 delta 中（例如 "<thi" + "nk>"）。每次 feed 只扫描
+    新到达的文本和至多 len(tag) - 1 个暂存字符，因此每个输入字符的处理开销为常数，
+    不会随已接收内容的长度增长。
+
+    输出事件与 DeepSeekClient.stream_chat 一致：
+        ("reasoning", 文本): 推理内容（不含标签）
+        ("content", 文本): 正文；推理结束时至少输出一次（可能为空字符串）
+    """
+
+    __slots__ = ("open_tag", "close_tag", "state", "held")
+
+    def __init__(
+        self,
+        open_tag: str = "<think>",
+        close_tag: str = "</think>",
+        implicit_open: bool = False,
+    ):
+        """初始化解析器
+
+        Args:
+            open_tag: 推理开始标签
+            close_tag: 推理结束标签
+            implicit_open: 模型是否省略开始标签（由对话模板预填），为 True 时从第一个字符起即视为推理
+        """
+        if not open_tag or not close_tag:
+            raise ValueError("推理标签不能为空")
+        self.open_tag = open_tag
+        self.close_tag = close_tag
+        self.state = REASONING if implicit_open else BEFORE
+        self.held = ""
+
+    @staticmethod
+    def _partial_suffix(data: str, tag: str) -> int:
+        """返回 data 末尾可能是 tag 前缀的最长长度"""
+        for size in range(min(len(tag) - 1, len(data)), 0, -1):
+            if data.endswith(tag[:size]):
+                return size
+        return 0
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """输入一个 delta，返回可以确定类型的事件列表"""
+        events = []
+        data = self.held + text
+        self.held = ""
+
+        if self.state == BEFORE:
+            stripped = data.lstrip()
+            if not stripped or self.open_tag.startswith(stripped):
+                # 只有空白或开始标签的前缀，等待更多内容
+                self.held = data
+                return events
+            if stripped.startswith(self.open_tag):
+                self.state = REASONING
+                data = stripped[len(self.open_tag):]
+            else:
+                # 模型没有输出推理内容
+                self.state = AFTER
+                events.append(("content", data))
+                return events
+
+        if self.state == REASONING:
+            index = data.find(self.close_tag)
+            if index < 0:
+                keep = self._partial_suffix(data, self.close_tag)
+                if keep:
+                    self.held = data[-keep:]
+                    data = data[:-keep]
+                if data:
+                    events.append(("reasoning", data))
+                return events
+
+            if index:
+                events.append(("reasoning", data[:index]))
+            self.state = AFTER
+            events.append(("content", data[index + len(self.close_tag):]))
+            return events
+
+        if data:
+            events.append(("content", data))
+        return events
+
+    def finish(self) -> List[Tuple[str, str]]:
+        """上游流结束时输出暂存的字符"""
+        held, self.held = self.held, ""
+        if self.state == REASONING:
+            return [("reasoning", held)] if held else []
+        if self.state == BEFORE:
+            self.state = AFTER
+            if held.strip() == self.open_tag:
+                # 只有完整的开始标签，视为空的推理块
+                return [("content", "")]
+            return [("content", held)] if held.strip() else []
+        return [("content", held)] if held else []
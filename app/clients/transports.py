@@ -0,0 +1,238 @@
+"""上游 HTTP 传输层
+
+BaseClient 通过 Transport 发送请求并以字节流读取响应。可选实现：
+
+- aiohttp: HTTP/1.1，每个并发流占用一条连接（默认）
+- http2: httpx HTTP/2，通过 TLS ALPN 协商，同一主机的多个并发流复用少量连接
+- h2c: httpx HTTP/2 明文 prior knowledge，用于本地或内网的 h2c 服务
+
+同名传输在进程内共享，因此推理与回答阶段访问同一主机时也共享连接池。
+HTTP/2 实现依赖可选依赖 httpx[http2]。
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncGenerator, Callable, Dict, Optional, Union
+
+import aiohttp
+from aiohttp.client_exceptions import ClientConnectionError, ClientError, ServerTimeoutError
+
+# 每个传输允许的最大连接数
+TRANSPORT_MAX_CONNECTIONS = 100
+
+
+class UpstreamStatusError(ClientError):
+    """上游返回了非 2xx 状态码"""
+
+    def __init__(self, status: int, error_text: str):
+        self.status = status
+        super().__init__(f"API request failed: Status code {status}, Error: {error_text}")
+
+
+class Transport(ABC):
+    """上游传输接口"""
+
+    name = "base"
+
+    @abstractmethod
+    def stream(
+        self,
+        url: str,
+        headers: dict,
+        data: Union[dict, bytes],
+        timeout: aiohttp.ClientTimeout,
+        on_connect: Optional[Callable[[], None]] = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """发送 POST 请求并逐块返回响应内容
+
+        Args:
+            url: 请求地址
+            headers: 请求头
+            data: JSON 请求体，或已编码为 JSON 的字节
+            timeout: 超时设置
+            on_connect: 收到成功的响应头后调用
+
+        Yields:
+            bytes: 响应内容
+
+        Raises:
+            UpstreamStatusError: 响应状态码非 2xx
+            ClientError: 连接错误
+            ServerTimeoutError: 读取超时
+        """
+
+    async def close(self) -> None:
+        """关闭连接池"""
+
+
+class AiohttpTransport(Transport):
+    """基于 aiohttp 的 HTTP/1.1 传输，连接按事件循环复用"""
+
+    name = "aiohttp"
+
+    def __init__(self, max_connections: int = TRANSPORT_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    async def stream(
+        self,
+        url: str,
+        headers: dict,
+        data: Union[dict, bytes],
+        timeout: aiohttp.ClientTimeout,
+        on_connect: Optional[Callable[[], None]] = None,
+    ) -> AsyncGenerator[bytes, None]:
+        session = self._get_session()
+        body = {"data": data} if isinstance(data, bytes) else {"json": data}
+        async with session.post(url, headers=headers, timeout=timeout, **body) as response:
+            if not response.ok:
+                raise UpstreamStatusError(response.status, await response.text())
+            if on_connect is not None:
+                on_connect()
+            async for chunk in response.content.iter_any():
+                yield chunk
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class HTTP2Transport(Transport):
+    """基于 httpx 的 HTTP/2 传输，同一主机的并发流复用连接"""
+
+    name = "http2"
+
+    def __init__(
+        self,
+        max_connections: int = TRANSPORT_MAX_CONNECTIONS,
+        prior_knowledge: bool = False,
+    ):
+        """初始化 HTTP/2 传输
+
+        Args:
+            max_connections: 最大连接数（每条连接可承载服务端允许的多个并发流）
+            prior_knowledge: 是否对明文地址直接使用 HTTP/2（h2c），不经过 HTTP/1.1 协商
+        """
+        try:
+            import httpx  # noqa: F401
+            import h2  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError(
+                "HTTP/2 传输需要安装可选依赖: pip install 'httpx[http2]'"
+            ) from e
+        self.max_connections = max_connections
+        self.prior_knowledge = prior_knowledge
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                http1=not self.prior_knowledge,
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    async def stream(
+        self,
+        url: str,
+        headers: dict,
+        data: Union[dict, bytes],
+        timeout: aiohttp.ClientTimeout,
+        on_connect: Optional[Callable[[], None]] = None,
+    ) -> AsyncGenerator[bytes, None]:
+        import httpx
+
+        client = self._get_client()
+        request_timeout = httpx.Timeout(
+            connect=timeout.connect,
+            read=timeout.sock_read,
+            write=timeout.sock_read,
+            pool=timeout.connect,
+        )
+        deadline = time.monotonic() + timeout.total if timeout.total else None
+        body = {"content": data} if isinstance(data, bytes) else {"json": data}
+
+        try:
+            async with client.stream(
+                "POST", url, headers=headers, timeout=request_timeout, **body
+            ) as response:
+                if response.status_code >= 400:
+                    error_text = (await response.aread()).decode("utf-8", "replace")
+                    raise UpstreamStatusError(response.status_code, error_text)
+                if on_connect is not None:
+                    on_connect()
+                # aiter_bytes 按 Content-Encoding 解压，与 aiohttp 传输一致
+                chunks = response.aiter_bytes()
+                while True:
+                    # 总超时也限制等待下一块的时间，上游不再发送数据时不只受读取超时约束
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    try:
+                        async with asyncio.timeout(remaining):
+                            chunk = await anext(chunks, None)
+                    except TimeoutError:
+                        raise ServerTimeoutError("Total request timeout exceeded") from None
+                    if chunk is None:
+                        break
+                    yield chunk
+        except httpx.TimeoutException as e:
+            raise ServerTimeoutError(f"{type(e).__name__}: {e}") from e
+        except httpx.ConnectError as e:
+            raise ClientConnectionError(f"{type(e).__name__}: {e}") from e
+        except httpx.HTTPError as e:
+            raise ClientError(f"{type(e).__name__}: {e}") from e
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+_TRANSPORT_FACTORIES = {
+    "aiohttp": lambda: AiohttpTransport(),
+    "http2": lambda: HTTP2Transport(),
+    "h2c": lambda: HTTP2Transport(prior_knowledge=True),
+}
+_transports: Dict[str, Transport] = {}
+
+
+def get_transport(name: str = "aiohttp") -> Transport:
+    """按名称获取共享的传输实例
+
+    Args:
+        name: aiohttp, http2 或 h2c
+
+    Raises:
+        ValueError: 不支持的传输名称
+    """
+    name = (name or "aiohttp").lower()
+    if name not in _TRANSPORT_FACTORIES:
+        raise ValueError(f"不支持的传输: {name}")
+    if name not in _transports:
+        _transports[name] = _TRANSPORT_FACTORIES[name]()
+    return _transports[name]
+
+
+async def close_transports() -> None:
+    """关闭所有已创建的传输"""
+    for transport in _transports.values():
+        await transport.close()
@@ -1,17 +1,35 @@
 """配置模块"""
 
-import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Any
 
-import yaml
+_env_loaded = False
 
+
+def load_env() -> None:
+    """加载 .env 文件，进程内只执行一次
+
+    .env 中的值会覆盖已存在的环境变量。
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+    _env_loaded = True
+
+
+@lru_cache(maxsize=1)
 def load_models_config() -> Dict[str, List[Dict[str, Any]]]:
-    """加载模型配置
+    """加载模型配置，结果在进程内缓存
 
     Returns:
         Dict[str, List[Dict[str, Any]]]: 模型配置字典
     """
+    import yaml
+
     config_path = Path(__file__).parent / "models.yaml"
     with open(config_path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
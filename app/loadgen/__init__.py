@@ -0,0 +1,13 @@
+"""负载生成与上游录制回放工具，使用 python -m app.loadgen 运行"""
+
+from .cassette import CassetteStore, MockUpstream
+from .runner import LoadRunner, format_summary, load_trace, summarize
+
+__all__ = [
+    "CassetteStore",
+    "LoadRunner",
+    "MockUpstream",
+    "format_summary",
+    "load_trace",
+    "summarize",
+]
@@ -0,0 +1,98 @@
+"""负载生成命令行
+
+开环回放请求记录：
+    python -m app.loadgen run --trace requests.jsonl --rate 20 --duration 60 \\
+        --stream-ratio 0.8 --disconnect-rate 0.1
+
+录制真实上游（把服务的 DEEPSEEK_API_URL 指向 http://127.0.0.1:18080/deepseek 等）：
+    python -m app.loadgen mock --cassettes cassettes.jsonl \\
+        --record deepseek=https://api.deepseek.com/v1/chat/completions \\
+        --record claude=https://api.anthropic.com/v1/messages
+
+回放录制的上游：
+    python -m app.loadgen mock --cassettes cassettes.jsonl --time-scale 1.0
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from aiohttp import web
+
+from .cassette import CassetteStore, MockUpstream
+from .runner import LoadRunner, format_summary, load_trace, summarize
+
+
+def run_command(args) -> int:
+    bodies = load_trace(args.trace)
+    count = args.requests or max(1, int(args.rate * args.duration))
+    runner = LoadRunner(
+        args.url,
+        args.api_key,
+        bodies,
+        stream_ratio=args.stream_ratio,
+        disconnect_rate=args.disconnect_rate,
+        disconnect_max_tokens=args.disconnect_max_tokens,
+        timeout=args.timeout,
+        seed=args.seed,
+    )
+    results, send_duration = asyncio.run(
+        runner.run(args.rate, count, args.schedule, args.max_connections)
+    )
+    summary = summarize(results, send_duration)
+    print(json.dumps(summary, ensure_ascii=False) if args.json else format_summary(summary))
+    return 0
+
+
+def mock_command(args) -> int:
+    upstreams = {}
+    for item in args.record or []:
+        name, sep, url = item.partition("=")
+        if not sep or not name or not url:
+            print(f"--record 格式应为 名称=地址: {item}", file=sys.stderr)
+            return 2
+        upstreams[name] = url
+    store = CassetteStore(args.cassettes)
+    mode = "录制" if upstreams else f"回放 {len(store)} 条响应"
+    print(f"mock 上游 {mode}: http://{args.host}:{args.port}/{{upstream}}")
+    mock = MockUpstream(store, upstreams, args.time_scale)
+    web.run_app(mock.app(), host=args.host, port=args.port, print=None, access_log=None)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.loadgen", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="开环回放请求记录")
+    run.add_argument("--trace", required=True, help="JSONL 请求记录")
+    run.add_argument("--url", default="http://127.0.0.1:8000/v1/chat/completions")
+    run.add_argument("--api-key", default="", help="服务 API 密钥")
+    run.add_argument("--rate", type=float, default=10.0, help="每秒到达的请求数")
+    run.add_argument("--duration", type=float, default=30.0, help="发送持续秒数")
+    run.add_argument("--requests", type=int, default=0, help="请求总数，优先于 --duration")
+    run.add_argument("--schedule", choices=["poisson", "uniform"], default="poisson")
+    run.add_argument("--stream-ratio", type=float, default=None, help="流式请求比例，默认沿用请求记录")
+    run.add_argument("--disconnect-rate", type=float, default=0.0, help="流式请求中途断开的比例")
+    run.add_argument("--disconnect-max-tokens", type=int, default=20, help="断开前最多读取的 chunk 数")
+    run.add_argument("--max-connections", type=int, default=0, help="客户端最大连接数，0 表示不限制")
+    run.add_argument("--timeout", type=float, default=600.0)
+    run.add_argument("--seed", type=int, default=None)
+    run.add_argument("--json", action="store_true", help="以 JSON 输出汇总")
+    run.set_defaults(handler=run_command)
+
+    mock = commands.add_parser("mock", help="录制或回放上游响应")
+    mock.add_argument("--cassettes", required=True, help="cassette JSONL 文件")
+    mock.add_argument("--record", action="append", metavar="NAME=URL", help="录制模式的上游")
+    mock.add_argument("--time-scale", type=float, default=1.0, help="回放时间缩放，0 表示不等待")
+    mock.add_argument("--host", default="127.0.0.1")
+    mock.add_argument("--port", type=int, default=18080)
+    mock.set_defaults(handler=mock_command)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""上游录制与回放
+
+mock 服务器在 POST /{upstream} 上模拟上游接口：
+
+- 录制模式：把请求转发到真实上游，原样返回响应，同时把响应的每个 chunk 及其相对请求开始的
+  时间写入 cassette 文件（JSONL，每行一次响应）。
+- 回放模式：按请求体匹配录制的响应（找不到时按顺序轮换同一上游的响应），按录制时的节奏
+  重新发送每个 chunk，time_scale 可整体缩放时间。
+
+把服务的 DEEPSEEK_API_URL / CLAUDE_API_URL 等指向 mock 服务器即可得到可复现的上游延迟。
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+# 转发到上游时保留的请求头
+FORWARD_HEADERS = ("authorization", "x-api-key", "anthropic-version", "content-type", "accept")
+
+
+def request_key(upstream: str, body: dict) -> str:
+    """按上游名称、模型与消息计算匹配用的键"""
+    canonical = json.dumps(
+        [upstream, body.get("model"), body.get("messages"), body.get("system")],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CassetteStore:
+    """cassette 文件的读写"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._by_key: Dict[str, dict] = {}
+        self._by_upstream: Dict[str, List[dict]] = {}
+        self._cycles: Dict[str, itertools.cycle] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def _index(self, record: dict) -> None:
+        self._by_key[record["key"]] = record
+        self._by_upstream.setdefault(record["upstream"], []).append(record)
+        self._cycles.pop(record["upstream"], None)
+
+    def find(self, upstream: str, body: dict) -> Optional[dict]:
+        record = self._by_key.get(request_key(upstream, body))
+        if record is not None:
+            return record
+        records = self._by_upstream.get(upstream)
+        if not records:
+            return None
+        if upstream not in self._cycles:
+            self._cycles[upstream] = itertools.cycle(records)
+        return next(self._cycles[upstream])
+
+    def save(self, record: dict) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            # 转义为 ASCII，保留被 chunk 边界拆开的多字节字符
+            f.write(json.dumps(record) + "\n")
+        self._index(record)
+
+
+class MockUpstream:
+    """录制或回放上游响应的 aiohttp 应用"""
+
+    def __init__(
+        self,
+        store: CassetteStore,
+        upstreams: Optional[Dict[str, str]] = None,
+        time_scale: float = 1.0,
+    ):
+        """初始化 mock 上游
+
+        Args:
+            store: cassette 存储
+            upstreams: 录制模式下上游名称到真实地址的映射，为空时为回放模式
+            time_scale: 回放时的时间缩放系数，0 表示不等待
+        """
+        self.store = store
+        self.upstreams = upstreams or {}
+        self.time_scale = time_scale
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def app(self) -> web.Application:
+        application = web.Application()
+        application.router.add_post("/{upstream}", self.handle)
+        application.on_cleanup.append(self._close)
+        return application
+
+    async def _close(self, _app) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        upstream = request.match_info["upstream"]
+        body = await request.json()
+        if self.upstreams:
+            return await self._record(request, upstream, body)
+        return await self._replay(request, upstream, body)
+
+    async def _replay(self, request: web.Request, upstream: str, body: dict):
+        record = self.store.find(upstream, body)
+        if record is None:
+            return web.json_response(
+                {"error": f"没有上游 {upstream} 的录制响应"}, status=404
+            )
+        response = web.StreamResponse(
+            status=record["status"], headers={"Content-Type": record["content_type"]}
+        )
+        await response.prepare(request)
+        start = time.perf_counter()
+        for offset, text in record["chunks"]:
+            delay = start + offset * self.time_scale - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await response.write(text.encode("utf-8", "surrogateescape"))
+        await response.write_eof()
+        return response
+
+    async def _record(self, request: web.Request, upstream: str, body: dict):
+        url = self.upstreams.get(upstream)
+        if url is None:
+            return web.json_response({"error": f"未配置上游 {upstream}"}, status=404)
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        headers = {k: v for k, v in request.headers.items() if k.lower() in FORWARD_HEADERS}
+
+        start = time.perf_counter()
+        chunks = []
+        async with self._session.post(url, json=body, headers=headers) as upstream_response:
+            content_type = upstream_response.headers.get("Content-Type", "application/json")
+            response = web.StreamResponse(
+                status=upstream_response.status, headers={"Content-Type": content_type}
+            )
+            await response.prepare(request)
+            async for chunk in upstream_response.content.iter_any():
+                chunks.append(
+                    [round(time.perf_counter() - start, 4), chunk.decode("utf-8", "surrogateescape")]
+                )
+                await response.write(chunk)
+            await response.write_eof()
+
+        self.store.save(
+            {
+                "key": request_key(upstream, body),
+                "upstream": upstream,
+                "model": body.get("model"),
+                "status": upstream_response.status,
+                "content_type": content_type,
+                "chunks": chunks,
+            }
+        )
+        return response
@@ -0,0 +1,279 @@
+"""开环负载生成
+
+按目标到达率（泊松或均匀间隔）发送请求，发送时间只由调度决定，与之前的请求是否完成无关，
+因此服务排队造成的延迟会完整体现在结果中。所有延迟都从计划发送时间开始计算。
+"""
+
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+import aiohttp
+
+
+@dataclass
+class RequestResult:
+    """单个请求的结果，时间单位为秒"""
+
+    stream: bool
+    status: int = 0
+    ttft: Optional[float] = None
+    total: Optional[float] = None
+    gaps: List[float] = field(default_factory=list)
+    tokens: int = 0
+    error: Optional[str] = None
+    disconnected: bool = False
+    # 实际发送时间相对计划发送时间的延后
+    send_lag: float = 0.0
+
+
+def _event_data(event: bytes) -> Optional[bytes]:
+    """SSE 事件中 data 字段的内容，忽略 id、event 和注释行；没有 data 字段时返回 None"""
+    data = [
+        line[6:] if line.startswith(b"data: ") else line[5:]
+        for line in event.split(b"\n")
+        if line.startswith(b"data:")
+    ]
+    return b"\n".join(data) if data else None
+
+
+def load_trace(path: str) -> List[dict]:
+    """读取 JSONL 格式的请求记录
+
+    每行是一个聊天请求体，或 {"body": {...}} 形式的记录。
+
+    Raises:
+        ValueError: 文件中没有有效请求
+    """
+    bodies = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {line_no} 行不是有效的 JSON: {e}") from e
+            body = record.get("body", record) if isinstance(record, dict) else None
+            if not isinstance(body, dict) or "messages" not in body:
+                raise ValueError(f"第 {line_no} 行缺少 messages")
+            bodies.append(body)
+    if not bodies:
+        raise ValueError(f"请求记录 {path} 为空")
+    return bodies
+
+
+def arrival_offsets(
+    rate: float, count: int, schedule: str = "poisson", rng: Optional[random.Random] = None
+) -> Iterator[float]:
+    """生成相对开始时间的计划发送时间
+
+    Args:
+        rate: 每秒请求数
+        count: 请求总数
+        schedule: poisson（指数分布间隔）或 uniform（固定间隔）
+    """
+    rng = rng or random.Random()
+    offset = 0.0
+    for _ in range(count):
+        yield offset
+        offset += rng.expovariate(rate) if schedule == "poisson" else 1.0 / rate
+
+
+class LoadRunner:
+    """开环回放请求记录"""
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        bodies: List[dict],
+        stream_ratio: Optional[float] = None,
+        disconnect_rate: float = 0.0,
+        disconnect_max_tokens: int = 20,
+        timeout: float = 600,
+        seed: Optional[int] = None,
+    ):
+        """初始化负载生成器
+
+        Args:
+            url: /v1/chat/completions 地址
+            api_key: 服务 API 密钥
+            bodies: 按顺序循环发送的请求体
+            stream_ratio: 流式请求比例，None 表示沿用请求体中的 stream
+            disconnect_rate: 流式请求在中途断开连接的比例
+            disconnect_max_tokens: 断开前最多读取的 token chunk 数（随机选择）
+            timeout: 单个请求的超时时间（秒）
+            seed: 随机种子，用于复现相同的请求组合
+        """
+        self.url = url
+        self.api_key = api_key
+        self.bodies = bodies
+        self.stream_ratio = stream_ratio
+        self.disconnect_rate = disconnect_rate
+        self.disconnect_max_tokens = max(1, disconnect_max_tokens)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.rng = random.Random(seed)
+
+    def _prepare(self, index: int) -> tuple[dict, Optional[int]]:
+        """返回请求体以及断开前读取的 chunk 数（None 表示不主动断开）"""
+        body = dict(self.bodies[index % len(self.bodies)])
+        if self.stream_ratio is not None:
+            body["stream"] = self.rng.random() < self.stream_ratio
+        disconnect_after = None
+        if body.get("stream") and self.rng.random() < self.disconnect_rate:
+            disconnect_after = self.rng.randint(1, self.disconnect_max_tokens)
+        return body, disconnect_after
+
+    async def _send(
+        self,
+        session: aiohttp.ClientSession,
+        body: dict,
+        disconnect_after: Optional[int],
+        scheduled: float,
+    ) -> RequestResult:
+        result = RequestResult(stream=bool(body.get("stream")))
+        result.send_lag = time.perf_counter() - scheduled
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        last = None
+        try:
+            async with session.post(
+                self.url, json=body, headers=headers, timeout=self.timeout
+            ) as response:
+                result.status = response.status
+                if response.status != 200:
+                    result.error = f"HTTP {response.status}"
+                    await response.read()
+                    return result
+                if not result.stream:
+                    payload = await response.json(content_type=None)
+                    result.total = time.perf_counter() - scheduled
+                    result.ttft = result.total
+                    if "error" in payload:
+                        result.error = str(payload["error"])[:200]
+                    return result
+
+                buffer = b""
+                async for chunk in response.content.iter_any():
+                    buffer += chunk
+                    events = buffer.split(b"\n\n")
+                    buffer = events.pop()
+                    for event in events:
+                        data = _event_data(event)
+                        if data is None or data == b"[DONE]":
+                            continue
+                        if b'"error"' in data:
+                            result.error = data[:200].decode("utf-8", "replace")
+                            continue
+                        now = time.perf_counter()
+                        if last is None:
+                            result.ttft = now - scheduled
+                        else:
+                            result.gaps.append(now - last)
+                        last = now
+                        result.tokens += 1
+                        if disconnect_after is not None and result.tokens >= disconnect_after:
+                            result.disconnected = True
+                            return result
+                result.total = time.perf_counter() - scheduled
+        except asyncio.TimeoutError:
+            result.error = "timeout"
+        except aiohttp.ClientError as e:
+            result.error = f"{type(e).__name__}: {e}"
+        return result
+
+    async def run(
+        self,
+        rate: float,
+        count: int,
+        schedule: str = "poisson",
+        max_connections: int = 0,
+    ) -> tuple[List[RequestResult], float]:
+        """按计划发送 count 个请求并等待全部完成
+
+        Returns:
+            tuple[List[RequestResult], float]: 每个请求的结果以及发送阶段的实际耗时
+        """
+        connector = aiohttp.TCPConnector(limit=max_connections)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            start = time.perf_counter()
+            tasks = []
+            for index, offset in enumerate(arrival_offsets(rate, count, schedule, self.rng)):
+                scheduled = start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                body, disconnect_after = self._prepare(index)
+                tasks.append(
+                    asyncio.create_task(self._send(session, body, disconnect_after, scheduled))
+                )
+            send_duration = time.perf_counter() - start
+            results = await asyncio.gather(*tasks)
+        return list(results), send_duration
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(results: List[RequestResult], send_duration: float) -> dict:
+    """汇总延迟分位数（毫秒）与错误率"""
+    completed = [r for r in results if r.error is None and not r.disconnected]
+    errors = [r for r in results if r.error is not None]
+
+    def distribution(values: List[float]) -> dict:
+        return {
+            name: None if value is None else round(value * 1000, 1)
+            for name, value in (
+                ("p50", percentile(values, 0.5)),
+                ("p90", percentile(values, 0.9)),
+                ("p99", percentile(values, 0.99)),
+                ("max", max(values) if values else None),
+            )
+        }
+
+    error_kinds = {}
+    for r in errors:
+        kind = r.error.split(":")[0][:60]
+        error_kinds[kind] = error_kinds.get(kind, 0) + 1
+
+    return {
+        "requests": len(results),
+        "stream": sum(1 for r in results if r.stream),
+        "completed": len(completed),
+        "disconnected": sum(1 for r in results if r.disconnected),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "error_kinds": error_kinds,
+        "offered_rate": round(len(results) / send_duration, 2) if send_duration else None,
+        "ttft_ms": distribution([r.ttft for r in results if r.ttft is not None and r.stream]),
+        "inter_token_ms": distribution([g for r in results for g in r.gaps]),
+        "total_ms": distribution([r.total for r in completed if r.total is not None]),
+        "send_lag_ms": distribution([r.send_lag for r in results]),
+    }
+
+
+def format_summary(summary: dict) -> str:
+    lines = [
+        f"requests={summary['requests']} stream={summary['stream']} "
+        f"completed={summary['completed']} disconnected={summary['disconnected']} "
+        f"errors={summary['errors']} ({summary['error_rate']:.2%}) "
+        f"offered_rate={summary['offered_rate']}/s",
+        f"{'metric':<15} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}",
+    ]
+    for name in ("ttft_ms", "inter_token_ms", "total_ms", "send_lag_ms"):
+        row = summary[name]
+        cells = " ".join(
+            f"{'-' if row[q] is None else row[q]:>9}" for q in ("p50", "p90", "p99", "max")
+        )
+        lines.append(f"{name:<15} {cells}")
+    for kind, count in summary["error_kinds"].items():
+        lines.append(f"error {kind}: {count}")
+    return "\n".join(lines)
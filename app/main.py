@@ -1,21 +1,91 @@
+import asyncio
 import os
 import sys
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncGenerator, Optional
 
-from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, Request
+from fastapi import Depends, FastAPI, Header, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-
-from app.deepclaude.deepclaude import DeepClaude
-from app.openai_composite import OpenAICompatibleComposite
-from app.utils.auth import verify_api_key
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from app.batch import BatchRunner, interactive_traffic
+from app.clients.adaptive_limit import adaptive_limits
+from app.clients.deadline import DeadlineExceededError, resolve_deadline
+from app.clients.scheduler import current_priority, resolve_priority
+from app.clients.transports import close_transports
+from app.pipeline import Pipeline, create_provider, load_pipelines, route_headers
+from app.websocket import WebSocketSession
+from app.utils.chat_request import ChatRequest, parse_chat_request, read_chat_request
+from app.utils.audit_log import audit_log
+from app.utils.auth import is_admin_key, is_valid_api_key, verify_admin_key, verify_api_key
+from app.utils.event_loop import loop_lag_monitor, shutdown_executor
 from app.utils.logger import logger
-from app.config import load_models_config
+from app.utils.reasoning_cache import reasoning_cache
+from app.utils.reasoning_router import reasoning_router
+from app.utils.resumable import ResumeError, resumable_streams
+from app.utils.usage_ledger import current_api_key, key_id, usage_ledger
+from app.utils import tokenizer
+from app.utils.tracing import TraceMiddleware, span
+from app.utils.metrics import metrics
+from app.utils.profiling import (
+    PROFILE_INTERVAL,
+    PROFILING_ENABLED,
+    Sampler,
+    memory_profiler,
+    profiler,
+)
+from app.config import load_env, load_models_config
 
 # 加载环境变量
-load_dotenv()
+load_env()
+
+# 启动时预热 tokenizer 的最长等待时间（秒），超时后服务照常就绪
+TOKENIZER_WARMUP_TIMEOUT = float(os.getenv("TOKENIZER_WARMUP_TIMEOUT", "10"))
+
+# 启动预热完成后置为 True，供 /ready 使用
+service_ready = False
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global service_ready
+    # 验证日志级别
+    logger.debug("当前日志级别为 DEBUG")
+    logger.info("开始请求")
 
-app = FastAPI(title="DeepClaude API")
+    # 在线程中加载 tokenizer 编码，避免阻塞事件循环
+    try:
+        loaded = await asyncio.wait_for(
+            asyncio.to_thread(tokenizer.warmup), TOKENIZER_WARMUP_TIMEOUT
+        )
+        if not loaded:
+            logger.warning("tokenizer 未加载，usage 将按字符数估算")
+    except asyncio.TimeoutError:
+        logger.warning(f"tokenizer 预热超过 {TOKENIZER_WARMUP_TIMEOUT} 秒，继续在后台加载")
+    if PROFILING_ENABLED:
+        profiler.install()
+        logger.warning("性能分析接口已启用")
+    # 打开用量存储并启动后台写入线程（未启用时不做任何事）
+    await asyncio.to_thread(usage_ledger.start)
+    # 启动审计日志的后台写入线程（未启用时不做任何事）
+    await asyncio.to_thread(audit_log.start)
+    # 监控事件循环延迟
+    loop_lag_monitor.start()
+    service_ready = True
+    yield
+    service_ready = False
+    await loop_lag_monitor.stop()
+    # 取消仍在等待续传的流水线
+    await resumable_streams.close()
+    # 关闭共享的上游连接池
+    await close_transports()
+    # 写入剩余的用量
+    await asyncio.to_thread(usage_ledger.stop)
+    await asyncio.to_thread(audit_log.stop)
+    await asyncio.to_thread(shutdown_executor)
+
+
+app = FastAPI(title="DeepClaude API", lifespan=lifespan)
 
 # 从环境变量获取 CORS配置, API 密钥、地址以及模型名称
 ALLOW_ORIGINS = os.getenv("ALLOW_ORIGINS", "*")
@@ -38,6 +108,32 @@ OPENAI_COMPOSITE_API_URL = os.getenv("OPENAI_COMPOSITE_API_URL")
 OPENAI_COMPOSITE_MODEL = os.getenv("OPENAI_COMPOSITE_MODEL")
 
 IS_ORIGIN_REASONING = os.getenv("IS_ORIGIN_REASONING", "True").lower() == "true"
+# 非原生推理模型的推理标签
+THINK_TAGS = (
+    os.getenv("THINK_OPEN_TAG", "<think>"),
+    os.getenv("THINK_CLOSE_TAG", "</think>"),
+)
+THINK_IMPLICIT_OPEN = os.getenv("THINK_IMPLICIT_OPEN", "false").lower() == "true"
+
+# 上游传输: aiohttp (HTTP/1.1), http2 (HTTP/2, 需要 httpx[http2]) 或 h2c (明文 HTTP/2)
+DEEPSEEK_TRANSPORT = os.getenv("DEEPSEEK_TRANSPORT", "aiohttp")
+CLAUDE_TRANSPORT = os.getenv("CLAUDE_TRANSPORT", "aiohttp")
+OPENAI_COMPOSITE_TRANSPORT = os.getenv("OPENAI_COMPOSITE_TRANSPORT", "aiohttp")
+
+# 上游停滞或连接失败且尚未收到数据时依次尝试的备用地址，逗号分隔
+def _url_list(name: str) -> list:
+    return [url.strip() for url in os.getenv(name, "").split(",") if url.strip()]
+
+
+DEEPSEEK_API_URL_FALLBACKS = _url_list("DEEPSEEK_API_URL_FALLBACKS")
+CLAUDE_API_URL_FALLBACKS = _url_list("CLAUDE_API_URL_FALLBACKS")
+OPENAI_COMPOSITE_API_URL_FALLBACKS = _url_list("OPENAI_COMPOSITE_API_URL_FALLBACKS")
+
+# 原生推理格式下直接转发上游推理 chunk，只替换 id / created / model
+REASONING_PASSTHROUGH = os.getenv("REASONING_PASSTHROUGH", "false").lower() == "true"
+
+# 流式编排模式: tasks (多任务 + 队列) 或 lean (单个异步生成器)
+STREAM_ORCHESTRATOR = os.getenv("STREAM_ORCHESTRATOR", "tasks").lower()
 
 # CORS设置
 allow_origins_list = (
@@ -51,37 +147,53 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 请求阶段追踪，需位于 CORS 之外以便 Server-Timing 覆盖完整请求
+app.add_middleware(TraceMiddleware)
 
-# 创建 DeepClaude 实例, 提出为Global变量
 if not DEEPSEEK_API_KEY or not CLAUDE_API_KEY:
     logger.critical("请设置环境变量 CLAUDE_API_KEY 和 DEEPSEEK_API_KEY")
     sys.exit(1)
 
-deep_claude = DeepClaude(
-    DEEPSEEK_API_KEY,
-    CLAUDE_API_KEY,
-    DEEPSEEK_API_URL,
-    CLAUDE_API_URL,
-    CLAUDE_PROVIDER,
-    IS_ORIGIN_REASONING,
-)
-
-# 创建 OpenAICompatibleComposite 实例
-# if not DEEPSEEK_API_KEY or not OPENAI_COMPOSITE_API_KEY:
-#     logger.critical("请设置环境变量 OPENAI_COMPOSITE_API_KEY 和 DEEPSEEK_API_KEY")
-#     sys.exit(1)
-
-openai_composite = OpenAICompatibleComposite(
-    DEEPSEEK_API_KEY,
-    OPENAI_COMPOSITE_API_KEY,
-    DEEPSEEK_API_URL,
-    OPENAI_COMPOSITE_API_URL,
-    IS_ORIGIN_REASONING,
-)
-
-# 验证日志级别
-logger.debug("当前日志级别为 DEBUG")
-logger.info("开始请求")
+# 由环境变量配置的内置提供方，流水线在 models.yaml 的 pipelines 中按名称引用
+providers = {
+    "deepseek": create_provider(
+        "deepseek",
+        "deepseek",
+        DEEPSEEK_API_KEY,
+        DEEPSEEK_API_URL,
+        DEEPSEEK_MODEL,
+        DEEPSEEK_TRANSPORT,
+        DEEPSEEK_API_URL_FALLBACKS,
+        is_origin_reasoning=IS_ORIGIN_REASONING,
+        think_tags=THINK_TAGS,
+        think_implicit_open=THINK_IMPLICIT_OPEN,
+        passthrough=REASONING_PASSTHROUGH,
+    ),
+    "claude": create_provider(
+        "claude",
+        "claude",
+        CLAUDE_API_KEY,
+        CLAUDE_API_URL,
+        ENV_CLAUDE_MODEL or "claude-3-5-sonnet-20241022",
+        CLAUDE_TRANSPORT,
+        CLAUDE_API_URL_FALLBACKS,
+        claude_provider=CLAUDE_PROVIDER,
+    ),
+    # 未指定模型，使用请求中的模型名称
+    "openai_composite": create_provider(
+        "openai_composite",
+        "openai",
+        OPENAI_COMPOSITE_API_KEY,
+        OPENAI_COMPOSITE_API_URL,
+        None,
+        OPENAI_COMPOSITE_TRANSPORT,
+        OPENAI_COMPOSITE_API_URL_FALLBACKS,
+    ),
+}
+pipelines = load_pipelines(load_models_config(), providers, STREAM_ORCHESTRATOR)
+
+# 批量任务执行器，每个条目走与 /v1/chat/completions 相同的非流式流水线
+batch_runner = BatchRunner(lambda body: complete_chat(None, parse_chat_request(body)))
 
 
 @app.get("/", dependencies=[Depends(verify_api_key)])
@@ -90,6 +202,14 @@ async def root():
     return {"message": "Welcome to DeepClaude API"}
 
 
+@app.get("/ready")
+async def ready():
+    """就绪检查，启动预热完成前返回 503，无需鉴权"""
+    if not service_ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+
 @app.get("/v1/models")
 async def list_models():
     """
@@ -104,6 +224,12 @@ async def list_models():
         return {"error": str(e)}
 
 
+@app.get("/metrics", dependencies=[Depends(verify_api_key)])
+async def get_metrics():
+    """导出 Prometheus 文本格式的运行指标"""
+    return PlainTextResponse(metrics.render())
+
+
 @app.post("/v1/chat/completions", dependencies=[Depends(verify_api_key)])
 async def chat_completions(request: Request):
     """处理聊天完成请求，支持流式和非流式输出
@@ -116,88 +242,351 @@ async def chat_completions(request: Request):
     - top_p: top_p (可选)
     - presence_penalty: 话题新鲜度（可选）
     - frequency_penalty: 频率惩罚度（可选）
+    - skip_reasoning: 是否跳过推理阶段（可选，未指定时由推理路由决定）
+    - timeout: 截止时间，从收到请求开始的秒数（可选，也可通过 X-Request-Timeout 请求头指定）
+
+    启用续传（SSE_RESUME_ENABLED）时，带 Last-Event-ID 请求头的请求接上之前的流，忽略请求体。
+    上游名额调度的优先级可通过 X-Priority 请求头（high / normal / low）指定。
+    模型的流水线配置了降级链时，实际经过的流水线通过 X-Pipeline-Route / X-Pipeline-Fallback
+    响应头返回；流式响应在首个 chunk 产生（降级链确定）后才发送响应头。
     """
 
+    received = asyncio.get_running_loop().time()
+    profile_sampler: Optional[Sampler] = None
+    profile_headers = None
+    # 上游名额的调度优先级，流水线在本请求的上下文中运行
+    current_priority.set(resolve_priority(current_api_key.get(), request.headers.get("x-priority")))
     try:
-        # 1. 获取基础信息
-        body = await request.json()
-        messages = body.get("messages")
-        model = body.get("model")
-
-        if not model:
-            raise ValueError("必须指定模型名称")
-
-        # 2. 获取并验证参数
-        model_arg = get_and_validate_params(body)
-        stream = model_arg[4]  # 获取 stream 参数
-
-        # 3. 根据模型选择不同的处理方式
-        if model == "deepclaude":
-            # 使用 DeepClaude
-            claude_model = ENV_CLAUDE_MODEL if ENV_CLAUDE_MODEL else "claude-3-5-sonnet-20241022"
-            if stream:
-                return StreamingResponse(
-                    deep_claude.chat_completions_with_stream(
-                        request=request,  # Pass the request object
-                        messages=messages,
-                        model_arg=model_arg[:4],
-                        deepseek_model=DEEPSEEK_MODEL,
-                        claude_model=claude_model,
-                    ),
-                    media_type="text/event-stream",
-                )
-            else:
-                return await deep_claude.chat_completions_without_stream(
-                    request=request,
-                    messages=messages,
-                    model_arg=model_arg[:4],
-                    deepseek_model=DEEPSEEK_MODEL,
-                    claude_model=claude_model,
-                )
+        last_event_id = request.headers.get("last-event-id")
+        if resumable_streams.enabled and last_event_id:
+            return resume_chat_stream(last_event_id)
+
+        with span("parse"):
+            # 1. 解码并校验请求体
+            chat = await read_chat_request(await request.body())
+        # 截止时间从收到请求开始计算，到达时取消所有上游请求
+        deadline = resolve_deadline(request.headers.get("x-request-timeout"), chat.timeout, received)
+        # 有降级链时记录实际经过的流水线
+        route = [] if pipelines.get(chat.model).fallbacks else None
+
+        # 单请求性能分析，需要同时提供管理密钥
+        if PROFILING_ENABLED and "x-profile" in request.headers:
+            if not is_admin_key(request.headers.get("x-admin-key")):
+                return JSONResponse(status_code=403, content={"error": "需要管理密钥"})
+            profile_sampler = profiler.start_request(request.headers["x-profile"] or "wall")
+            profile_headers = {"X-Profile-Id": profile_sampler.id}
+
+        if not chat.stream:
+            await interactive_traffic.interactive_started()
+            try:
+                result = await complete_chat(request, chat, route, deadline)
+            finally:
+                await interactive_traffic.interactive_finished()
+            if profile_sampler is not None:
+                profiler.finish_request(profile_sampler)
+            if route:
+                profile_headers = {**(profile_headers or {}), **route_headers(route)}
+            if profile_headers:
+                return JSONResponse(content=result, headers=profile_headers)
+            return result
+
+        # 2. 根据模型选择不同的处理方式
+        if resumable_streams.enabled:
+            # 流水线在后台任务中运行，客户端断开后在宽限期内仍可续传
+            stream_body = resumable_streams.open(
+                track_interactive(open_chat_stream(None, chat, route, deadline)),
+                key_id(current_api_key.get()),
+            )
         else:
-            # 使用 OpenAI 兼容组合模型
-            if stream:
-                return StreamingResponse(
-                    openai_composite.chat_completions_with_stream(
-                        request=request,
-                        messages=messages,
-                        model_arg=model_arg[:4],
-                        deepseek_model=DEEPSEEK_MODEL,
-                        target_model=model,
-                    ),
-                    media_type="text/event-stream",
-                )
-            else:
-                return await openai_composite.chat_completions_without_stream(
-                    request=request,
-                    messages=messages,
-                    model_arg=model_arg[:4],
-                    deepseek_model=DEEPSEEK_MODEL,
-                    target_model=model,
-                )
-
+            stream_body = track_interactive(open_chat_stream(request, chat, route, deadline))
+        if profile_sampler is not None:
+            stream_body = profile_stream(stream_body, profile_sampler)
+        if route is not None:
+            # 降级在输出首个 chunk 之前确定，等到首个 chunk 后再发送响应头
+            stream_body = await prefetch(stream_body)
+            profile_headers = {**(profile_headers or {}), **route_headers(route)}
+        return StreamingResponse(
+            stream_body, media_type="text/event-stream", headers=profile_headers
+        )
+
+    except DeadlineExceededError as e:
+        if profile_sampler is not None:
+            profiler.finish_request(profile_sampler)
+        return JSONResponse(status_code=504, content={"error": str(e)})
     except Exception as e:
+        if profile_sampler is not None:
+            profiler.finish_request(profile_sampler)
         logger.error(f"处理请求时发生错误: {e}")
         return {"error": str(e)}
 
 
-def get_and_validate_params(body):
-    """提取获取和验证请求参数的函数"""
-    # TODO: 默认值设定允许自定义
-    temperature: float = body.get("temperature", 0.5)
-    top_p: float = body.get("top_p", 0.9)
-    presence_penalty: float = body.get("presence_penalty", 0.0)
-    frequency_penalty: float = body.get("frequency_penalty", 0.0)
-    stream: bool = body.get("stream", False)
-
-    if "sonnet" in body.get(
-        "model", ""
-    ):  # Only Sonnet 设定 temperature 必须在 0 到 1 之间
-        if (
-            not isinstance(temperature, (float))
-            or temperature < 0.0
-            or temperature > 1.0
-        ):
-            raise ValueError("Sonnet 设定 temperature 必须在 0 到 1 之间")
-
-    return (temperature, top_p, presence_penalty, frequency_penalty, stream)
+def resume_chat_stream(last_event_id: str):
+    """接上 Last-Event-ID 对应的流，无法续传时返回错误响应"""
+    try:
+        stream_body = resumable_streams.resume(last_event_id, key_id(current_api_key.get()))
+    except ResumeError as e:
+        return JSONResponse(status_code=e.status, content={"error": str(e)})
+    return StreamingResponse(stream_body, media_type="text/event-stream")
+
+
+def lookup_reasoning_cache(chat: ChatRequest, pipeline: Pipeline, skip_reasoning: bool):
+    """查找推理缓存，跳过推理、流水线没有缓存阶段或未启用缓存时返回 None"""
+    reasoning_model = pipeline.cache_model(chat.model)
+    if skip_reasoning or reasoning_model is None:
+        return None
+    return reasoning_cache.slot(chat.messages, chat.model, reasoning_model, chat.params)
+
+
+def open_chat_stream(
+    request: Optional[Request],
+    chat: ChatRequest,
+    route: Optional[list] = None,
+    deadline: Optional[float] = None,
+) -> AsyncGenerator[bytes, None]:
+    """根据模型选择流水线，返回 SSE 格式的流式输出
+
+    Args:
+        request: 当前请求对象，WebSocket 流为 None（由调用方取消生成器）
+        chat: 校验后的请求
+        route: 传入列表时记录实际经过的流水线
+        deadline: 请求的截止时间（事件循环时间），None 表示不限制
+
+    Raises:
+        ValueError: 模型没有可用的流水线
+    """
+    pipeline = pipelines.get(chat.model)
+    # 判断是否跳过推理阶段，不跳过时查找近似请求的推理缓存
+    skip_reasoning = reasoning_router.route(chat).skip
+    cache_slot = lookup_reasoning_cache(chat, pipeline, skip_reasoning)
+    return pipeline.stream(
+        request, chat.messages, chat.params, chat.model, skip_reasoning, cache_slot, route, deadline
+    )
+
+
+def open_websocket_stream(body: dict) -> AsyncGenerator[bytes, None]:
+    """WebSocket 上的单个对话流，始终流式输出
+
+    Raises:
+        ValueError: 请求参数无效
+    """
+    chat = parse_chat_request(body)
+    return track_interactive(
+        open_chat_stream(None, chat, deadline=resolve_deadline(None, chat.timeout))
+    )
+
+
+async def complete_chat(
+    request: Optional[Request],
+    chat: ChatRequest,
+    route: Optional[list] = None,
+    deadline: Optional[float] = None,
+) -> dict:
+    """执行一次非流式聊天补全
+
+    Args:
+        request: 当前请求对象，批量任务为 None
+        chat: 校验后的请求
+        route: 传入列表时记录实际经过的流水线
+        deadline: 请求的截止时间（事件循环时间），None 表示不限制（批量任务不使用截止时间）
+
+    Returns:
+        dict: OpenAI 格式的完整响应
+    """
+    pipeline = pipelines.get(chat.model)
+    skip_reasoning = reasoning_router.route(chat).skip
+    cache_slot = lookup_reasoning_cache(chat, pipeline, skip_reasoning)
+    return await pipeline.complete(
+        chat.messages, chat.params, chat.model, skip_reasoning, cache_slot, route, deadline
+    )
+
+
+async def track_interactive(stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """在流式响应期间把请求计入交互流量，供批量任务让出并发"""
+    await interactive_traffic.interactive_started()
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await interactive_traffic.interactive_finished()
+
+
+async def prefetch(stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """等待流的首个 chunk，返回从该 chunk 开始的流"""
+    first = await anext(stream, None)
+
+    async def chained():
+        async with aclosing(stream):
+            if first is not None:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+
+    return chained()
+
+
+async def profile_stream(
+    stream: AsyncGenerator[bytes, None], sampler: Sampler
+) -> AsyncGenerator[bytes, None]:
+    """流式响应结束时结束单请求性能分析"""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        profiler.finish_request(sampler)
+
+
+@app.websocket("/v1/chat/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    authorization: Optional[str] = Header(None),
+    api_key: Optional[str] = None,
+):
+    """在一条连接上并发处理多个对话流，协议见 app/websocket/multiplexer.py
+
+    可以在握手时通过 Authorization 请求头或 api_key 查询参数鉴权，
+    否则连接后的首条消息必须是 {"type": "auth", "api_key": ...}。
+    """
+    handshake_key = authorization or api_key
+    session = WebSocketSession(
+        websocket,
+        open_websocket_stream,
+        is_valid_api_key,
+        api_key=handshake_key if is_valid_api_key(handshake_key) else None,
+    )
+    await session.run()
+
+
+@app.get("/v1/usage", dependencies=[Depends(verify_api_key)])
+async def get_usage(
+    model: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    group: str = "day",
+):
+    """查询当前 API 密钥的用量汇总
+
+    Args:
+        model: 只统计指定模型
+        start: 起始 Unix 时间戳（含）
+        end: 结束 Unix 时间戳（不含）
+        group: 汇总粒度 minute, hour, day 或 total
+    """
+    if not usage_ledger.enabled:
+        return JSONResponse(status_code=404, content={"error": "用量统计未启用"})
+    if group not in ("minute", "hour", "day", "total"):
+        return JSONResponse(status_code=400, content={"error": f"不支持的汇总粒度: {group}"})
+    data = await asyncio.to_thread(
+        usage_ledger.query,
+        key=key_id(current_api_key.get()),
+        model=model,
+        start=start,
+        end=end,
+        group=group,
+    )
+    return {"object": "list", "data": data}
+
+
+@app.post("/v1/batch", dependencies=[Depends(verify_api_key)])
+async def create_batch(request: Request, job_id: Optional[str] = None):
+    """提交批量请求
+
+    请求体为 JSONL，每行一个聊天请求（或 {"custom_id": ..., "body": {...}}）。
+    结果按完成顺序以 JSONL 流式返回；使用相同的 job_id 重新提交时跳过已完成的条目。
+    批量条目始终以 low 优先级申请上游名额。
+    """
+    current_priority.set("low")
+    job_id = job_id or batch_runner.new_job_id()
+    try:
+        payload = await request.body()
+        batch_runner.parse_items(payload)
+        batch_runner.job_path(job_id)
+    except ValueError as e:
+        logger.error(f"批量请求无效: {e}")
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if batch_runner.is_active(job_id):
+        return JSONResponse(status_code=409, content={"error": f"批量任务 {job_id} 正在执行"})
+
+    return StreamingResponse(
+        batch_runner.run(job_id, payload),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Job-Id": job_id},
+    )
+
+
+@app.get("/v1/batch/{job_id}", dependencies=[Depends(verify_api_key)])
+async def get_batch(job_id: str):
+    """查询批量任务已记录的结果"""
+    try:
+        results = batch_runner.load_results(job_id)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    completed = sum(1 for r in results.values() if r.get("status") == "completed")
+    return {
+        "id": job_id,
+        "completed": completed,
+        "failed": len(results) - completed,
+        "results": list(results.values()),
+    }
+
+
+if adaptive_limits.enabled:
+
+    @app.get("/admin/upstream-limits", dependencies=[Depends(verify_admin_key)])
+    async def upstream_limits():
+        """各上游地址当前的自适应并发上限、排队情况和调整历史"""
+        return adaptive_limits.snapshot()
+
+
+if PROFILING_ENABLED:
+
+    @app.post("/admin/profile/start", dependencies=[Depends(verify_admin_key)])
+    async def start_profile(
+        seconds: float = 30, mode: str = "wall", interval: float = PROFILE_INTERVAL
+    ):
+        """开始对事件循环线程采样，最多持续 seconds 秒"""
+        try:
+            sampler = profiler.start(mode, seconds, interval)
+        except (RuntimeError, ValueError) as e:
+            return JSONResponse(status_code=409, content={"error": str(e)})
+        return {"id": sampler.id, "mode": sampler.mode, "seconds": sampler.max_seconds}
+
+    @app.post("/admin/profile/stop", dependencies=[Depends(verify_admin_key)])
+    async def stop_profile():
+        """停止采样并返回 collapsed stack 文本"""
+        sampler = await asyncio.to_thread(profiler.stop)
+        if sampler is None:
+            return JSONResponse(status_code=404, content={"error": "没有正在进行的采样"})
+        return PlainTextResponse(
+            profiler.results.get(sampler.id),
+            headers={"X-Profile-Id": sampler.id, "X-Profile-Samples": str(sampler.samples)},
+        )
+
+    @app.get("/admin/profile/{profile_id}", dependencies=[Depends(verify_admin_key)])
+    async def get_profile(profile_id: str):
+        """获取已结束的采样（包括单请求分析）的 collapsed stack 文本"""
+        collapsed = profiler.results.get(profile_id)
+        if collapsed is None:
+            return JSONResponse(status_code=404, content={"error": "分析结果不存在"})
+        return PlainTextResponse(collapsed)
+
+    @app.post("/admin/tracemalloc/start", dependencies=[Depends(verify_admin_key)])
+    async def start_tracemalloc(frames: int = 1):
+        """开始 tracemalloc 追踪并记录基线快照"""
+        await asyncio.to_thread(memory_profiler.start, frames)
+        return {"status": "tracing", "frames": frames}
+
+    @app.get("/admin/tracemalloc/diff", dependencies=[Depends(verify_admin_key)])
+    async def tracemalloc_diff(limit: int = 30, key: str = "lineno"):
+        """返回与上一次快照相比的内存增长，并把本次快照作为新的基线"""
+        if key not in ("lineno", "filename", "traceback"):
+            return JSONResponse(status_code=400, content={"error": f"不支持的 key: {key}"})
+        try:
+            return PlainTextResponse(await asyncio.to_thread(memory_profiler.diff, limit, key))
+        except RuntimeError as e:
+            return JSONResponse(status_code=409, content={"error": str(e)})
+
+    @app.post("/admin/tracemalloc/stop", dependencies=[Depends(verify_admin_key)])
+    async def stop_tracemalloc():
+        memory_profiler.stop()
+        return {"status": "stopped"}
+
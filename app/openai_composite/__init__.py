@@ -1,5 +0,0 @@
-"""OpenAI 兼容的组合模型服务包"""
-
-from .openai_composite import OpenAICompatibleComposite
-
-__all__ = ["OpenAICompatibleComposite"]
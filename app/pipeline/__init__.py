@@ -0,0 +1,15 @@
+"""声明式多阶段流水线"""
+
+from .definition import load_pipelines
+from .engine import Pipeline, PipelineRegistry, StageSpec, route_headers
+from .providers import Provider, create_provider
+
+__all__ = [
+    "Pipeline",
+    "PipelineRegistry",
+    "Provider",
+    "StageSpec",
+    "create_provider",
+    "load_pipelines",
+    "route_headers",
+]
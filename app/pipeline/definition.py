@@ -0,0 +1,200 @@
+"""从 models.yaml 加载流水线定义
+
+配置格式：
+
+    providers:            # 可选，内置的 deepseek / claude / openai_composite 由环境变量配置
+      critic:
+        kind: openai      # deepseek / claude / openai
+        api_key_env: CRITIC_API_KEY
+        api_url: https://example.com/v1/chat/completions
+        model: critic-model
+
+    pipelines:
+      deepclaude:         # 按请求的模型名选择，"*" 匹配其他所有模型
+        stages:
+          - id: reasoning
+            provider: deepseek
+            cache: true   # 使用推理缓存（最多一个 deepseek 阶段）
+          - id: answer
+            provider: claude
+            inputs: [reasoning]
+        fallback:         # 可选，过载时的降级链，见 fallback.py
+          pipelines: [deepseek-r1]
+          queue_wait: 5
+          ttft_budget: 20
+        reasoning_share: 0.5  # 可选，请求有截止时间时回答之前的阶段占用的时间比例
+
+阶段字段：
+- id: 阶段名称，在流水线内唯一
+- provider: 提供方名称
+- model: 模型名称，省略时使用提供方的默认模型，提供方也没有默认模型时使用请求中的模型名
+- inputs: 依赖的阶段，只能引用之前定义的阶段；输出会拼接到本阶段最后一条用户消息中
+- prompt: 替换最后一条用户消息的模板，可使用 {original} 和 {reasoning}
+- cache: 是否使用推理缓存
+
+没有被其他阶段引用的阶段是最终回答阶段，每条流水线有且只有一个，且必须是最后一个阶段；
+其余阶段的输出以 reasoning_content 流式返回。推理模型作为最终回答阶段时同时输出推理内容和回答。
+"""
+
+import os
+from typing import Dict, Optional, Tuple
+
+from app.clients.deadline import DEADLINE_REASONING_SHARE
+
+from .engine import Pipeline, PipelineRegistry, StageSpec
+from .fallback import FallbackPolicy
+from .providers import Provider, create_provider
+
+# 提供方配置中不作为客户端选项传递的字段
+_PROVIDER_FIELDS = ("kind", "api_key_env", "api_url", "api_url_env", "model", "transport", "fallback_urls")
+
+
+def load_providers(config: dict, builtin: Dict[str, Provider]) -> Dict[str, Provider]:
+    """合并内置提供方和配置中的提供方
+
+    Raises:
+        ValueError: 提供方配置无效
+    """
+    providers = dict(builtin)
+    for name, spec in (config.get("providers") or {}).items():
+        if not isinstance(spec, dict) or "kind" not in spec:
+            raise ValueError(f"提供方 {name} 缺少 kind")
+        api_url = spec.get("api_url")
+        if spec.get("api_url_env"):
+            api_url = os.getenv(spec["api_url_env"], api_url)
+        providers[name] = create_provider(
+            name,
+            spec["kind"],
+            os.getenv(spec["api_key_env"]) if spec.get("api_key_env") else None,
+            api_url,
+            spec.get("model"),
+            spec.get("transport", "aiohttp"),
+            spec.get("fallback_urls") or (),
+            **{key: value for key, value in spec.items() if key not in _PROVIDER_FIELDS},
+        )
+    return providers
+
+
+def parse_stages(name: str, spec: dict, providers: Dict[str, Provider]) -> Tuple[StageSpec, ...]:
+    """解析并校验一条流水线的阶段
+
+    Raises:
+        ValueError: 阶段定义无效
+    """
+    items = spec.get("stages") if isinstance(spec, dict) else None
+    if not items:
+        raise ValueError(f"流水线 {name} 没有定义阶段")
+
+    stages = []
+    defined = set()
+    for item in items:
+        stage_id = item.get("id")
+        if not stage_id or stage_id in defined:
+            raise ValueError(f"流水线 {name} 的阶段 id 缺失或重复: {stage_id}")
+        provider = providers.get(item.get("provider"))
+        if provider is None:
+            raise ValueError(
+                f"流水线 {name} 的阶段 {stage_id} 引用了未知的提供方 {item.get('provider')}"
+            )
+        inputs = tuple(item.get("inputs") or ())
+        for input_id in inputs:
+            if input_id not in defined:
+                raise ValueError(
+                    f"流水线 {name} 的阶段 {stage_id} 只能引用之前定义的阶段，{input_id} 未定义"
+                )
+        cache = bool(item.get("cache", False))
+        if cache and provider.kind != "deepseek":
+            raise ValueError(f"流水线 {name} 的阶段 {stage_id}: 只有 deepseek 阶段可以使用推理缓存")
+        defined.add(stage_id)
+        stages.append(
+            StageSpec(stage_id, provider, item.get("model"), inputs, item.get("prompt"), cache)
+        )
+
+    consumed = {input_id for stage in stages for input_id in stage.inputs}
+    sinks = [stage.id for stage in stages if stage.id not in consumed]
+    # 输入只能引用之前的阶段，最后一个阶段必然没有被引用
+    if len(sinks) != 1:
+        raise ValueError(
+            f"流水线 {name} 必须有且只有一个最终回答阶段（没有被其他阶段引用的阶段），当前为 {sinks}"
+        )
+    if stages[-1].cache:
+        raise ValueError(f"流水线 {name} 的最终回答阶段不能使用推理缓存")
+    if sum(stage.cache for stage in stages) > 1:
+        raise ValueError(f"流水线 {name} 最多只能有一个阶段使用推理缓存")
+    stages[-1] = stages[-1]._replace(sink=True)
+    return tuple(stages)
+
+
+def _seconds(name: str, spec: dict, key: str) -> Optional[float]:
+    value = spec.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"流水线 {name} 的 fallback.{key} 必须是大于 0 的秒数")
+    return float(value)
+
+
+def parse_fallback(name: str, spec: dict, pipelines: Dict[str, Pipeline]) -> Optional[FallbackPolicy]:
+    """解析并校验流水线的降级链，没有配置时返回 None
+
+    Raises:
+        ValueError: 降级链无效
+    """
+    fallback = spec.get("fallback")
+    if fallback is None:
+        return None
+    if not isinstance(fallback, dict) or not fallback.get("pipelines"):
+        raise ValueError(f"流水线 {name} 的 fallback 缺少 pipelines")
+    names = tuple(fallback["pipelines"])
+    for target in names:
+        if target not in pipelines or target == name:
+            raise ValueError(f"流水线 {name} 的降级目标 {target} 未定义或是自身")
+    if len(set(names)) != len(names):
+        raise ValueError(f"流水线 {name} 的降级链中有重复的流水线")
+    return FallbackPolicy(
+        names, _seconds(name, fallback, "queue_wait"), _seconds(name, fallback, "ttft_budget")
+    )
+
+
+def parse_reasoning_share(name: str, spec: dict) -> float:
+    """请求有截止时间时，最终回答之前的阶段占用的时间比例
+
+    Raises:
+        ValueError: 比例不在 (0, 1] 之间
+    """
+    value = spec.get("reasoning_share", DEADLINE_REASONING_SHARE)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value <= 1:
+        raise ValueError(f"流水线 {name} 的 reasoning_share 必须在 0 到 1 之间")
+    return float(value)
+
+
+def load_pipelines(
+    config: dict, builtin: Dict[str, Provider], orchestrator: str = "tasks"
+) -> PipelineRegistry:
+    """按 models.yaml 的 pipelines 配置创建流水线
+
+    Args:
+        config: models.yaml 的内容
+        builtin: 由环境变量配置的内置提供方
+        orchestrator: 流式编排模式
+
+    Raises:
+        ValueError: 没有 pipelines 配置或配置无效
+    """
+    if not config.get("pipelines"):
+        raise ValueError("models.yaml 中没有定义 pipelines")
+    providers = load_providers(config, builtin)
+    pipelines = {
+        name: Pipeline(
+            name,
+            parse_stages(name, spec, providers),
+            orchestrator,
+            parse_reasoning_share(name, spec),
+        )
+        for name, spec in config["pipelines"].items()
+    }
+    for name, spec in config["pipelines"].items():
+        policy = parse_fallback(name, spec, pipelines)
+        if policy is not None:
+            pipelines[name].set_fallbacks(policy, [pipelines[target] for target in policy.pipelines])
+    return PipelineRegistry(pipelines)
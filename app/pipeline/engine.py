@@ -0,0 +1,743 @@
+"""声明式多阶段流水线的执行
+
+互不依赖的阶段并发执行；每个阶段的输出在产生时立即流式返回，
+非最终阶段以 reasoning_content 返回（多个推理阶段交替输出时在切换处插入 [阶段名] 标记），
+最终回答阶段以 content 返回。
+
+编排模式：
+- lean: 阶段依次依赖（链式）时直接在输出生成器中依次消费上游流，不创建任务；
+  否则同 tasks，但不监控客户端连接
+- tasks: 每个阶段一个任务，阶段在自身依赖完成后立即开始，输出汇入有界队列，并监控客户端连接
+
+客户端断开、调用方取消生成器或某个阶段中止流水线时，所有阶段的任务和上游流随之取消。
+
+请求指定了截止时间（见 app/clients/deadline.py）时，最终回答之前的阶段共用前 reasoning_share 的时间，
+到达后保留已收到的输出，回答阶段照常开始；回答阶段到达截止时间时以错误结束请求。
+
+配置了降级链（见 fallback.py）的流水线在输出任何数据之前遇到过载时，改用链上的下一条流水线。
+实际经过的流水线记录在调用方传入的 route 中，响应的 model 字段为实际回答的模型。
+"""
+
+import asyncio
+import time
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import Request
+
+from app.clients.deadline import (
+    DEADLINE_REASONING_SHARE,
+    DeadlineExceededError,
+    current_deadline,
+    deadline_exceeded,
+    split_deadline,
+)
+from app.clients.stall import StreamStalledError
+from app.utils.chat_request import SamplingParams
+from app.utils.audit_log import audit_log
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.prompt_prefix import CacheUsage
+from app.utils.reasoning_cache import CacheSlot
+from app.utils.sse import ChunkEncoder, error_chunk
+from app.utils.stream_budget import (
+    STREAM_QUEUE_SIZE,
+    BudgetExceededError,
+    ReasoningBuffer,
+    memory_budget,
+)
+from app.utils.tokenizer import count_tokens_offloaded
+from app.utils.usage_ledger import usage_ledger
+
+from .fallback import FailoverError, FallbackPolicy, admission_reason, failover_reason
+from .providers import Provider
+
+DONE = b"data: [DONE]\n\n"
+
+# 最终回答阶段中不作为回答输出的类型
+_SINK_SIDE_EVENTS = frozenset(("usage", "reasoning", "reasoning_frame"))
+
+# 实际经过的流水线：(流水线名称, 降级原因)，最后一项为实际回答的流水线，原因为 None
+Route = List[Tuple[str, Optional[str]]]
+
+
+def route_headers(route: Route) -> Dict[str, str]:
+    """实际经过的流水线对应的响应头"""
+    headers = {"X-Pipeline-Route": ">".join(name for name, _ in route)}
+    reasons = [reason for _, reason in route if reason]
+    if reasons:
+        headers["X-Pipeline-Fallback"] = ",".join(reasons)
+    return headers
+
+
+class StageSpec(NamedTuple):
+    """流水线中的一个阶段"""
+
+    id: str
+    provider: Provider
+    # None 表示使用提供方的默认模型
+    model: Optional[str]
+    inputs: Tuple[str, ...]
+    prompt: Optional[str]
+    cache: bool
+    # 是否为最终回答阶段
+    sink: bool = False
+
+
+class _Run:
+    """一次请求在流水线中的全部状态"""
+
+    __slots__ = (
+        "chat_id", "created", "model", "messages", "params", "models", "encoders", "budget",
+        "buffers", "results", "answer_parts", "cache_slot", "skip", "lenient",
+        "labelled", "last_label", "aborted", "disconnected", "usage", "armed", "emitted",
+        "failover", "deadline", "reasoning_deadline",
+    )
+
+    def __init__(
+        self,
+        stages: Sequence[StageSpec],
+        messages: list,
+        params: SamplingParams,
+        model: str,
+        skip_reasoning: bool,
+        cache_slot: Optional[CacheSlot],
+        lenient: bool,
+        armed: bool = False,
+        deadline: Optional[float] = None,
+        reasoning_share: float = DEADLINE_REASONING_SHARE,
+    ):
+        self.chat_id = f"chatcmpl-{hex(int(time.time() * 1000))[2:]}"
+        self.created = int(time.time())
+        # 请求中的模型名称
+        self.model = model
+        self.messages = messages
+        self.params = params
+        self.models = {
+            stage.id: stage.model or stage.provider.default_model or model for stage in stages
+        }
+        answer_model = self.models[stages[-1].id]
+        self.encoders = {
+            stage.id: ChunkEncoder(self.chat_id, self.created, self.models[stage.id], answer_model)
+            for stage in stages
+        }
+        self.budget = memory_budget.stream()
+        # 非最终阶段的输出，供后续阶段和用量统计使用；最终回答阶段自身输出推理内容时再创建
+        self.buffers = {
+            stage.id: ReasoningBuffer(self.budget) for stage in stages if not stage.sink
+        }
+        self.results: Dict[str, str] = {}
+        # 各阶段上游报告的输入用量（含缓存命中）
+        self.usage: Dict[str, CacheUsage] = {}
+        self.answer_parts: List[str] = []
+        self.cache_slot = cache_slot
+        self.skip = skip_reasoning
+        # 非流式请求：阶段失败时使用默认提示继续，而不是中止
+        self.lenient = lenient
+        self.labelled = sum(not stage.sink for stage in stages) > 1
+        self.last_label: Optional[str] = None
+        self.aborted = False
+        self.disconnected = False
+        # 降级链上还有后续流水线：输出数据之前遇到过载时放弃本次执行
+        self.armed = armed
+        self.emitted = False
+        self.failover: Optional[str] = None
+        # 截止时间（事件循环时间），None 表示不限制
+        self.deadline = deadline
+        self.reasoning_deadline = (
+            deadline if skip_reasoning else split_deadline(deadline, reasoning_share)
+        )
+
+    def label(self, stage: StageSpec) -> bytes:
+        """多个推理阶段时，在切换到另一个阶段的输出前插入阶段标记"""
+        if not self.labelled or self.last_label == stage.id:
+            return b""
+        prefix = "" if self.last_label is None else "\n\n"
+        self.last_label = stage.id
+        return self.encoders[stage.id].reasoning(f"{prefix}[{stage.id}]\n")
+
+    def stage_input(self, stage: StageSpec) -> Optional[str]:
+        """拼接依赖阶段的输出，没有依赖或跳过推理时返回 None"""
+        if self.skip or not stage.inputs:
+            return None
+        outputs = [(name, self.results.get(name, "")) for name in stage.inputs]
+        outputs = [(name, text) for name, text in outputs if text]
+        if not outputs:
+            logger.warning("未能获取到有效的推理内容，将使用默认提示继续")
+            return stage.provider.fallback_text
+        if len(stage.inputs) == 1:
+            return outputs[0][1]
+        return "\n\n".join(f"[{name}]\n{text}" for name, text in outputs)
+
+    def stage_deadline(self, stage: StageSpec) -> Optional[float]:
+        return self.deadline if stage.sink else self.reasoning_deadline
+
+    def reasoning_parts(self) -> List[str]:
+        return [part for buffer in self.buffers.values() for part in buffer.parts]
+
+
+class Pipeline:
+    """一条声明式流水线"""
+
+    def __init__(
+        self,
+        name: str,
+        stages: Sequence[StageSpec],
+        orchestrator: str = "tasks",
+        reasoning_share: float = DEADLINE_REASONING_SHARE,
+    ):
+        """初始化流水线
+
+        Args:
+            name: 流水线名称
+            stages: 按定义顺序排列的阶段，最后一个为最终回答阶段
+            orchestrator: 流式编排模式，tasks 为多任务 + 队列，lean 为单个异步生成器
+            reasoning_share: 请求有截止时间时，最终回答之前的阶段占用的时间比例
+        """
+        self.name = name
+        self.stages = tuple(stages)
+        self.sink = self.stages[-1]
+        self.orchestrator = orchestrator
+        self.reasoning_share = reasoning_share
+        # 降级链，由 set_fallbacks 设置
+        self.policy: Optional[FallbackPolicy] = None
+        self.fallbacks: Tuple["Pipeline", ...] = ()
+
+        # 每个阶段只依赖前一个阶段时可以在单个生成器中依次执行
+        self.chain = all(
+            stage.inputs == (previous.id,)
+            for previous, stage in zip(self.stages, self.stages[1:])
+        )
+        self._cache_stage = next((stage for stage in self.stages if stage.cache), None)
+
+    def cache_model(self, model: str) -> Optional[str]:
+        """使用推理缓存的阶段的模型，没有时返回 None"""
+        stage = self._cache_stage
+        if stage is None:
+            return None
+        return stage.model or stage.provider.default_model or model
+
+    def set_fallbacks(self, policy: FallbackPolicy, pipelines: Sequence["Pipeline"]) -> None:
+        """设置降级链，pipelines 按 policy.pipelines 的顺序排列"""
+        self.policy = policy
+        self.fallbacks = tuple(pipelines)
+
+    def admission(self, skip_reasoning: bool, queue_wait: Optional[float]) -> Optional[str]:
+        """发起前检查用到的上游，需要降级时返回原因"""
+        return admission_reason((self.sink,) if skip_reasoning else self.stages, queue_wait)
+
+    def _chain_args(self, pipeline: "Pipeline", args: tuple) -> tuple:
+        """降级目标的推理缓存模型不同时，不能使用为本流水线查找的缓存槽位"""
+        messages, params, model, skip_reasoning, cache_slot, deadline = args
+        if cache_slot is not None and pipeline.cache_model(model) != self.cache_model(model):
+            cache_slot = None
+        return messages, params, model, skip_reasoning, cache_slot, deadline
+
+    def _fell_back(self, pipeline: "Pipeline", reason: str, route: Optional[Route]) -> None:
+        logger.warning(f"流水线 {pipeline.name} 过载（{reason}），改用降级链上的下一条流水线")
+        metrics.inc("pipeline_fallbacks_total", pipeline=self.name, skipped=pipeline.name, reason=reason)
+        if route is not None:
+            route.append((pipeline.name, reason))
+
+    def _served(self, pipeline: "Pipeline", route: Optional[Route]) -> None:
+        metrics.inc("pipeline_requests_total", pipeline=self.name, served=pipeline.name)
+        if route is not None:
+            route.append((pipeline.name, None))
+
+    def _start(
+        self, messages, params, model, skip_reasoning, cache_slot, deadline,
+        lenient=False, armed=False,
+    ) -> _Run:
+        return _Run(
+            self.stages, messages, params, model, skip_reasoning, cache_slot, lenient, armed,
+            deadline, self.reasoning_share,
+        )
+
+    def _run_stages(self, run: _Run, stages: Sequence[StageSpec]) -> AsyncGenerator[bytes, None]:
+        """在当前生成器中依次执行链式阶段，否则并发执行"""
+        if self.chain or len(stages) == 1:
+            return self._run_chain(run, stages)
+        return self._run_concurrent(run, stages)
+
+    async def _run_chain(self, run: _Run, stages: Sequence[StageSpec]) -> AsyncGenerator[bytes, None]:
+        for stage in stages:
+            async with aclosing(self._run_stage(run, stage)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            if run.aborted:
+                break
+
+    def stream(
+        self,
+        request: Optional[Request],
+        messages: list,
+        params: SamplingParams,
+        model: str,
+        skip_reasoning: bool = False,
+        cache_slot: Optional[CacheSlot] = None,
+        route: Optional[Route] = None,
+        deadline: Optional[float] = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """流式执行流水线
+
+        Args:
+            request: 当前请求对象，用于监控客户端连接；为 None 时（如 WebSocket）
+                由调用方取消生成器来结束上游请求
+            messages: 初始消息列表
+            params: 采样参数
+            model: 请求中的模型名称
+            skip_reasoning: 跳过最终回答之前的阶段
+            cache_slot: 推理缓存的查找结果，命中时不请求推理模型
+            route: 传入列表时记录实际经过的流水线（有降级链时在输出首个 chunk 之前确定）
+            deadline: 请求的截止时间（事件循环时间），None 表示不限制
+
+        Returns:
+            AsyncGenerator[bytes, None]: SSE 格式的 chunk
+        """
+        args = (messages, params, model, skip_reasoning, cache_slot, deadline)
+        if self.fallbacks:
+            return self._stream_fallback(request, args, route)
+        self._served(self, route)
+        return self._open(request, args)
+
+    def _open(
+        self, request: Optional[Request], args: tuple, armed: bool = False
+    ) -> AsyncGenerator[bytes, None]:
+        # 跳过推理时只有回答阶段，单任务编排即可
+        if self.orchestrator == "lean" or args[3] or request is None:
+            return self._stream_lean(args, armed)
+        return self._stream_tasks(args, request, armed)
+
+    async def _stream_fallback(
+        self, request: Optional[Request], args: tuple, route: Optional[Route]
+    ) -> AsyncGenerator[bytes, None]:
+        """依次尝试降级链上的流水线，直到某条流水线输出首个 chunk"""
+        policy = self.policy
+        chain = (self, *self.fallbacks)
+        for index, pipeline in enumerate(chain):
+            armed = index + 1 < len(chain)
+            if armed:
+                reason = pipeline.admission(args[3], policy.queue_wait)
+                if reason is not None:
+                    self._fell_back(pipeline, reason, route)
+                    continue
+            async with aclosing(pipeline._open(request, self._chain_args(pipeline, args), armed)) as chunks:
+                try:
+                    async with asyncio.timeout(policy.ttft_budget if armed else None):
+                        first = await anext(chunks, None)
+                except TimeoutError:
+                    reason = "ttft"
+                except FailoverError as e:
+                    reason = e.reason
+                else:
+                    self._served(pipeline, route)
+                    if first is not None:
+                        yield first
+                        async for chunk in chunks:
+                            yield chunk
+                    return
+            self._fell_back(pipeline, reason, route)
+
+    async def _stream_lean(self, args: tuple, armed: bool = False) -> AsyncGenerator[bytes, None]:
+        """链式流水线直接在本生成器中依次消费上游流，不创建额外任务和队列
+
+        客户端断开时 Starlette 会取消该生成器，aclosing 保证上游连接随之关闭；
+        客户端读取慢时生成器不会被推进，上游读取自然暂停。
+        """
+        run = self._start(*args, armed=armed)
+        try:
+            # 跳过推理时只执行最终回答阶段
+            chunks = self._run_stages(run, (self.sink,) if run.skip else self.stages)
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    yield chunk
+            if run.failover is not None:
+                raise FailoverError(run.failover)
+            yield DONE
+        finally:
+            self._finish(run)
+
+    async def _stream_tasks(
+        self, args: tuple, request: Request, armed: bool = False
+    ) -> AsyncGenerator[bytes, None]:
+        """每个阶段一个任务，并监控客户端连接"""
+        run = self._start(*args, armed=armed)
+        try:
+            chunks = self._run_concurrent(run, self.stages, request)
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    yield chunk
+            if run.failover is not None:
+                raise FailoverError(run.failover)
+            # Send end marker if not cancelled
+            if not run.disconnected:
+                yield DONE
+        finally:
+            self._finish(run)
+            logger.info("All tasks cleaned up")
+
+    async def _run_concurrent(
+        self, run: _Run, stages: Sequence[StageSpec], request: Optional[Request] = None
+    ) -> AsyncGenerator[bytes, None]:
+        """并发执行一组阶段，阶段在组内的依赖完成后开始，输出汇入有界队列
+
+        Args:
+            run: 请求状态
+            stages: 要执行的阶段，组外的依赖必须已经完成
+            request: 需要监控连接的请求对象
+        """
+        # Bounded output queue: when the client reads slowly the producers block on
+        # put(), stop pulling from the upstream response and TCP backpressure kicks in
+        output_queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        finished = {stage.id: asyncio.Event() for stage in stages}
+        cancel_event = asyncio.Event()
+
+        async def emit(item: bytes):
+            run.budget.charge(len(item), enforce=False)
+            await output_queue.put(item)
+
+        async def check_client_connection():
+            """Task to monitor client connection status"""
+            while not cancel_event.is_set():
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling tasks")
+                    run.disconnected = True
+                    cancel_event.set()
+                    break
+                await asyncio.sleep(0.1)  # Check every 100ms
+
+        async def run_stage(stage: StageSpec):
+            for name in stage.inputs:
+                if name in finished:
+                    await finished[name].wait()
+            # 依赖的阶段中止了流水线
+            if run.aborted:
+                return
+            async with aclosing(self._run_stage(run, stage)) as chunks:
+                async for chunk in chunks:
+                    if cancel_event.is_set():
+                        logger.info(f"Cancellation detected, stopping stage {stage.id}")
+                        break
+                    await emit(chunk)
+
+        async def process(stage: StageSpec):
+            try:
+                await run_stage(stage)
+            except Exception as e:
+                logger.error(f"Stage {stage.id} of pipeline {self.name} failed: {e}")
+            finally:
+                finished[stage.id].set()
+            # 被取消时不会执行到这里：消费者已停止读取，在 finally 中等待有界队列的空位会永远阻塞
+            if not cancel_event.is_set():
+                logger.info(f"Stage {stage.id} complete, marking end")
+                await output_queue.put(None)
+
+        tasks = [asyncio.create_task(process(stage)) for stage in stages]
+        if request is not None:
+            tasks.append(asyncio.create_task(check_client_connection()))
+
+        try:
+            done_count = 0
+            while done_count < len(stages) and not cancel_event.is_set():
+                try:
+                    item = await asyncio.wait_for(output_queue.get(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                if item is None:
+                    done_count += 1
+                    if run.aborted:
+                        # 中止后不再等待其他阶段
+                        break
+                else:
+                    run.budget.release(len(item))
+                    yield item
+        except GeneratorExit:
+            # This exception is raised when the client closes the connection
+            logger.info("GeneratorExit caught, client closed connection")
+            cancel_event.set()
+            raise
+        finally:
+            # 先标记取消，正在结束的阶段不再向队列发送结束标记
+            cancel_event.set()
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # Wait for tasks to be properly cancelled
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_stage(self, run: _Run, stage: StageSpec) -> AsyncGenerator[bytes, None]:
+        """请求阶段的上游，编码输出并处理错误
+
+        - 最终回答阶段：停滞时输出错误 chunk，其他错误只记录日志；模型自身的推理内容以
+          reasoning_content 输出
+        - 其他阶段：超出内存预算或输出中途停滞时输出错误 chunk 并中止流水线；
+          首 token 停滞或其他错误时保留已收到的输出，后续阶段照常执行
+        - 有降级链且尚未输出数据时，过载引起的错误中止流水线并记录在 run.failover 中
+        - 到达阶段的截止时间时：其他阶段保留已收到的输出，后续阶段照常执行；
+          最终回答阶段输出错误 chunk 并中止流水线
+        """
+        provider = stage.provider
+        encoder = run.encoders[stage.id]
+        buffer = run.buffers.get(stage.id)
+        failed = False
+        # 上游客户端按当前阶段的截止时间限制等待
+        current_deadline.set(run.stage_deadline(stage))
+        try:
+            messages, system = provider.build_messages(
+                run.messages, run.stage_input(stage), stage.prompt
+            )
+            stream = provider.stream(
+                messages,
+                system,
+                run.params,
+                run.models[stage.id],
+                encoder.reasoning_head,
+                run.cache_slot if stage.cache else None,
+            )
+            async with aclosing(stream):
+                if stage.sink:
+                    async for content_type, content in stream:
+                        if content_type in _SINK_SIDE_EVENTS:
+                            if content_type == "usage":
+                                run.usage[stage.id] = content
+                                continue
+                            if content_type == "reasoning_frame":
+                                frame, content = content
+                            else:
+                                frame = encoder.reasoning(content)
+                            if buffer is None:
+                                buffer = run.buffers[stage.id] = ReasoningBuffer(run.budget)
+                            buffer.append(content)
+                            run.emitted = True
+                            yield run.label(stage) + frame
+                            continue
+                        if not content:
+                            continue
+                        run.answer_parts.append(content)
+                        run.emitted = True
+                        yield encoder.answer(content)
+                else:
+                    end_event = provider.end_event
+                    async for content_type, content in stream:
+                        if content_type == "reasoning_frame":
+                            frame, content = content
+                        elif content_type == end_event:
+                            break
+                        elif content_type == "usage":
+                            run.usage[stage.id] = content
+                            continue
+                        else:
+                            frame = encoder.reasoning(content)
+                        buffer.append(content)
+                        run.emitted = True
+                        # 标记和内容作为一项输出，并发阶段的输出不会插入两者之间
+                        yield run.label(stage) + frame
+        except BudgetExceededError as e:
+            logger.warning(f"Stream aborted by memory budget: {e}")
+            failed = True
+            if not run.lenient:
+                run.aborted = True
+                yield error_chunk(run.chat_id, run.created, str(e))
+        except StreamStalledError as e:
+            logger.error(f"Pipeline {self.name} stage {stage.id} stalled: {e}")
+            if self._fail_over(run, e):
+                return
+            failed = True
+            if stage.sink:
+                yield error_chunk(run.chat_id, run.created, str(e))
+            elif e.kind == "gap" and not run.lenient:
+                # 已输出部分推理内容，以错误 chunk 结束
+                run.aborted = True
+                yield error_chunk(run.chat_id, run.created, str(e))
+        except Exception as e:
+            if deadline_exceeded(e):
+                self._deadline_reached(run, stage)
+                if stage.sink:
+                    yield error_chunk(run.chat_id, run.created, str(DeadlineExceededError()))
+            else:
+                logger.error(f"Error processing stage {stage.id} of pipeline {self.name}: {e}")
+                if self._fail_over(run, e):
+                    return
+                failed = True
+
+        if not stage.sink:
+            run.results[stage.id] = "" if failed and run.lenient else buffer.text()
+            logger.info(f"Stage {stage.id} complete, collected length: {buffer.length}")
+
+    @staticmethod
+    def _fail_over(run: _Run, error: Exception) -> bool:
+        """有降级链且尚未向调用方输出数据时，过载引起的错误中止流水线"""
+        if not run.armed or (run.emitted and not run.lenient):
+            return False
+        reason = failover_reason(error)
+        if reason is None:
+            return False
+        run.failover = reason
+        run.aborted = True
+        return True
+
+    def _deadline_reached(self, run: _Run, stage: StageSpec) -> None:
+        """阶段到达截止时间，最终回答阶段到达时中止流水线"""
+        metrics.inc("pipeline_deadline_exceeded_total", pipeline=self.name, stage=stage.id)
+        if stage.sink:
+            logger.warning(f"流水线 {self.name} 的请求已超过截止时间，结束请求")
+            run.aborted = True
+        else:
+            logger.warning(f"流水线 {self.name} 的阶段 {stage.id} 用完时间份额，使用已收到的输出继续")
+
+    def _finish(self, run: _Run) -> None:
+        # 降级链上被放弃的执行没有输出，不计入用量
+        if not run.armed or run.emitted:
+            self._record(run, True, run.reasoning_parts(), run.answer_parts)
+        run.budget.close()
+
+    def _record(self, run: _Run, stream: bool, reasoning, answer) -> None:
+        """计入用量和审计日志，只入队不计算"""
+        answer_model = run.models[self.sink.id]
+        usage_ledger.record(answer_model, run.messages, reasoning, answer)
+        audit_log.record(
+            run.chat_id, self.name, run.model, answer_model, stream,
+            run.messages, run.params, reasoning, answer,
+        )
+
+    async def complete(
+        self,
+        messages: list,
+        params: SamplingParams,
+        model: str,
+        skip_reasoning: bool = False,
+        cache_slot: Optional[CacheSlot] = None,
+        route: Optional[Route] = None,
+        deadline: Optional[float] = None,
+    ) -> dict:
+        """非流式执行流水线
+
+        最终回答之前的阶段仍然使用流式请求（输出丢弃），失败时使用默认提示继续；
+        最终回答阶段请求完整响应。有降级链时过载的流水线改用链上的下一条（不适用 ttft_budget）。
+
+        Args:
+            route: 传入列表时记录实际经过的流水线
+            deadline: 请求的截止时间（事件循环时间），None 表示不限制
+
+        Returns:
+            dict: OpenAI 格式的完整响应
+
+        Raises:
+            DeadlineExceededError: 回答阶段到达截止时间
+        """
+        args = (messages, params, model, skip_reasoning, cache_slot, deadline)
+        if not self.fallbacks:
+            self._served(self, route)
+            return await self._complete(args)
+
+        chain = (self, *self.fallbacks)
+        for index, pipeline in enumerate(chain):
+            armed = index + 1 < len(chain)
+            if armed:
+                reason = pipeline.admission(skip_reasoning, self.policy.queue_wait)
+                if reason is not None:
+                    self._fell_back(pipeline, reason, route)
+                    continue
+            try:
+                result = await pipeline._complete(self._chain_args(pipeline, args), armed)
+            except FailoverError as e:
+                self._fell_back(pipeline, e.reason, route)
+                continue
+            self._served(pipeline, route)
+            return result
+
+    async def _complete(self, args: tuple, armed: bool = False) -> dict:
+        run = self._start(*args, lenient=True, armed=armed)
+        messages, params = run.messages, run.params
+        try:
+            if not run.skip and len(self.stages) > 1:
+                chunks = self._run_stages(run, self.stages[:-1])
+                async with aclosing(chunks):
+                    async for _ in chunks:
+                        pass
+                if run.failover is not None:
+                    raise FailoverError(run.failover)
+
+            sink = self.sink
+            answer_model = run.models[sink.id]
+            reasoning = run.stage_input(sink)
+            sink_messages, system = sink.provider.build_messages(messages, reasoning, sink.prompt)
+
+            # 拼接所有 content 为一个字符串，计算 token
+            token_content = "\n".join(
+                [str(message.get("content", "")) for message in sink_messages]
+            )
+            input_tokens = await count_tokens_offloaded(token_content)
+            logger.debug(f"输入 Tokens: {input_tokens}")
+
+            current_deadline.set(run.deadline)
+            try:
+                completion = await sink.provider.complete(
+                    sink_messages, system, params, answer_model
+                )
+            except Exception as e:
+                if deadline_exceeded(e):
+                    self._deadline_reached(run, sink)
+                    raise DeadlineExceededError(sink.id) from e
+                reason = failover_reason(e) if run.armed else None
+                if reason is not None:
+                    raise FailoverError(reason) from e
+                raise
+            answer = completion.answer
+            # 回答模型自身的推理内容（例如推理模型作为最终回答阶段）接在前序阶段的输出之后
+            reasoning = "\n\n".join(filter(None, (reasoning, completion.reasoning)))
+            output_tokens = await count_tokens_offloaded(answer)
+            self._record(run, False, reasoning, answer)
+            logger.debug(f"输出 Tokens: {output_tokens}")
+
+            usage = {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            }
+            if completion.usage is not None:
+                # 回答阶段上游报告的缓存命中 token 数
+                usage["prompt_tokens_details"] = {"cached_tokens": completion.usage.cached_tokens}
+            return {
+                "id": run.chat_id,
+                "object": "chat.completion",
+                "created": run.created,
+                "model": answer_model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": answer,
+                            "reasoning_content": reasoning,
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+        except (FailoverError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            logger.error(f"流水线 {self.name} 获取回答时发生错误: {e}")
+            raise
+        finally:
+            run.budget.close()
+
+
+class PipelineRegistry:
+    """按模型名称选择流水线"""
+
+    def __init__(self, pipelines: Dict[str, Pipeline]):
+        self.pipelines = pipelines
+
+    def get(self, model: str) -> Pipeline:
+        """模型对应的流水线，没有时使用 "*"
+
+        Raises:
+            ValueError: 没有可用的流水线
+        """
+        pipeline = self.pipelines.get(model) or self.pipelines.get("*")
+        if pipeline is None:
+            raise ValueError(f"模型 {model} 没有可用的流水线")
+        return pipeline
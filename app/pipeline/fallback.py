@@ -0,0 +1,86 @@
+"""过载时的降级链
+
+models.yaml 中的流水线可以配置降级链，过载时依次改用更快或更便宜的流水线，
+让过载表现为回答质量下降而不是超时：
+
+    pipelines:
+      deepclaude:
+        stages: [...]
+        fallback:
+          pipelines: [deepseek-r1, cheap]   # 依次尝试的流水线，最后一条始终执行
+          queue_wait: 5                     # 上游名额排队超过该秒数时跳过
+          ttft_budget: 20                   # 流式请求超过该秒数还没有输出时改用下一条
+
+触发条件：
+- 发起前：流水线用到的某个上游所有地址都处于熔断状态，或其名额队列（优先级调度 / 自适应并发上限）
+  中排队最久的请求已等待超过 queue_wait 秒
+- 发起后、向调用方输出任何数据之前：上游熔断、返回过载状态码（429 / 529 / 5xx）或首 token 停滞，
+  以及流式请求在 ttft_budget 秒内没有任何输出（非流式请求不适用）
+
+已经输出数据后不再降级。降级只使用被请求流水线的配置，降级目标自身的 fallback 不会生效。
+"""
+
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+from app.clients.adaptive_limit import adaptive_limits, is_overload_status
+from app.clients.circuit_breaker import CircuitOpenError, circuit_breakers
+from app.clients.scheduler import upstream_scheduler
+from app.clients.stall import StreamStalledError
+from app.clients.transports import UpstreamStatusError
+
+
+class FallbackPolicy(NamedTuple):
+    """流水线的降级配置"""
+
+    pipelines: Tuple[str, ...]
+    # 上游名额排队时间上限（秒），None 表示不检查
+    queue_wait: Optional[float]
+    # 流式请求首个输出的时间上限（秒），None 表示不限制
+    ttft_budget: Optional[float]
+
+
+class FailoverError(Exception):
+    """流水线在输出任何数据之前因过载放弃，由调用方改用降级链上的下一条流水线"""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"流水线过载: {reason}")
+
+
+def failover_reason(error: Optional[BaseException]) -> Optional[str]:
+    """上游错误对应的降级原因，不是过载引起的错误返回 None
+
+    客户端可能把上游错误包装为其他异常，沿 __cause__ / __context__ 查找原始错误。
+    """
+    while error is not None:
+        if isinstance(error, CircuitOpenError):
+            return "circuit_open"
+        if isinstance(error, UpstreamStatusError) and is_overload_status(error.status):
+            return "overload"
+        if isinstance(error, StreamStalledError) and error.kind == "ttft":
+            return "stall"
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def admission_reason(stages: Sequence, queue_wait: Optional[float]) -> Optional[str]:
+    """发起前检查阶段用到的上游，需要降级时返回原因
+
+    Args:
+        stages: 将要执行的阶段
+        queue_wait: 排队时间上限（秒），None 表示只检查熔断
+    """
+    for stage in stages:
+        upstreams = stage.provider.upstreams()
+        if not circuit_breakers.available(upstreams):
+            return "circuit_open"
+        if queue_wait is None:
+            continue
+        client = stage.provider.client
+        waited = max(
+            upstream_scheduler.oldest_wait(client.trace_stage or type(client).__name__),
+            adaptive_limits.oldest_wait(upstreams[0]),
+        )
+        if waited >= queue_wait:
+            return "queue_wait"
+    return None
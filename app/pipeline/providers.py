@@ -0,0 +1,367 @@
+"""流水线阶段使用的上游提供方
+
+每个提供方包装一个上游客户端，负责按该上游的格式构造输入消息（把前序阶段的输出拼接到
+最后一条用户消息中）并发起流式请求。流式请求直接返回客户端的异步生成器，不再包装一层，
+输出为 (类型, 文本)：
+- ("reasoning_frame", (输出 chunk, 文本)): 直通的推理 chunk
+- ("usage", CacheUsage): 上游报告的输入用量（含缓存命中）
+- ("reasoning", 文本): 推理内容
+- (end_event, ...): 阶段结束（推理模型开始输出回答）；作为最终回答阶段时不结束，之后的输出即回答
+- 其他类型: 文本内容
+
+消息按 app.utils.prompt_prefix 的固定格式构造，前序阶段的输出只追加在最后一条用户消息的
+原始内容之后，使同一对话的相邻请求共享尽量长的前缀，命中上游的上下文缓存。
+
+提供方类型：
+- deepseek: 推理模型，输出推理内容（原生 reasoning_content 或按推理标签解析），
+  推理结束即阶段结束；支持推理缓存和推理 chunk 直通。作为最终回答阶段时同时输出推理和回答
+- claude: Anthropic 格式，system 消息单独传递
+- openai: OpenAI 兼容格式
+"""
+
+import re
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.clients import ClaudeClient, DeepSeekClient
+from app.clients.openai_compatible_client import OpenAICompatibleClient
+from app.clients.transports import get_transport
+from app.utils.chat_request import SamplingParams
+from app.utils.logger import logger
+from app.utils.prompt_prefix import CacheUsage, append_after, canonical_message, canonical_messages
+from app.utils.reasoning_cache import CacheSlot, cached_reasoning
+
+PROVIDER_KINDS = ("deepseek", "claude", "openai")
+
+_PLACEHOLDER = re.compile(r"\{(original|reasoning)\}")
+
+
+class Completion(NamedTuple):
+    """非流式请求的结果"""
+
+    answer: str
+    # 最终回答阶段的模型自身输出的推理内容
+    reasoning: str
+    # 上游报告的输入用量
+    usage: Optional[CacheUsage]
+
+
+def render_prompt(prompt: str, original, reasoning: str) -> str:
+    """替换 prompt 中的 {original} 和 {reasoning}，替换后的内容不会被再次替换"""
+    values = {"original": str(original), "reasoning": reasoning}
+    return _PLACEHOLDER.sub(lambda m: values[m.group(1)], prompt)
+
+
+class Provider:
+    """上游提供方基类"""
+
+    kind = "base"
+    # 上游客户端，由子类设置
+    client = None
+    # 前序阶段没有输出时代替其内容的提示
+    fallback_text = "Failed to retrieve reasoning content"
+    # 表示阶段结束的输出类型
+    end_event: Optional[str] = None
+
+    def __init__(self, name: str, default_model: Optional[str] = None):
+        """初始化提供方
+
+        Args:
+            name: 提供方名称，在流水线配置中引用
+            default_model: 阶段未指定模型时使用的模型，None 表示使用请求中的模型名
+        """
+        self.name = name
+        self.default_model = default_model
+
+    def build_messages(
+        self, messages: List[dict], reasoning: Optional[str], prompt: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """构造前缀稳定的输入消息，不修改原始消息
+
+        Args:
+            messages: 原始消息列表
+            reasoning: 前序阶段的输出，None 表示没有前序阶段（或跳过推理）
+            prompt: 替换最后一条用户消息的模板，可使用 {original} 和 {reasoning}；
+                以 {original} 开头时前缀仍然稳定
+
+        Returns:
+            Tuple[List[dict], Optional[str]]: (消息列表, 单独传递的 system prompt)
+
+        Raises:
+            ValueError: 消息列表为空或最后一条消息不是用户消息
+        """
+        if not messages:
+            raise ValueError("Message list is empty, cannot process request")
+        if messages[-1].get("role", "") != "user":
+            raise ValueError("Last message is not from user, cannot process")
+        messages = canonical_messages(messages)
+        if reasoning is not None:
+            last_message = messages[-1]
+            messages[-1] = {
+                **last_message,
+                "content": self._inject(last_message["content"], reasoning, prompt),
+            }
+        return messages, None
+
+    @staticmethod
+    def _inject(original, reasoning: str, prompt: Optional[str]):
+        """推理内容只追加在原始内容之后，原始内容及之前的消息构成可缓存的前缀"""
+        if prompt is not None:
+            return render_prompt(prompt, original, reasoning)
+        return append_after(
+            original,
+            "Here's my another model's reasoning process:\n"
+            f"{reasoning}\n\n"
+            "Based on this reasoning, provide your response directly to me:",
+        )
+
+    def stream(
+        self,
+        messages: List[dict],
+        system: Optional[str],
+        params: SamplingParams,
+        model: str,
+        frame_head: Optional[bytes] = None,
+        cache_slot: Optional[CacheSlot] = None,
+    ) -> AsyncGenerator[tuple, None]:
+        """流式请求上游
+
+        Args:
+            messages: build_messages 构造的消息
+            system: build_messages 返回的 system prompt
+            params: 采样参数
+            model: 模型名称
+            frame_head: 推理 chunk 直通使用的 chunk 头部
+            cache_slot: 推理缓存的查找结果
+
+        Returns:
+            AsyncGenerator[tuple, None]: 客户端的输出
+        """
+        raise NotImplementedError
+
+    def upstreams(self) -> List[str]:
+        """上游地址及备用地址"""
+        return [self.client.api_url, *self.client.fallback_urls]
+
+    async def complete(
+        self, messages: List[dict], system: Optional[str], params: SamplingParams, model: str
+    ) -> Completion:
+        """请求完整的回答，默认读取流式输出并拼接"""
+        parts = []
+        reasoning = []
+        usage = None
+        async with aclosing(self.stream(messages, system, params, model)) as stream:
+            async for content_type, content in stream:
+                if content_type == "usage":
+                    usage = content
+                elif content_type == "reasoning":
+                    reasoning.append(content)
+                elif content:
+                    parts.append(content)
+        return Completion("".join(parts), "".join(reasoning), usage)
+
+
+class DeepSeekProvider(Provider):
+    """推理模型"""
+
+    kind = "deepseek"
+    end_event = "content"
+
+    def __init__(
+        self,
+        name: str,
+        client: DeepSeekClient,
+        default_model: Optional[str],
+        is_origin_reasoning: bool = True,
+        passthrough: bool = False,
+    ):
+        """初始化推理模型提供方
+
+        Args:
+            client: DeepSeek 客户端
+            is_origin_reasoning: 是否通过 reasoning_content 字段返回推理内容
+            passthrough: 原生推理格式下直接转发上游推理 chunk，只替换 id / created / model
+        """
+        super().__init__(name, default_model)
+        self.client = client
+        self.is_origin_reasoning = is_origin_reasoning
+        self.passthrough = passthrough and is_origin_reasoning
+
+    def stream(
+        self,
+        messages: List[dict],
+        system: Optional[str],
+        params: SamplingParams,
+        model: str,
+        frame_head: Optional[bytes] = None,
+        cache_slot: Optional[CacheSlot] = None,
+    ) -> AsyncGenerator[tuple, None]:
+        logger.info(f"Starting DeepSeek stream with model: {model}")
+        return cached_reasoning(
+            cache_slot,
+            self.client.stream_chat(
+                messages,
+                model,
+                self.is_origin_reasoning,
+                frame_head if self.passthrough else None,
+            ),
+        )
+
+
+class ClaudeProvider(Provider):
+    """Anthropic 格式的模型"""
+
+    kind = "claude"
+    fallback_text = "获取推理内容失败"
+
+    def __init__(self, name: str, client: ClaudeClient, default_model: Optional[str]):
+        super().__init__(name, default_model)
+        self.client = client
+
+    def build_messages(
+        self, messages: List[dict], reasoning: Optional[str], prompt: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """提取 system 消息作为 system prompt，并把推理内容追加到最后一条用户消息之后
+
+        Raises:
+            ValueError: 过滤 system 消息后列表为空，或最后一条消息不是用户消息
+        """
+        # 提取 system message 并同时过滤掉 system messages
+        system_parts = []
+        claude_messages = []
+        for message in messages:
+            if message.get("role", "") == "system":
+                system_parts.append(message.get("content", ""))
+            else:
+                claude_messages.append(canonical_message(message))
+
+        if not claude_messages:
+            raise ValueError("消息列表为空，无法处理 Claude 请求")
+
+        last_message = claude_messages[-1]
+        if last_message.get("role", "") != "user":
+            raise ValueError("最后一个消息的角色不是用户，无法处理请求")
+
+        if reasoning is not None:
+            claude_messages[-1] = {
+                **last_message,
+                "content": self._inject(last_message["content"], reasoning, prompt),
+            }
+
+        system_content = "\n".join(system_parts).strip() or None
+        if system_content:
+            logger.debug(f"使用系统提示: {system_content[:100]}...")
+        return claude_messages, system_content
+
+    def stream(
+        self,
+        messages: List[dict],
+        system: Optional[str],
+        params: SamplingParams,
+        model: str,
+        frame_head: Optional[bytes] = None,
+        cache_slot: Optional[CacheSlot] = None,
+    ) -> AsyncGenerator[tuple, None]:
+        logger.info(f"开始处理 Claude 流，使用模型: {model}, 提供商: {self.client.provider}")
+        return self.client.stream_chat(
+            messages=messages, params=params, model=model, system_prompt=system
+        )
+
+    async def complete(
+        self, messages: List[dict], system: Optional[str], params: SamplingParams, model: str
+    ) -> Completion:
+        answer = ""
+        usage = None
+        async for content_type, content in self.client.stream_chat(
+            messages=messages, params=params, model=model, stream=False, system_prompt=system
+        ):
+            if content_type == "answer":
+                answer += content
+            elif content_type == "usage":
+                usage = content
+        return Completion(answer, "", usage)
+
+
+class OpenAIProvider(Provider):
+    """OpenAI 兼容格式的模型"""
+
+    kind = "openai"
+
+    def __init__(self, name: str, client: OpenAICompatibleClient, default_model: Optional[str]):
+        super().__init__(name, default_model)
+        self.client = client
+
+    def stream(
+        self,
+        messages: List[dict],
+        system: Optional[str],
+        params: SamplingParams,
+        model: str,
+        frame_head: Optional[bytes] = None,
+        cache_slot: Optional[CacheSlot] = None,
+    ) -> AsyncGenerator[tuple, None]:
+        logger.info(f"Starting OpenAI compatible stream processing with model: {model}")
+        return self.client.stream_chat(messages=messages, model=model)
+
+
+def create_provider(
+    name: str,
+    kind: str,
+    api_key: Optional[str],
+    api_url: Optional[str],
+    default_model: Optional[str] = None,
+    transport: str = "aiohttp",
+    fallback_urls: Sequence[str] = (),
+    **options,
+) -> Provider:
+    """按类型创建提供方
+
+    Args:
+        name: 提供方名称
+        kind: deepseek / claude / openai
+        api_key: API 密钥
+        api_url: API 地址
+        default_model: 阶段未指定模型时使用的模型，None 表示使用请求中的模型名
+        transport: 上游传输 (aiohttp / http2 / h2c)
+        fallback_urls: 备用地址
+        **options: 类型相关的选项
+            deepseek: is_origin_reasoning, think_tags, think_implicit_open, passthrough
+            claude: claude_provider
+
+    Raises:
+        ValueError: 未知的提供方类型
+    """
+    if kind == "deepseek":
+        client = DeepSeekClient(
+            api_key,
+            api_url,
+            options.get("think_tags", ("<think>", "</think>")),
+            options.get("think_implicit_open", False),
+            transport=get_transport(transport),
+            fallback_urls=fallback_urls,
+        )
+        return DeepSeekProvider(
+            name,
+            client,
+            default_model,
+            options.get("is_origin_reasoning", True),
+            options.get("passthrough", False),
+        )
+    if kind == "claude":
+        client = ClaudeClient(
+            api_key,
+            api_url,
+            options.get("claude_provider", "anthropic"),
+            transport=get_transport(transport),
+            fallback_urls=fallback_urls,
+        )
+        return ClaudeProvider(name, client, default_model)
+    if kind == "openai":
+        client = OpenAICompatibleClient(
+            api_key, api_url, transport=get_transport(transport), fallback_urls=fallback_urls
+        )
+        return OpenAIProvider(name, client, default_model)
+    raise ValueError(f"未知的提供方类型 {kind}，可选 {' / '.join(PROVIDER_KINDS)}")
+
+
+ProviderRegistry = Dict[str, Provider]
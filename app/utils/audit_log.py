@@ -0,0 +1,352 @@
+"""请求 / 响应审计日志
+
+启用后每个请求结束时记录请求内容（消息和采样参数）、推理内容和回答，按响应 id 区分。
+请求路径上只做采样判断并把已有对象的引用放入内存环形缓冲区，不做脱敏、序列化和压缩，
+也不经过日志处理器；后台线程每 AUDIT_LOG_FLUSH_INTERVAL 秒（或积累 AUDIT_LOG_BATCH 条后）
+批量取出，脱敏后编码为 JSONL，每批压缩为一个 gzip 成员追加写入文件（多个成员拼接仍是合法的
+gzip 文件，可直接 zcat），进程崩溃时已写入的批次完整可读。
+
+- 文件写入 AUDIT_LOG_DIR，名称为 audit-<开始时间>-<进程号>.jsonl.gz；压缩后超过 AUDIT_LOG_MAX_BYTES
+  或打开超过 AUDIT_LOG_ROTATE_SECONDS 秒后换新文件，AUDIT_LOG_KEEP_FILES 大于 0 时只保留最近的文件
+- 采样：AUDIT_LOG_SAMPLE_RATE 为默认采样率，AUDIT_LOG_KEY_SAMPLE_RATES（"密钥:采样率"，逗号分隔）
+  按 API 密钥覆盖；记录中的密钥只保存摘要
+- 脱敏：AUDIT_LOG_REDACT_PATTERN 匹配的文本替换为 [REDACTED]；AUDIT_LOG_OMIT 中的字段
+  （request / reasoning / answer）不记录
+- 磁盘慢于请求时环形缓冲区写满，新记录覆盖最早未写入的记录并计入 audit_log_dropped_total，
+  请求不会等待磁盘
+
+请求路径上的开销可用 benchmarks/bench_audit_log.py 测量。
+"""
+
+import collections
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Deque, Iterable, List, Optional, Sequence, Union
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.usage_ledger import current_api_key, key_id
+
+# 是否记录审计日志
+AUDIT_LOG_ENABLED = os.getenv("AUDIT_LOG_ENABLED", "false").lower() == "true"
+# 审计日志目录
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "audit_logs")
+# 环形缓冲区容量（条）
+AUDIT_LOG_RING_SIZE = int(os.getenv("AUDIT_LOG_RING_SIZE", "10000"))
+# 每批最多写入的条数，缓冲区积累到该条数时提前写入
+AUDIT_LOG_BATCH = int(os.getenv("AUDIT_LOG_BATCH", "500"))
+# 批量写入间隔（秒）
+AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", "1"))
+# 单个文件压缩后的最大字节数
+AUDIT_LOG_MAX_BYTES = int(os.getenv("AUDIT_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+# 单个文件的最长写入时间（秒）
+AUDIT_LOG_ROTATE_SECONDS = float(os.getenv("AUDIT_LOG_ROTATE_SECONDS", "3600"))
+# 保留的文件数，0 表示不删除
+AUDIT_LOG_KEEP_FILES = int(os.getenv("AUDIT_LOG_KEEP_FILES", "0"))
+# gzip 压缩级别
+AUDIT_LOG_COMPRESS_LEVEL = int(os.getenv("AUDIT_LOG_COMPRESS_LEVEL", "6"))
+# 默认采样率，以及按 API 密钥覆盖的采样率
+AUDIT_LOG_SAMPLE_RATE = float(os.getenv("AUDIT_LOG_SAMPLE_RATE", "1"))
+AUDIT_LOG_KEY_SAMPLE_RATES = os.getenv("AUDIT_LOG_KEY_SAMPLE_RATES", "")
+# 需要脱敏的文本的正则表达式
+AUDIT_LOG_REDACT_PATTERN = os.getenv("AUDIT_LOG_REDACT_PATTERN", "")
+# 不记录的字段，逗号分隔
+AUDIT_LOG_OMIT = os.getenv("AUDIT_LOG_OMIT", "")
+
+REDACTED = "[REDACTED]"
+_OMITTABLE = ("request", "reasoning", "answer")
+
+
+def _parse_rates(value: str) -> dict:
+    rates = {}
+    for item in value.split(","):
+        key, sep, rate = item.strip().rpartition(":")
+        if sep and key:
+            rates[key.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def _text(value: Union[str, Iterable[str], None]) -> str:
+    if not value:
+        return ""
+    return value if isinstance(value, str) else "".join(value)
+
+
+class Redactor:
+    """按正则表达式替换文本，递归处理消息中的字符串"""
+
+    def __init__(self, pattern: str = AUDIT_LOG_REDACT_PATTERN):
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def text(self, value: str) -> str:
+        if self.pattern is None:
+            return value
+        return self.pattern.sub(REDACTED, value)
+
+    def value(self, value):
+        if self.pattern is None:
+            return value
+        if isinstance(value, str):
+            return self.pattern.sub(REDACTED, value)
+        if isinstance(value, list):
+            return [self.value(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.value(item) for key, item in value.items()}
+        return value
+
+
+class AuditLog:
+    """环形缓冲区与后台批量写入"""
+
+    def __init__(
+        self,
+        enabled: bool = AUDIT_LOG_ENABLED,
+        directory: str = AUDIT_LOG_DIR,
+        ring_size: int = AUDIT_LOG_RING_SIZE,
+        batch: int = AUDIT_LOG_BATCH,
+        flush_interval: float = AUDIT_LOG_FLUSH_INTERVAL,
+        max_bytes: int = AUDIT_LOG_MAX_BYTES,
+        rotate_seconds: float = AUDIT_LOG_ROTATE_SECONDS,
+        keep_files: int = AUDIT_LOG_KEEP_FILES,
+        sample_rate: float = AUDIT_LOG_SAMPLE_RATE,
+        key_sample_rates: str = AUDIT_LOG_KEY_SAMPLE_RATES,
+        redact_pattern: str = AUDIT_LOG_REDACT_PATTERN,
+        omit: str = AUDIT_LOG_OMIT,
+    ):
+        self.enabled = enabled
+        self.directory = directory
+        self.ring_size = ring_size
+        self.batch = batch
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.keep_files = keep_files
+        self.sample_rate = sample_rate
+        self.key_sample_rates = _parse_rates(key_sample_rates)
+        self.redactor = Redactor(redact_pattern)
+        self.omit = frozenset(name.strip() for name in omit.split(",") if name.strip())
+        unknown = self.omit.difference(_OMITTABLE)
+        if unknown:
+            raise ValueError(f"AUDIT_LOG_OMIT 中未知的字段: {', '.join(sorted(unknown))}")
+        # deque 的 append / popleft 是原子操作，请求线程和写入线程之间不需要额外的锁
+        self._ring: Deque[tuple] = collections.deque(maxlen=ring_size)
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._file_path: Optional[str] = None
+        self._file_bytes = 0
+        self._file_opened = 0.0
+        # 只由请求路径（事件循环线程）累加、写入线程按差值导出的计数，避免在请求路径上获取指标锁
+        self._dropped = 0
+        self._sampled_out = 0
+        self._exported = (0, 0)
+
+    def start(self) -> None:
+        """创建目录并启动后台线程，未启用时不做任何事"""
+        if not self.enabled or self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """写入缓冲区中剩余的记录并停止后台线程"""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self._close_file()
+
+    def record(
+        self,
+        request_id: str,
+        pipeline: str,
+        model: str,
+        answer_model: str,
+        stream: bool,
+        messages: Sequence[dict],
+        params: Optional[tuple],
+        reasoning: Union[str, Iterable[str], None],
+        answer: Union[str, Iterable[str]],
+    ) -> None:
+        """记录一次请求，只做采样判断并入队
+
+        调用方在记录后不能再修改 messages、reasoning 和 answer。
+
+        Args:
+            request_id: 响应 id
+            pipeline: 实际执行的流水线
+            model: 请求中的模型名称
+            answer_model: 响应中的模型名称
+            stream: 是否为流式请求
+            messages: 请求的消息列表
+            params: 采样参数（NamedTuple）
+            reasoning: 推理内容或推理片段列表
+            answer: 回答内容或回答片段列表
+        """
+        if self._thread is None:
+            return
+        api_key = current_api_key.get()
+        rate = self.key_sample_rates.get(api_key, self.sample_rate) if api_key else self.sample_rate
+        if rate < 1.0 and random.random() >= rate:
+            self._sampled_out += 1
+            return
+        ring = self._ring
+        if len(ring) >= self.ring_size:
+            # 写入跟不上时覆盖最早的记录，不阻塞请求
+            self._dropped += 1
+        ring.append(
+            (time.time(), request_id, api_key, pipeline, model, answer_model, stream,
+             messages, params, reasoning, answer)
+        )
+        if len(ring) >= self.batch and not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            stopping = self._stopping
+            while self._ring:
+                self._write_batch()
+            self._export_counters()
+            if self._file is not None and time.monotonic() - self._file_opened >= self.rotate_seconds:
+                self._close_file()
+            if stopping:
+                return
+
+    def _take(self) -> List[tuple]:
+        ring = self._ring
+        items = []
+        while ring and len(items) < self.batch:
+            try:
+                items.append(ring.popleft())
+            except IndexError:
+                break
+        return items
+
+    def _encode(self, item: tuple) -> bytes:
+        (ts, request_id, api_key, pipeline, model, answer_model, stream,
+         messages, params, reasoning, answer) = item
+        redact = self.redactor
+        entry = {
+            "ts": round(ts, 3),
+            "id": request_id,
+            "key": key_id(api_key),
+            "pipeline": pipeline,
+            "model": model,
+            "answer_model": answer_model,
+            "stream": stream,
+        }
+        if "request" not in self.omit:
+            entry["request"] = {
+                "messages": redact.value(list(messages or ())),
+                **(params._asdict() if params is not None else {}),
+            }
+        if "reasoning" not in self.omit:
+            entry["reasoning"] = redact.text(_text(reasoning))
+        if "answer" not in self.omit:
+            entry["answer"] = redact.text(_text(answer))
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    def _write_batch(self) -> None:
+        items = self._take()
+        if not items:
+            return
+        lines = []
+        for item in items:
+            try:
+                lines.append(self._encode(item))
+            except Exception as e:
+                metrics.inc("audit_log_errors_total", stage="encode")
+                logger.error(f"审计记录编码失败: {e}")
+        if not lines:
+            return
+        # 每批作为一个完整的 gzip 成员追加，写到一半崩溃也不影响之前的批次
+        payload = gzip.compress(b"".join(lines), AUDIT_LOG_COMPRESS_LEVEL)
+        try:
+            self._write(payload)
+        except OSError as e:
+            metrics.inc("audit_log_errors_total", stage="write")
+            metrics.inc("audit_log_dropped_total", len(lines), reason="write_error")
+            logger.error(f"写入审计日志失败，丢弃 {len(lines)} 条: {e}")
+            self._close_file()
+            return
+        metrics.inc("audit_log_records_total", len(lines))
+        metrics.inc("audit_log_bytes_total", len(payload))
+
+    def _write(self, payload: bytes) -> None:
+        if self._file is None:
+            self._open_file()
+        self._file.write(payload)
+        self._file.flush()
+        self._file_bytes += len(payload)
+        if self._file_bytes >= self.max_bytes:
+            self._close_file()
+
+    def _open_file(self) -> None:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}.jsonl.gz")
+        # 同一秒内轮转多次时加序号
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}-{suffix}.jsonl.gz")
+            suffix += 1
+        self._file = open(path, "ab")
+        self._file_path = path
+        self._file_bytes = 0
+        self._file_opened = time.monotonic()
+        self._prune()
+
+    def _close_file(self) -> None:
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError as e:
+            logger.error(f"关闭审计日志 {self._file_path} 失败: {e}")
+        self._file = None
+        metrics.inc("audit_log_rotations_total")
+
+    def _prune(self) -> None:
+        """只保留最近的 keep_files 个文件（包括正在写入的文件）"""
+        if self.keep_files <= 0:
+            return
+        files = sorted(
+            (entry for entry in os.scandir(self.directory)
+             if entry.name.startswith("audit-") and entry.name.endswith(".jsonl.gz")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in files[: max(0, len(files) - self.keep_files)]:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logger.warning(f"删除旧审计日志 {entry.path} 失败: {e}")
+
+    def _export_counters(self) -> None:
+        dropped, sampled_out = self._dropped, self._sampled_out
+        if dropped > self._exported[0]:
+            metrics.inc("audit_log_dropped_total", dropped - self._exported[0], reason="ring_full")
+        if sampled_out > self._exported[1]:
+            metrics.inc("audit_log_sampled_out_total", sampled_out - self._exported[1])
+        self._exported = (dropped, sampled_out)
+
+
+audit_log = AuditLog()
+
+
+def _collect_audit_metrics():
+    if audit_log.enabled:
+        yield "audit_log_ring_size", {}, len(audit_log._ring)
+
+
+metrics.register_collector(_collect_audit_metrics)
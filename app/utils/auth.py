@@ -1,23 +1,22 @@
 from fastapi import HTTPException, Header
 from typing import Optional
 import os
-from dotenv import load_dotenv
+import secrets
 from app.utils.logger import logger
+from app.utils.tracing import span
+from app.utils.usage_ledger import current_api_key
 
-# 加载 .env 文件
-logger.info(f"当前工作目录: {os.getcwd()}")
-logger.info("尝试加载.env文件...")
-load_dotenv(override=True)  # 添加override=True强制覆盖已存在的环境变量
-
-# 获取环境变量
+# 获取环境变量（.env 已在 logger 导入时加载）
 ALLOW_API_KEY = os.getenv("ALLOW_API_KEY")
-logger.info(f"ALLOW_API_KEY环境变量状态: {'已设置' if ALLOW_API_KEY else '未设置'}")
+
+# 管理接口（性能分析等）使用的独立密钥，未设置时管理接口不可用
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 
 if not ALLOW_API_KEY:
     raise ValueError("ALLOW_API_KEY environment variable is not set")
 
 # 打印API密钥的前4位用于调试
-logger.info(f"Loaded API key starting with: {ALLOW_API_KEY[:4] if len(ALLOW_API_KEY) >= 4 else ALLOW_API_KEY}")
+logger.debug(f"Loaded API key starting with: {ALLOW_API_KEY[:4] if len(ALLOW_API_KEY) >= 4 else ALLOW_API_KEY}")
 
 
 async def verify_api_key(authorization: Optional[str] = Header(None)) -> None:
@@ -29,19 +28,52 @@ async def verify_api_key(authorization: Optional[str] = Header(None)) -> None:
     Raises:
         HTTPException: 当Authorization header缺失或API密钥无效时抛出401错误
     """
-    if authorization is None:
-        logger.warning("请求缺少Authorization header")
-        raise HTTPException(
-            status_code=401,
-            detail="Missing Authorization header"
-        )
+    with span("auth"):
+        if authorization is None:
+            logger.warning("请求缺少Authorization header")
+            raise HTTPException(
+                status_code=401,
+                detail="Missing Authorization header"
+            )
     
-    api_key = authorization.replace("Bearer ", "").strip()
-    if api_key != ALLOW_API_KEY:
-        logger.warning(f"无效的API密钥: {api_key}")
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid API key"
-        )
+        api_key = authorization.replace("Bearer ", "").strip()
+        if api_key != ALLOW_API_KEY:
+            logger.warning(f"无效的API密钥: {api_key}")
+            raise HTTPException(
+                status_code=401,
+                detail="Invalid API key"
+            )
     
-    logger.info("API密钥验证通过")
+        logger.info("API密钥验证通过")
+        # 供用量统计按密钥归属请求
+        current_api_key.set(api_key)
+
+
+def is_valid_api_key(api_key: Optional[str]) -> bool:
+    """判断是否为允许的 API 密钥，兼容带 Bearer 前缀的写法"""
+    if not api_key:
+        return False
+    api_key = api_key.replace("Bearer ", "").strip()
+    return secrets.compare_digest(api_key.encode(), ALLOW_API_KEY.encode())
+
+
+def is_admin_key(api_key: Optional[str]) -> bool:
+    """判断是否为管理密钥，未配置 ADMIN_API_KEY 时始终为 False"""
+    if not ADMIN_API_KEY or not api_key:
+        return False
+    return secrets.compare_digest(api_key.encode(), ADMIN_API_KEY.encode())
+
+
+async def verify_admin_key(authorization: Optional[str] = Header(None)) -> None:
+    """验证管理接口的API密钥
+
+    Raises:
+        HTTPException: 未配置 ADMIN_API_KEY 时抛出403错误，密钥缺失或无效时抛出401错误
+    """
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if authorization is None or not is_admin_key(
+        authorization.replace("Bearer ", "").strip()
+    ):
+        logger.warning("无效的管理API密钥")
+        raise HTTPException(status_code=401, detail="Invalid admin API key")
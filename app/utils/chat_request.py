@@ -0,0 +1,135 @@
+"""聊天补全请求的解码与校验
+
+请求体一次性解码为 ChatRequest，后续各层只使用其中的类型化字段，不再在字典上逐个 get。
+- 安装了 orjson 时使用 orjson 解码（pip install 'deepclaude[speedups]'），否则使用标准库 json
+- 可以把超过 CHAT_DECODE_OFFLOAD_BYTES 的请求体（长对话、base64 图片）放到 CPU 线程池中解码。
+  orjson 和 json 解码时都持有 GIL，在标准 CPython 上线程解码并不能缩短事件循环的停顿，
+  反而增加线程切换，因此默认关闭；可用 benchmarks/bench_request_decode.py 在部署环境中测量
+- 未指定的采样参数使用 models.yaml 中 defaults 的配置："*" 对所有模型生效，按模型名覆盖
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from app.config import load_models_config
+from app.utils.event_loop import run_cpu
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# 超过该字节数的请求体在线程中解码，0 表示不启用
+CHAT_DECODE_OFFLOAD_BYTES = int(os.getenv("CHAT_DECODE_OFFLOAD_BYTES", "0"))
+
+# models.yaml 未配置时的默认值
+_BUILTIN_DEFAULTS = {
+    "temperature": 0.5,
+    "top_p": 0.9,
+    "presence_penalty": 0.0,
+    "frequency_penalty": 0.0,
+    "stream": False,
+}
+
+
+class SamplingParams(NamedTuple):
+    """回答模型的采样参数，可哈希，可作为缓存键的一部分"""
+
+    temperature: float
+    top_p: float
+    presence_penalty: float
+    frequency_penalty: float
+
+
+class ChatRequest(NamedTuple):
+    """校验后的聊天补全请求"""
+
+    model: str
+    messages: List[Dict[str, Any]]
+    stream: bool
+    params: SamplingParams
+    # 显式指定的是否跳过推理阶段，None 表示由推理路由决定
+    skip_reasoning: Optional[bool] = None
+    # 请求的超时秒数，与 X-Request-Timeout 请求头一起决定截止时间
+    timeout: Optional[float] = None
+
+
+@lru_cache(maxsize=256)
+def model_defaults(model: str) -> Dict[str, Any]:
+    """合并后的模型默认参数，调用方不能修改返回值"""
+    defaults = dict(_BUILTIN_DEFAULTS)
+    configured = load_models_config().get("defaults") or {}
+    defaults.update(configured.get("*") or {})
+    defaults.update(configured.get(model) or {})
+    return defaults
+
+
+def _number(body: dict, name: str, default: Any) -> float:
+    value = body.get(name)
+    if value is None:
+        value = default
+    if type(value) is float:
+        return value
+    # bool 是 int 的子类，需要单独排除
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} 必须是数字")
+    return float(value)
+
+
+def parse_chat_request(body: Any) -> ChatRequest:
+    """把已解码的请求体校验为 ChatRequest
+
+    Raises:
+        ValueError: 请求参数无效
+    """
+    if not isinstance(body, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    model = body.get("model")
+    if not model:
+        raise ValueError("必须指定模型名称")
+    if not isinstance(model, str):
+        raise ValueError("model 必须是字符串")
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not all(isinstance(m, dict) for m in messages):
+        raise ValueError("messages 必须是消息对象列表")
+
+    defaults = model_defaults(model)
+    params = SamplingParams(*[_number(body, name, defaults[name]) for name in SamplingParams._fields])
+    # Only Sonnet 设定 temperature 必须在 0 到 1 之间
+    if "sonnet" in model and not 0.0 <= params.temperature <= 1.0:
+        raise ValueError("Sonnet 设定 temperature 必须在 0 到 1 之间")
+
+    stream = body.get("stream")
+    if stream is None:
+        stream = defaults["stream"]
+    skip_reasoning = body.get("skip_reasoning")
+    for name, value in (("stream", stream), ("skip_reasoning", skip_reasoning)):
+        if value is not None and not isinstance(value, bool):
+            raise ValueError(f"{name} 必须是布尔值")
+    timeout = body.get("timeout")
+    if timeout is not None:
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError("timeout 必须是大于 0 的秒数")
+        timeout = float(timeout)
+
+    return ChatRequest(model, messages, stream, params, skip_reasoning, timeout)
+
+
+def decode_chat_request(raw: bytes) -> ChatRequest:
+    """解码并校验请求体
+
+    Raises:
+        ValueError: 不是合法的 JSON 或请求参数无效
+    """
+    return parse_chat_request(_loads(raw))
+
+
+async def read_chat_request(raw: bytes) -> ChatRequest:
+    """解码请求体，较大的请求体在 CPU 线程池中解码"""
+    return await run_cpu(
+        "json_decode", len(raw), CHAT_DECODE_OFFLOAD_BYTES, decode_chat_request, raw
+    )
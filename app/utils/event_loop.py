@@ -0,0 +1,148 @@
+"""事件循环相关：CPU 任务卸载与事件循环延迟监控
+
+CPU 密集的步骤（大段文本的 token 计数、推理缓存签名、上游请求体的 JSON 编码、请求体解码）
+按输入大小决定在事件循环中直接执行，还是交给专用线程池，避免拖慢同一进程中的其他流。
+阈值为 0 表示该类任务始终直接执行。
+
+注意线程池受 GIL 限制：tiktoken 编码时释放 GIL，卸载后事件循环可以完全继续运行；
+纯 Python 代码（签名计算）每个切换间隔（默认 5 毫秒）让出一次 GIL，卸载可以把停顿
+限制在切换间隔内；json / orjson 在 C 代码中一直持有 GIL，卸载不能缩短停顿，因此默认不卸载。
+
+事件循环延迟由后台任务测量：每 LOOP_LAG_INTERVAL 秒睡眠一次，实际唤醒时间与预期之差
+即为延迟，导出为 event_loop_lag_seconds（摘要）和 event_loop_lag_max_seconds（两次导出之间的最大值），
+超过 LOOP_LAG_WARN_SECONDS 时记录警告。
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+# CPU 任务线程池大小
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 各类任务卸载到线程池的输入大小阈值（字符数或字节数），0 表示不卸载
+OFFLOAD_TOKENIZE_CHARS = int(os.getenv("OFFLOAD_TOKENIZE_CHARS", "16384"))
+OFFLOAD_SIGNATURE_CHARS = int(os.getenv("OFFLOAD_SIGNATURE_CHARS", "65536"))
+OFFLOAD_JSON_BYTES = int(os.getenv("OFFLOAD_JSON_BYTES", "0"))
+# 事件循环延迟的采样间隔和告警阈值（秒），间隔为 0 时不监控
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_LAG_WARN_SECONDS = float(os.getenv("LOOP_LAG_WARN_SECONDS", "0.1"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def cpu_executor() -> ThreadPoolExecutor:
+    """CPU 任务专用线程池，首次使用时创建"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="cpu"
+        )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """关闭线程池，等待已提交的任务完成"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def run_cpu(task: str, size: int, threshold: int, func: Callable, *args: Any) -> Any:
+    """执行 CPU 密集的函数，输入不小于阈值时在线程池中执行
+
+    Args:
+        task: 任务类型，用作指标标签
+        size: 输入大小
+        threshold: 卸载阈值，0 表示始终直接执行
+        func: 要执行的函数
+        *args: 函数参数
+    """
+    if threshold and size >= threshold:
+        metrics.inc("cpu_tasks_total", task=task, mode="offloaded")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cpu_executor(), functools.partial(func, *args))
+    metrics.inc("cpu_tasks_total", task=task, mode="inline")
+    return func(*args)
+
+
+def messages_size(messages) -> int:
+    """消息列表中文本的大致字符数，用于选择执行方式"""
+    size = 0
+    for message in messages or ():
+        content = message.get("content")
+        if isinstance(content, str):
+            size += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict):
+                    size += len(part.get("text") or "")
+                    image = part.get("image_url")
+                    if isinstance(image, dict):
+                        size += len(image.get("url") or "")
+    return size
+
+
+def loop_implementation() -> str:
+    """当前事件循环的实现名称，例如 asyncio 或 uvloop"""
+    loop = asyncio.get_running_loop()
+    return type(loop).__module__.split(".")[0]
+
+
+class LoopLagMonitor:
+    """事件循环延迟监控"""
+
+    def __init__(
+        self, interval: float = LOOP_LAG_INTERVAL, warn_seconds: float = LOOP_LAG_WARN_SECONDS
+    ):
+        self.interval = interval
+        self.warn_seconds = warn_seconds
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """在当前事件循环中启动监控任务"""
+        if self.interval <= 0 or self._task is not None:
+            return
+        metrics.set("event_loop_info", 1, loop=loop_implementation())
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.max_lag = max(self.max_lag, lag)
+            metrics.observe("event_loop_lag_seconds", lag)
+            if lag > self.warn_seconds:
+                metrics.inc("event_loop_lag_warnings_total")
+                logger.warning(f"事件循环延迟 {lag * 1000:.0f} ms，可能有 CPU 密集任务阻塞了事件循环")
+
+
+def _collect_loop_metrics():
+    if loop_lag_monitor._task is not None:
+        # 两次导出之间的最大延迟
+        max_lag, loop_lag_monitor.max_lag = loop_lag_monitor.max_lag, 0.0
+        yield "event_loop_lag_max_seconds", {}, max_lag
+    if _executor is not None:
+        yield "cpu_executor_pending", {}, _executor._work_queue.qsize()
+
+
+loop_lag_monitor = LoopLagMonitor()
+metrics.register_collector(_collect_loop_metrics)
@@ -2,10 +2,11 @@ import logging
 import colorlog
 import sys
 import os
-from dotenv import load_dotenv
+
+from app.config import load_env
 
 # 确保环境变量被加载
-load_dotenv()
+load_env()
 
 def get_log_level() -> int:
     """从环境变量获取日志级别
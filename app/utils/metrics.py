@@ -0,0 +1,105 @@
+"""进程内指标注册表，以 Prometheus 文本格式导出"""
+
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in key
+    )
+    return "{" + pairs + "}"
+
+
+class Metrics:
+    """简单的计数器 / 仪表 / 摘要指标集合
+
+    所有写操作都在锁内完成，可以安全地从后台线程调用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self._gauges: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self._summaries: Dict[str, Dict[LabelKey, List[float]]] = defaultdict(dict)
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict, float]]]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """计数器累加"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """设置仪表值"""
+        with self._lock:
+            self._gauges[name][_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """记录一次观测值（导出为 _sum 与 _count）"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._summaries[name]
+            total = series.get(key)
+            if total is None:
+                series[key] = [value, 1]
+            else:
+                total[0] += value
+                total[1] += 1
+
+    def register_collector(
+        self, collector: Callable[[], Iterable[Tuple[str, Dict, float]]]
+    ) -> None:
+        """注册一个在导出时调用的仪表采集函数
+
+        Args:
+            collector: 返回 (指标名, 标签字典, 值) 迭代器的函数
+        """
+        self._collectors.append(collector)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def get_summary(self, name: str, **labels) -> Tuple[float, int]:
+        """返回摘要指标的 (总和, 次数)"""
+        with self._lock:
+            total = self._summaries.get(name, {}).get(_label_key(labels))
+            return (total[0], total[1]) if total else (0.0, 0)
+
+    def render(self) -> str:
+        """导出 Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._summaries.items()):
+                lines.append(f"# TYPE {name} summary")
+                for key, (total, count) in series.items():
+                    lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标实例
+metrics = Metrics()
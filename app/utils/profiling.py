@@ -0,0 +1,332 @@
+"""运行时性能分析
+
+仅在 PROFILING_ENABLED=true 且配置了 ADMIN_API_KEY 时可用，默认关闭时不注册任何接口、
+不安装任务工厂，对请求处理没有额外开销。
+
+- Sampler: 在独立线程中周期性采样事件循环，输出 flamegraph 可用的 collapsed stack 文本，
+  每个调用栈以 asyncio 任务（协程名）作为根节点。
+  wall 模式每次采样对每个任务计 1：正在运行的任务取线程调用栈，挂起的任务沿 cr_await
+  链取其等待位置，因此等待上游的时间也会计入；cpu 模式只采样正在运行的任务，权重为两次
+  采样间事件循环线程实际消耗的 CPU 时间（微秒）。
+- 单请求分析: 通过任务工厂把请求内创建的任务归属到该请求，采样时只统计这些任务。
+- MemoryProfiler: 基于 tracemalloc，返回与上一次快照之间的内存增长。
+"""
+
+import asyncio
+import contextvars
+import os
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional
+
+from app.utils.logger import logger
+
+# 是否启用性能分析接口
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# 单次采样的最长时间（秒），到期自动停止
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+# 默认采样间隔（秒）
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# 保留的分析结果数
+PROFILE_RESULTS_LIMIT = 32
+
+PROFILE_MODES = ("wall", "cpu")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _task_name(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "event_loop"
+    coro = task.get_coro()
+    return f"task:{getattr(coro, '__qualname__', task.get_name())}"
+
+
+def _coro_frame(coro):
+    return (
+        getattr(coro, "cr_frame", None)
+        or getattr(coro, "ag_frame", None)
+        or getattr(coro, "gi_frame", None)
+    )
+
+
+def _running_stack(task: Optional[asyncio.Task], frame) -> list:
+    """正在运行的任务的调用栈，从任务的协程开始"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    if task is not None:
+        root = _coro_frame(task.get_coro())
+        for i, f in enumerate(frames):
+            if f is root:
+                frames = frames[i:]
+                break
+    return [_task_name(task)] + [_frame_name(f) for f in frames]
+
+
+def _suspended_stack(task: asyncio.Task) -> list:
+    """挂起的任务沿 await 链的等待位置"""
+    names = [_task_name(task)]
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = _coro_frame(awaitable)
+        if frame is None:
+            break
+        names.append(_frame_name(frame))
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "ag_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+        )
+    return names
+
+
+class Sampler:
+    """事件循环线程的采样分析器，需在事件循环线程中创建"""
+
+    def __init__(
+        self,
+        mode: str = "wall",
+        interval: float = PROFILE_INTERVAL,
+        max_seconds: float = PROFILE_MAX_SECONDS,
+        tasks: Optional[weakref.WeakSet] = None,
+    ):
+        """初始化采样器
+
+        Args:
+            mode: wall 或 cpu
+            interval: 采样间隔（秒）
+            max_seconds: 最长采样时间（秒）
+            tasks: 只统计这些任务，None 表示统计所有任务
+
+        Raises:
+            ValueError: 不支持的模式
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析模式: {mode}")
+        self.id = secrets.token_hex(8)
+        self.mode = mode
+        self.interval = max(interval, 0.001)
+        self.max_seconds = min(max_seconds, PROFILE_MAX_SECONDS)
+        self.tasks = tasks
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._stacks: Dict[str, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name=f"profiler-{self.id}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> str:
+        """停止采样并返回 collapsed stack 文本"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{stack} {count}\n"
+            for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1])
+        )
+
+    def _add(self, names: list, weight: int) -> None:
+        self._stacks[";".join(names)] += weight
+
+    def _run(self) -> None:
+        cpu_clock = None
+        last_cpu = 0.0
+        if self.mode == "cpu":
+            cpu_clock = time.pthread_getcpuclockid(self._thread_id)
+            last_cpu = time.clock_gettime(cpu_clock)
+        deadline = self.started_at + self.max_seconds
+
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() > deadline:
+                break
+            running = asyncio.current_task(self._loop)
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                break
+
+            if cpu_clock is not None:
+                now_cpu = time.clock_gettime(cpu_clock)
+                weight = int((now_cpu - last_cpu) * 1_000_000)
+                last_cpu = now_cpu
+                if weight <= 0 or (self.tasks is not None and running not in self.tasks):
+                    continue
+                self._add(_running_stack(running, frame), weight)
+                self.samples += 1
+                continue
+
+            try:
+                if self.tasks is None:
+                    tasks = asyncio.all_tasks(self._loop)
+                    if running is None:
+                        self._add(_running_stack(None, frame), 1)
+                else:
+                    tasks = list(self.tasks)
+            except RuntimeError:
+                # 任务集合在遍历时被事件循环线程修改，跳过本次采样
+                continue
+            for task in tasks:
+                if task is running:
+                    self._add(_running_stack(task, frame), 1)
+                elif not task.done():
+                    self._add(_suspended_stack(task), 1)
+            self.samples += 1
+        self.duration = time.perf_counter() - self.started_at
+
+
+class ProfileStore:
+    """保存最近的分析结果"""
+
+    def __init__(self, limit: int = PROFILE_RESULTS_LIMIT):
+        self.limit = limit
+        self._results: OrderedDict[str, str] = OrderedDict()
+
+    def put(self, profile_id: str, collapsed: str) -> None:
+        self._results[profile_id] = collapsed
+        self._results.move_to_end(profile_id)
+        while len(self._results) > self.limit:
+            self._results.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self._results.get(profile_id)
+
+
+class Profiler:
+    """全局采样与单请求分析的入口"""
+
+    def __init__(self):
+        self.results = ProfileStore()
+        self.current: Optional[Sampler] = None
+        self._request_tasks: contextvars.ContextVar[Optional[weakref.WeakSet]] = (
+            contextvars.ContextVar("profiled_request_tasks", default=None)
+        )
+
+    def install(self) -> None:
+        """安装任务工厂，把请求内创建的任务归属到正在分析的请求"""
+        loop = asyncio.get_running_loop()
+        previous = loop.get_task_factory()
+        request_tasks = self._request_tasks
+
+        def task_factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            tasks = request_tasks.get()
+            if tasks is not None:
+                tasks.add(task)
+            return task
+
+        loop.set_task_factory(task_factory)
+
+    def start(self, mode: str, seconds: float, interval: float = PROFILE_INTERVAL) -> Sampler:
+        """开始全局采样
+
+        Raises:
+            RuntimeError: 已有正在进行的采样
+            ValueError: 参数无效
+        """
+        if self.current is not None:
+            if self.current.running:
+                raise RuntimeError(f"已有正在进行的采样: {self.current.id}")
+            # 上一次采样已到期自动停止，先保存结果
+            self.stop()
+        self.current = Sampler(mode, interval, seconds)
+        self.current.start()
+        logger.info(f"开始性能采样 {self.current.id}: mode={mode}, seconds={seconds}")
+        return self.current
+
+    def stop(self) -> Optional[Sampler]:
+        """停止全局采样并保存结果，没有采样时返回 None"""
+        sampler = self.current
+        if sampler is None:
+            return None
+        self.current = None
+        self.results.put(sampler.id, sampler.stop())
+        logger.info(f"性能采样 {sampler.id} 结束: {sampler.samples} 个样本")
+        return sampler
+
+    def start_request(self, mode: str) -> Sampler:
+        """开始分析当前请求，需在请求的任务中调用"""
+        tasks = weakref.WeakSet()
+        tasks.add(asyncio.current_task())
+        self._request_tasks.set(tasks)
+        sampler = Sampler(mode, tasks=tasks)
+        sampler.start()
+        return sampler
+
+    def finish_request(self, sampler: Sampler) -> None:
+        self.results.put(sampler.id, sampler.stop())
+        logger.info(f"请求性能分析 {sampler.id} 结束: {sampler.samples} 个样本")
+
+
+class MemoryProfiler:
+    """基于 tracemalloc 的内存快照对比"""
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._previous = self._snapshot()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self._previous = None
+
+    def diff(self, limit: int = 30, key: str = "lineno") -> str:
+        """返回与上一次快照相比增长最多的分配位置，并以本次快照作为新的基线
+
+        Raises:
+            RuntimeError: 尚未开始追踪
+        """
+        if not tracemalloc.is_tracing() or self._previous is None:
+            raise RuntimeError("tracemalloc 尚未开始")
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self._previous, key)
+        self._previous = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"# traced current={current} peak={peak}"]
+        lines.extend(str(stat) for stat in stats[:limit])
+        return "\n".join(lines) + "\n"
+
+
+profiler = Profiler()
+memory_profiler = MemoryProfiler()
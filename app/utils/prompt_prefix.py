@@ -0,0 +1,132 @@
+"""前缀稳定的上游请求构造，以及上游上下文缓存命中统计
+
+DeepSeek 及许多 OpenAI 兼容上游会缓存请求前缀，前缀相同的请求更快也更便宜。为让相邻请求
+（同一对话的下一轮、同一请求的不同阶段、重试和备用地址）尽量共享前缀：
+- 消息按固定格式重建：保持原有顺序（system 消息的位置影响其含义），每条消息先 role 后 content，
+  其余字段按键名排序，值为 None 的字段去掉
+- 前序阶段的输出只追加在最后一条用户消息的原始内容之后，原始内容之前不插入任何文字
+- 请求体统一用同一种 JSON 编码（紧凑分隔符，不转义非 ASCII 字符），与消息大小无关
+- Anthropic 原生接口不会自动缓存，开启 ANTHROPIC_PROMPT_CACHE 后在 system 和历史消息末尾
+  设置 cache_control 断点（写入缓存的 token 按更高价格计费）
+
+上游返回的缓存命中 token 数统一解析为 CacheUsage，并导出为指标：
+- DeepSeek: prompt_cache_hit_tokens / prompt_cache_miss_tokens
+- OpenAI 兼容: prompt_tokens / prompt_tokens_details.cached_tokens
+- Anthropic: input_tokens / cache_read_input_tokens / cache_creation_input_tokens
+"""
+
+import json
+import os
+from typing import List, NamedTuple, Optional, Sequence, Union
+
+from app.utils.metrics import metrics
+
+# 是否在 Anthropic 原生请求中设置 cache_control 断点
+ANTHROPIC_PROMPT_CACHE = os.getenv("ANTHROPIC_PROMPT_CACHE", "false").lower() == "true"
+# OpenAI 兼容的流式请求是否要求上游在最后返回 usage（stream_options.include_usage）
+UPSTREAM_STREAM_USAGE = os.getenv("UPSTREAM_STREAM_USAGE", "true").lower() == "true"
+
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+class CacheUsage(NamedTuple):
+    """一次上游请求的输入 token 数和其中命中上游缓存的 token 数"""
+
+    prompt_tokens: int
+    cached_tokens: int
+
+
+def _canonical_part(part):
+    if not isinstance(part, dict):
+        return part
+    ordered = {"type": part["type"]} if "type" in part else {}
+    for key in sorted(part):
+        if key != "type" and part[key] is not None:
+            ordered[key] = part[key]
+    return ordered
+
+
+def canonical_message(message: dict) -> dict:
+    """按固定字段顺序重建消息，不修改原消息"""
+    content = message.get("content")
+    ordered = {"role": message.get("role"), "content": content}
+    if isinstance(content, list):
+        ordered["content"] = [_canonical_part(part) for part in content]
+    for key in sorted(message):
+        if key not in ("role", "content") and message[key] is not None:
+            ordered[key] = message[key]
+    return ordered
+
+
+def canonical_messages(messages: Sequence[dict]) -> List[dict]:
+    """逐条重建消息，消息顺序保持不变"""
+    return [canonical_message(m) for m in messages]
+
+
+def append_after(content: Union[str, list], suffix: str) -> Union[str, list]:
+    """把 suffix 追加在消息内容之后，原内容的字节保持不变"""
+    if isinstance(content, list):
+        return content + [{"type": "text", "text": suffix}]
+    return f"{content}\n\n{suffix}"
+
+
+def encode_body(data: dict) -> bytes:
+    """上游请求体的统一编码"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _with_cache_control(content: Union[str, list]) -> list:
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": _CACHE_CONTROL}]
+    if not content:
+        return content
+    return content[:-1] + [{**content[-1], "cache_control": _CACHE_CONTROL}]
+
+
+def mark_cache_breakpoints(data: dict) -> dict:
+    """在 Anthropic 请求的 system 和最后一条用户消息之前的消息上设置 cache_control 断点
+
+    最后一条用户消息包含本轮的推理内容，不缓存；下一轮对话的历史以本轮的历史为前缀，
+    Anthropic 会从新断点向前查找到之前写入的缓存。
+    """
+    data = dict(data)
+    if data.get("system"):
+        data["system"] = _with_cache_control(data["system"])
+    messages = data.get("messages") or []
+    # Anthropic 不接受空的 text 块，前一条消息内容为空时不设置断点
+    if len(messages) >= 2 and messages[-2].get("content"):
+        previous = messages[-2]
+        data["messages"] = messages[:-2] + [
+            {**previous, "content": _with_cache_control(previous["content"])},
+            messages[-1],
+        ]
+    return data
+
+
+def parse_cache_usage(usage: Optional[dict]) -> Optional[CacheUsage]:
+    """解析上游返回的 usage，没有输入 token 信息时返回 None"""
+    if not isinstance(usage, dict):
+        return None
+    if "prompt_cache_hit_tokens" in usage:
+        hit = usage.get("prompt_cache_hit_tokens") or 0
+        miss = usage.get("prompt_cache_miss_tokens") or 0
+        return CacheUsage(hit + miss, hit)
+    if "cache_read_input_tokens" in usage or "input_tokens" in usage:
+        read = usage.get("cache_read_input_tokens") or 0
+        created = usage.get("cache_creation_input_tokens") or 0
+        return CacheUsage((usage.get("input_tokens") or 0) + read + created, read)
+    if "prompt_tokens" in usage:
+        details = usage.get("prompt_tokens_details") or {}
+        return CacheUsage(usage.get("prompt_tokens") or 0, details.get("cached_tokens") or 0)
+    return None
+
+
+def record_cache_usage(stage: str, model: str, usage: Optional[dict]) -> Optional[CacheUsage]:
+    """解析上游 usage 并计入缓存命中指标"""
+    parsed = parse_cache_usage(usage)
+    if parsed is not None and parsed.prompt_tokens:
+        metrics.inc("upstream_prompt_tokens_total", parsed.prompt_tokens, stage=stage, model=model)
+        metrics.inc(
+            "upstream_cached_prompt_tokens_total", parsed.cached_tokens, stage=stage, model=model
+        )
+    return parsed
@@ -0,0 +1,291 @@
+"""近似重复请求的推理内容缓存
+
+对规范化后的对话文本计算 64 位 SimHash，海明距离不超过 REASONING_CACHE_THRESHOLD、
+对话中的数字依次完全相同，且 API 密钥、请求模型、推理模型和采样参数完全相同时，复用之前保存的
+推理内容，跳过推理阶段。
+
+- 规范化：转小写，按词切分（中日韩文字按字），运算符和标点各自作为一个词保留
+- 特征：相邻两个词组成的词对
+- 索引：把 64 位签名切成 THRESHOLD + 1 段（LSH 分桶），由抽屉原理，距离不超过阈值的
+  两个签名至少有一段完全相同，因此只需比较同桶的候选
+- 淘汰：按条目数和总字节数的 LRU，另有过期时间
+
+REASONING_CACHE_DISABLED_MODELS 可以按请求模型关闭缓存。缓存默认按 API 密钥隔离，
+REASONING_CACHE_SHARED=true 时不同密钥之间共享。签名使用进程内的 hash()，缓存只存在于内存中，
+不跨进程共享。
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, Hashable, List, Optional, Set, Tuple
+
+from app.utils.event_loop import OFFLOAD_SIGNATURE_CHARS, messages_size, run_cpu
+from app.utils.metrics import metrics
+from app.utils.usage_ledger import current_api_key, key_id
+
+# 是否启用推理缓存
+REASONING_CACHE_ENABLED = os.getenv("REASONING_CACHE_ENABLED", "false").lower() == "true"
+# 允许的最大海明距离（0-15）
+REASONING_CACHE_THRESHOLD = int(os.getenv("REASONING_CACHE_THRESHOLD", "3"))
+# 最多保存的条目数和推理内容总字节数
+REASONING_CACHE_MAX_ENTRIES = int(os.getenv("REASONING_CACHE_MAX_ENTRIES", "10000"))
+REASONING_CACHE_MAX_BYTES = int(os.getenv("REASONING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# 单条推理内容超过该字节数时不缓存
+REASONING_CACHE_MAX_ENTRY_BYTES = int(os.getenv("REASONING_CACHE_MAX_ENTRY_BYTES", str(256 * 1024)))
+# 条目过期秒数
+REASONING_CACHE_TTL = float(os.getenv("REASONING_CACHE_TTL", "3600"))
+# 不使用缓存的请求模型，逗号分隔
+REASONING_CACHE_DISABLED_MODELS = frozenset(
+    m.strip() for m in os.getenv("REASONING_CACHE_DISABLED_MODELS", "").split(",") if m.strip()
+)
+# 是否在不同 API 密钥之间共享缓存
+REASONING_CACHE_SHARED = os.getenv("REASONING_CACHE_SHARED", "false").lower() == "true"
+
+_TOKEN = re.compile(r"[぀-ヿ㐀-鿿가-힯]|[^\W_]+|[^\w\s]")
+_NUMBER = re.compile(r"\d+")
+_MASK = (1 << 64) - 1
+# _BIT_TABLES[j] 把每个字节映射为它的第 j 位
+_BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+
+
+def normalize(messages: List[dict]) -> List[str]:
+    """把对话规范化为词列表，角色作为分隔词保留，数字、运算符和标点不做归一"""
+    tokens = []
+    for message in messages or ():
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+        if not isinstance(content, str):
+            continue
+        tokens.append(f"<{message.get('role', '')}>")
+        tokens.extend(_TOKEN.findall(content.lower()))
+    return tokens
+
+
+def numbers(tokens: List[str]) -> Tuple[str, ...]:
+    """对话中依次出现的数字，命中时必须完全相同"""
+    return tuple(n for token in tokens for n in _NUMBER.findall(token))
+
+
+def simhash(tokens: List[str]) -> int:
+    """相邻词对特征的 64 位 SimHash
+
+    逐位计数通过 bytes.translate / count 在 C 中完成，耗时与特征数近似线性且常数很小。
+    """
+    if len(tokens) < 2:
+        tokens = tokens + [""]
+    features = [hash(f"{a} {b}") & _MASK for a, b in zip(tokens, tokens[1:])]
+    data = b"".join(h.to_bytes(8, "little") for h in features)
+    half = len(features) / 2
+    signature = 0
+    for byte in range(8):
+        column = data[byte::8]
+        for bit in range(8):
+            if column.translate(_BIT_TABLES[bit]).count(1) > half:
+                signature |= 1 << (byte * 8 + bit)
+    return signature
+
+
+class _Entry:
+    __slots__ = ("scope", "signature", "numbers", "reasoning", "size", "saved_seconds", "created")
+
+    def __init__(
+        self, scope, signature: int, numbers: Tuple[str, ...], reasoning: str, saved_seconds: float
+    ):
+        self.scope = scope
+        self.signature = signature
+        self.numbers = numbers
+        self.reasoning = reasoning
+        self.size = len(reasoning.encode("utf-8"))
+        self.saved_seconds = saved_seconds
+        self.created = time.monotonic()
+
+
+class ReasoningCache:
+    """SimHash + LSH 分桶的推理内容缓存"""
+
+    def __init__(
+        self,
+        enabled: bool = REASONING_CACHE_ENABLED,
+        threshold: int = REASONING_CACHE_THRESHOLD,
+        max_entries: int = REASONING_CACHE_MAX_ENTRIES,
+        max_bytes: int = REASONING_CACHE_MAX_BYTES,
+        ttl: float = REASONING_CACHE_TTL,
+        disabled_models: frozenset = REASONING_CACHE_DISABLED_MODELS,
+        shared: bool = REASONING_CACHE_SHARED,
+    ):
+        self.enabled = enabled
+        self.threshold = max(0, min(threshold, 15))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disabled_models = disabled_models
+        self.shared = shared
+        bands = self.threshold + 1
+        self._band_width = 64 // bands
+        self._bands = bands
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[Tuple, Set[int]]] = [{} for _ in range(bands)]
+        self._next_id = 0
+        self.bytes = 0
+
+    def _band_keys(self, scope, signature: int):
+        mask = (1 << self._band_width) - 1
+        for band in range(self._bands):
+            yield band, (scope, (signature >> (band * self._band_width)) & mask)
+
+    def slot(
+        self, messages: List[dict], model: str, reasoning_model: str, params: Hashable
+    ) -> Optional["CacheSlot"]:
+        """为请求创建缓存槽位，未启用或该模型已关闭时返回 None
+
+        查找在推理阶段开始时进行（见 CacheSlot.wrap），签名计算可以卸载到 CPU 线程池。
+        未开启共享时缓存范围包含当前请求的 API 密钥。
+        """
+        if not self.enabled or model in self.disabled_models:
+            return None
+        key = None if self.shared else key_id(current_api_key.get())
+        return CacheSlot(self, (model, reasoning_model, params, key), messages)
+
+    def lookup(self, scope, signature: int, numbers: Tuple[str, ...]) -> Optional[_Entry]:
+        """返回数字完全相同的条目中距离最近且未过期的一个"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for band, key in self._band_keys(scope, signature):
+                candidates |= self._buckets[band].get(key, set())
+            best, best_distance = None, self.threshold + 1
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                if entry.numbers != numbers:
+                    continue
+                distance = (entry.signature ^ signature).bit_count()
+                if distance < best_distance:
+                    best, best_distance = entry_id, distance
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return self._entries[best]
+
+    def store(
+        self, scope, signature: int, numbers: Tuple[str, ...], reasoning: str, saved_seconds: float
+    ) -> None:
+        entry = _Entry(scope, signature, numbers, reasoning, saved_seconds)
+        if entry.size > REASONING_CACHE_MAX_ENTRY_BYTES:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self.bytes += entry.size
+            for band, key in self._band_keys(scope, signature):
+                self._buckets[band].setdefault(key, set()).add(entry_id)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self.bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                metrics.inc("reasoning_cache_evictions_total")
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self.bytes -= entry.size
+        for band, key in self._band_keys(entry.scope, entry.signature):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+
+def _signature(messages: List[dict]) -> Tuple[int, Tuple[str, ...]]:
+    tokens = normalize(messages)
+    return simhash(tokens), numbers(tokens)
+
+
+class CacheSlot:
+    """单个请求的缓存槽位，未命中时在推理完成后写入缓存"""
+
+    __slots__ = ("cache", "scope", "messages", "signature", "numbers")
+
+    def __init__(self, cache: ReasoningCache, scope, messages: List[dict]):
+        self.cache = cache
+        self.scope = scope
+        self.messages = messages
+        self.signature: Optional[int] = None
+        self.numbers: Tuple[str, ...] = ()
+
+    async def lookup(self) -> Optional[str]:
+        """计算签名并查找缓存，返回命中的推理内容"""
+        model = self.scope[0]
+        self.signature, self.numbers = await run_cpu(
+            "signature", messages_size(self.messages), OFFLOAD_SIGNATURE_CHARS,
+            _signature, self.messages,
+        )
+        entry = self.cache.lookup(self.scope, self.signature, self.numbers)
+        metrics.inc("reasoning_cache_lookups_total", model=model, result="hit" if entry else "miss")
+        if entry is None:
+            return None
+        metrics.inc("reasoning_cache_saved_seconds_total", entry.saved_seconds, model=model)
+        return entry.reasoning
+
+    async def wrap(self, stream: AsyncGenerator[tuple, None]) -> AsyncGenerator[tuple, None]:
+        """包装推理模型的流：命中时直接返回缓存的推理内容，否则转发并在推理正常结束后保存"""
+        try:
+            reasoning = await self.lookup()
+        except BaseException:
+            await stream.aclose()
+            raise
+        if reasoning is not None:
+            await stream.aclose()
+            yield "reasoning", reasoning
+            yield "content", ""
+            return
+
+        started = time.monotonic()
+        parts, size = [], 0
+        async with aclosing(stream) as upstream:
+            async for content_type, content in upstream:
+                if size <= REASONING_CACHE_MAX_ENTRY_BYTES:
+                    # 与 _Entry.size 一致按 UTF-8 字节计数
+                    if content_type == "reasoning":
+                        parts.append(content)
+                        size += len(content.encode("utf-8"))
+                    elif content_type == "reasoning_frame":
+                        parts.append(content[1])
+                        size += len(content[1].encode("utf-8"))
+                if content_type == "content" and parts and size <= REASONING_CACHE_MAX_ENTRY_BYTES:
+                    # 出现回答内容说明推理完整结束
+                    self.cache.store(
+                        self.scope, self.signature, self.numbers, "".join(parts),
+                        time.monotonic() - started,
+                    )
+                    parts = []
+                yield content_type, content
+
+
+def cached_reasoning(
+    slot: Optional[CacheSlot], stream: AsyncGenerator[tuple, None]
+) -> AsyncGenerator[tuple, None]:
+    """slot 为 None（未启用缓存或跳过推理）时原样返回推理模型的流"""
+    return stream if slot is None else slot.wrap(stream)
+
+
+reasoning_cache = ReasoningCache()
+
+
+def _collect_cache_metrics():
+    if reasoning_cache.enabled:
+        yield "reasoning_cache_entries", {}, len(reasoning_cache._entries)
+        yield "reasoning_cache_bytes", {}, reasoning_cache.bytes
+
+
+metrics.register_collector(_collect_cache_metrics)
+
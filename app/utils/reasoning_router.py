@@ -0,0 +1,124 @@
+"""推理阶段路由
+
+在调用推理模型之前，根据请求的本地特征决定是否跳过推理阶段，直接把请求交给回答模型。
+按以下顺序判断，命中即返回：
+
+1. 请求体中的 skip_reasoning 字段（始终生效，即使未启用路由）
+2. ROUTER_REASON_KEYWORDS / ROUTER_REASON_PATTERN 命中：保留推理
+3. ROUTER_SKIP_KEYWORDS / ROUTER_SKIP_PATTERN 命中：跳过推理
+4. 最后一条用户消息的字符数、token 数以及对话轮数都不超过阈值：视为简单请求，跳过推理
+5. 其余情况保留推理
+
+跳过推理节省的时间按最近观测到的推理阶段平均耗时估算。
+"""
+
+import os
+import re
+from typing import NamedTuple, Optional
+
+from app.utils.chat_request import ChatRequest
+from app.utils.metrics import metrics
+from app.utils.tokenizer import count_tokens
+
+# 是否启用基于规则和特征的路由
+REASONING_ROUTER_ENABLED = os.getenv("REASONING_ROUTER_ENABLED", "false").lower() == "true"
+# 简单请求的最大字符数、token 数和用户轮数
+ROUTER_MAX_CHARS = int(os.getenv("ROUTER_MAX_CHARS", "200"))
+ROUTER_MAX_TOKENS = int(os.getenv("ROUTER_MAX_TOKENS", "60"))
+ROUTER_MAX_DEPTH = int(os.getenv("ROUTER_MAX_DEPTH", "2"))
+
+
+def _keywords(name: str) -> tuple:
+    return tuple(k.strip().lower() for k in os.getenv(name, "").split(",") if k.strip())
+
+
+def _pattern(name: str) -> Optional[re.Pattern]:
+    value = os.getenv(name, "")
+    return re.compile(value, re.IGNORECASE | re.DOTALL) if value else None
+
+
+class RoutingDecision(NamedTuple):
+    """路由结果"""
+
+    skip: bool
+    reason: str
+
+
+def _text(content) -> str:
+    """提取消息内容中的文本，兼容多模态的 content 列表"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return ""
+
+
+class ReasoningRouter:
+    """根据请求特征决定是否跳过推理阶段"""
+
+    def __init__(
+        self,
+        enabled: bool = REASONING_ROUTER_ENABLED,
+        max_chars: int = ROUTER_MAX_CHARS,
+        max_tokens: int = ROUTER_MAX_TOKENS,
+        max_depth: int = ROUTER_MAX_DEPTH,
+    ):
+        self.enabled = enabled
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.max_depth = max_depth
+        self.skip_keywords = _keywords("ROUTER_SKIP_KEYWORDS")
+        self.reason_keywords = _keywords("ROUTER_REASON_KEYWORDS")
+        self.skip_pattern = _pattern("ROUTER_SKIP_PATTERN")
+        self.reason_pattern = _pattern("ROUTER_REASON_PATTERN")
+
+    def decide(self, chat: ChatRequest) -> RoutingDecision:
+        """判断请求是否跳过推理阶段"""
+        if chat.skip_reasoning is not None:
+            return RoutingDecision(chat.skip_reasoning, "flag")
+        if not self.enabled:
+            return RoutingDecision(False, "disabled")
+
+        user_messages = [m for m in chat.messages if m.get("role") == "user"]
+        if not user_messages:
+            return RoutingDecision(False, "default")
+        prompt = _text(user_messages[-1].get("content"))
+        lowered = prompt.lower()
+
+        if any(k in lowered for k in self.reason_keywords) or (
+            self.reason_pattern is not None and self.reason_pattern.search(prompt)
+        ):
+            return RoutingDecision(False, "rule")
+        if any(k in lowered for k in self.skip_keywords) or (
+            self.skip_pattern is not None and self.skip_pattern.search(prompt)
+        ):
+            return RoutingDecision(True, "rule")
+
+        if (
+            len(prompt) <= self.max_chars
+            and len(user_messages) <= self.max_depth
+            and count_tokens(prompt) <= self.max_tokens
+        ):
+            return RoutingDecision(True, "trivial")
+        return RoutingDecision(False, "default")
+
+    def route(self, chat: ChatRequest) -> RoutingDecision:
+        """判断并记录路由指标"""
+        model = chat.model
+        decision = self.decide(chat)
+        metrics.inc(
+            "reasoning_router_decisions_total",
+            model=model,
+            decision="skip" if decision.skip else "reason",
+            reason=decision.reason,
+        )
+        if decision.skip:
+            total, count = metrics.get_summary("upstream_stage_seconds", stage="reasoning")
+            if count:
+                metrics.inc("reasoning_router_saved_seconds_total", total / count, model=model)
+        return decision
+
+
+reasoning_router = ReasoningRouter()
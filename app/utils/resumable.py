@@ -0,0 +1,242 @@
+"""可续传的流式响应
+
+启用后每个流式响应的流水线在独立任务中运行，输出的 chunk 按序号保存在有界的回放缓冲区中，
+每个 chunk 带有 SSE "id: <流标识>:<序号>" 字段。客户端断开后流水线继续运行
+SSE_RESUME_GRACE 秒，期间（以及流结束后 SSE_RESUME_TTL 秒内）客户端带着
+Last-Event-ID 请求头重新发起请求即可接上原来的流，只收到缺失的 chunk；
+宽限期内没有重新连接时取消上游请求。
+
+- 回放缓冲区超过 SSE_RESUME_MAX_BYTES 时丢弃最早的已发送 chunk；未发送的 chunk 不会丢弃，
+  缓冲区已满且没有客户端读取时流水线暂停，形成背压
+- 续传只允许同一个 API 密钥
+- 同时保存的流超过 SSE_RESUME_MAX_STREAMS 时新的流不再支持续传（照常输出，不带 id）
+"""
+
+import asyncio
+import os
+import secrets
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator, Deque, Dict, Optional, Tuple
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+# 是否启用续传
+SSE_RESUME_ENABLED = os.getenv("SSE_RESUME_ENABLED", "false").lower() == "true"
+# 客户端断开后等待重新连接的秒数，超时后取消上游请求
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "30"))
+# 流结束后保留回放缓冲区的秒数
+SSE_RESUME_TTL = float(os.getenv("SSE_RESUME_TTL", "60"))
+# 单个流回放缓冲区的最大字节数
+SSE_RESUME_MAX_BYTES = int(os.getenv("SSE_RESUME_MAX_BYTES", str(1024 * 1024)))
+# 同时保存的可续传流的最大数量
+SSE_RESUME_MAX_STREAMS = int(os.getenv("SSE_RESUME_MAX_STREAMS", "1000"))
+
+
+class ResumeError(Exception):
+    """无法续传，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_event_id(value: str) -> Optional[Tuple[str, int]]:
+    """解析 "流标识:序号" 格式的事件 ID"""
+    key, sep, seq = value.strip().rpartition(":")
+    if not sep or not key or not seq.isdigit():
+        return None
+    return key, int(seq)
+
+
+class ResumableStream:
+    """单个可续传的流：生产任务 + 回放缓冲区"""
+
+    def __init__(self, registry: "ResumableStreams", key: str, owner: str):
+        self.registry = registry
+        self.key = key
+        self.owner = owner
+        self.chunks: Deque[bytes] = deque()
+        # chunks[0] 的序号和下一个 chunk 的序号
+        self.first_seq = 0
+        self.next_seq = 0
+        self.bytes = 0
+        # 当前客户端已经读取的最后一个序号
+        self.delivered = -1
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._consumer = 0
+        self._attached = False
+        self._grace: Optional[asyncio.TimerHandle] = None
+        self._wakeup = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def _wait(self) -> None:
+        await self._wakeup.wait()
+
+    async def produce(self, source: AsyncGenerator[bytes, None]) -> None:
+        try:
+            async with aclosing(source) as chunks:
+                async for chunk in chunks:
+                    self.chunks.append(chunk)
+                    self.bytes += len(chunk)
+                    self.next_seq += 1
+                    self._notify()
+                    while self.bytes > self.registry.max_bytes and not self._trim():
+                        await self._wait()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"可续传流 {self.key} 的流水线异常结束: {e}")
+        finally:
+            self.done = True
+            self._notify()
+            self.registry.finished(self)
+
+    def _trim(self) -> bool:
+        """丢弃最早的已发送 chunk，返回缓冲区是否回到上限以内"""
+        while self.bytes > self.registry.max_bytes and self.chunks and self.first_seq <= self.delivered:
+            self.bytes -= len(self.chunks.popleft())
+            self.first_seq += 1
+        return self.bytes <= self.registry.max_bytes
+
+    def check_resume(self, owner: str, last_seq: int) -> None:
+        """检查能否从 last_seq 之后续传
+
+        Raises:
+            ResumeError: 密钥不同或缺失的 chunk 已被丢弃
+        """
+        if owner != self.owner:
+            raise ResumeError(403, "无权续传该流")
+        if last_seq + 1 < self.first_seq:
+            raise ResumeError(410, "缺失的内容已超出回放缓冲区，请重新发起请求")
+
+    async def attach(self, last_seq: int = -1) -> AsyncGenerator[bytes, None]:
+        """从 last_seq 之后开始输出，新的连接会接管之前的连接"""
+        self._consumer += 1
+        token = self._consumer
+        self._attached = True
+        last_seq = min(last_seq, self.next_seq - 1)
+        self.delivered = last_seq
+        if last_seq + 1 < self.first_seq:
+            return  # 检查之后缺失的内容已被丢弃
+        if self._grace is not None:
+            self._grace.cancel()
+            self._grace = None
+        self._notify()  # 让之前的连接退出
+
+        seq = last_seq + 1
+        prefix = f"id: {self.key}:".encode()
+        try:
+            while token == self._consumer:
+                if seq < self.next_seq:
+                    chunk = self.chunks[seq - self.first_seq]
+                    yield prefix + str(seq).encode() + b"\n" + chunk
+                    if token != self._consumer:
+                        return
+                    self.delivered = seq
+                    seq += 1
+                    self._notify()  # 唤醒等待缓冲区空间的生产任务
+                elif self.done:
+                    return
+                else:
+                    await self._wait()
+        finally:
+            if token == self._consumer:
+                self._attached = False
+                if not self.done:
+                    self._detached()
+
+    def _detached(self) -> None:
+        metrics.inc("sse_resume_detached_total")
+        self.start_grace()
+
+    def start_grace(self) -> None:
+        """没有客户端读取时开始计时，超时后取消流水线"""
+        loop = asyncio.get_running_loop()
+        self._grace = loop.call_later(self.registry.grace, self._expire)
+
+    def _expire(self) -> None:
+        self._grace = None
+        if not self._attached and not self.done and self.task is not None:
+            logger.info(f"可续传流 {self.key} 在宽限期内没有重新连接，取消上游请求")
+            metrics.inc("sse_resume_cancelled_total")
+            self.task.cancel()
+
+
+class ResumableStreams:
+    """可续传流的注册表"""
+
+    def __init__(
+        self,
+        enabled: bool = SSE_RESUME_ENABLED,
+        grace: float = SSE_RESUME_GRACE,
+        ttl: float = SSE_RESUME_TTL,
+        max_bytes: int = SSE_RESUME_MAX_BYTES,
+        max_streams: int = SSE_RESUME_MAX_STREAMS,
+    ):
+        self.enabled = enabled
+        self.grace = grace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_streams = max_streams
+        self._streams: Dict[str, ResumableStream] = {}
+
+    def open(self, source: AsyncGenerator[bytes, None], owner: str) -> AsyncGenerator[bytes, None]:
+        """在后台任务中运行流水线，返回带 SSE id 的输出"""
+        if len(self._streams) >= self.max_streams:
+            metrics.inc("sse_resume_rejected_total")
+            return source
+        key = secrets.token_urlsafe(12)
+        stream = ResumableStream(self, key, owner)
+        self._streams[key] = stream
+        stream.task = asyncio.create_task(stream.produce(source))
+        # 响应开始读取前也按未连接处理
+        stream.start_grace()
+        return stream.attach()
+
+    def resume(self, last_event_id: str, owner: str) -> AsyncGenerator[bytes, None]:
+        """接上 Last-Event-ID 对应的流
+
+        Raises:
+            ResumeError: 事件 ID 无效、流已过期或无法续传
+        """
+        parsed = parse_event_id(last_event_id)
+        stream = self._streams.get(parsed[0]) if parsed else None
+        if stream is None:
+            metrics.inc("sse_resume_total", result="expired")
+            raise ResumeError(404, "流不存在或已过期")
+        try:
+            stream.check_resume(owner, parsed[1])
+        except ResumeError as e:
+            metrics.inc("sse_resume_total", result="forbidden" if e.status == 403 else "gone")
+            raise
+        metrics.inc("sse_resume_total", result="resumed")
+        return stream.attach(parsed[1])
+
+    def finished(self, stream: ResumableStream) -> None:
+        asyncio.get_running_loop().call_later(self.ttl, self._streams.pop, stream.key, None)
+
+    async def close(self) -> None:
+        """取消所有仍在运行的流水线"""
+        tasks = [s.task for s in self._streams.values() if s.task is not None and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._streams.clear()
+
+
+resumable_streams = ResumableStreams()
+
+
+def _collect_resume_metrics():
+    if resumable_streams.enabled:
+        yield "sse_resumable_streams", {}, len(resumable_streams._streams)
+        yield "sse_resume_buffer_bytes", {}, sum(s.bytes for s in resumable_streams._streams.values())
+
+
+metrics.register_collector(_collect_resume_metrics)
@@ -0,0 +1,77 @@
+"""OpenAI 格式的 SSE chunk 构造工具"""
+
+import json
+
+
+def error_chunk(chat_id: str, created_time: int, message: str) -> bytes:
+    """构造流式输出中的错误 chunk
+
+    Args:
+        chat_id: 会话 ID
+        created_time: 创建时间戳
+        message: 错误信息
+
+    Returns:
+        bytes: SSE 格式的错误 chunk
+    """
+    response = {
+        "id": chat_id,
+        "object": "chat.completion.chunk",
+        "created": created_time,
+        "error": {"message": message, "type": "server_error"},
+    }
+    return f"data: {json.dumps(response)}\n\n".encode("utf-8")
+
+
+def frame_head(chat_id: str, created_time: int, model: str) -> bytes:
+    """推理 chunk 直通模式使用的 chunk 头部，上游的 "choices" 及之后的字节直接拼接在其后"""
+    return (
+        f'data: {{"id": {json.dumps(chat_id)}, "object": "chat.completion.chunk", '
+        f'"created": {created_time}, "model": {json.dumps(model)}, '
+    ).encode("utf-8")
+
+
+class ChunkEncoder:
+    """预先拼接好固定部分的 chunk 编码器
+
+    输出与对完整响应字典调用 json.dumps 得到的字节完全一致，
+    但每个 chunk 只需转义一次文本内容，无需构造中间字典。
+    """
+
+    __slots__ = ("_reasoning_prefix", "_answer_prefix", "reasoning_head")
+
+    def __init__(
+        self, chat_id: str, created_time: int, reasoning_model: str, answer_model: str
+    ):
+        """初始化编码器
+
+        Args:
+            chat_id: 会话 ID
+            created_time: 创建时间戳
+            reasoning_model: 推理阶段 chunk 中的模型名称
+            answer_model: 回答阶段 chunk 中的模型名称
+        """
+        head = (
+            f'data: {{"id": {json.dumps(chat_id)}, "object": "chat.completion.chunk", '
+            f'"created": {created_time}, "model": '
+        )
+        self._reasoning_prefix = (
+            f'{head}{json.dumps(reasoning_model)}, "choices": [{{"index": 0, '
+            f'"delta": {{"role": "assistant", "reasoning_content": '
+        )
+        self._answer_prefix = (
+            f'{head}{json.dumps(answer_model)}, "choices": [{{"index": 0, '
+            f'"delta": {{"role": "assistant", "content": '
+        )
+        self.reasoning_head = frame_head(chat_id, created_time, reasoning_model)
+
+    def reasoning(self, content: str) -> bytes:
+        """编码一个推理内容 chunk"""
+        return (
+            f'{self._reasoning_prefix}{json.dumps(content)}, "content": ""}}}}]}}\n\n'
+        ).encode("utf-8")
+
+    def answer(self, content: str) -> bytes:
+        """编码一个回答内容 chunk"""
+        return f"{self._answer_prefix}{json.dumps(content)}}}}}]}}\n\n".encode("utf-8")
+
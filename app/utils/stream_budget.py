@@ -0,0 +1,176 @@
+"""流式请求的内存预算与背压配置
+
+每个流式请求持有一个 StreamBudget，用于统计该请求在服务端缓存的字节数
+（输出队列中尚未发送给客户端的数据，以及保留给第二阶段的推理内容）。
+所有请求共享一个全局 MemoryBudget。超出预算时按 STREAM_BUDGET_POLICY 处理：
+
+- truncate: 停止保留更多推理内容（已生成的推理仍会继续发送给客户端）
+- abort: 抛出 BudgetExceededError，由调用方向客户端返回错误并结束流
+"""
+
+import os
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+# 每个流的输出队列长度上限，队列满时上游读取会暂停，形成 TCP 背压
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "32"))
+# 单个流允许缓存的最大字节数
+STREAM_MEMORY_LIMIT = int(os.getenv("STREAM_MEMORY_LIMIT", str(2 * 1024 * 1024)))
+# 所有流共享的最大缓存字节数
+GLOBAL_STREAM_MEMORY_LIMIT = int(
+    os.getenv("GLOBAL_STREAM_MEMORY_LIMIT", str(512 * 1024 * 1024))
+)
+# 超出预算时的处理策略: truncate 或 abort
+STREAM_BUDGET_POLICY = os.getenv("STREAM_BUDGET_POLICY", "truncate").lower()
+
+SUPPORTED_POLICIES = ("truncate", "abort")
+
+
+class BudgetExceededError(Exception):
+    """流的内存预算被耗尽且策略为 abort 时抛出"""
+
+
+class MemoryBudget:
+    """全局内存预算"""
+
+    def __init__(self, limit: int = GLOBAL_STREAM_MEMORY_LIMIT):
+        """初始化全局预算
+
+        Args:
+            limit: 所有流共享的最大缓存字节数
+        """
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.active_streams = 0
+        self.exceeded_total = 0
+
+    def stream(
+        self, limit: int = STREAM_MEMORY_LIMIT, policy: str = STREAM_BUDGET_POLICY
+    ) -> "StreamBudget":
+        """为一个新的流创建预算
+
+        Args:
+            limit: 单个流允许缓存的最大字节数
+            policy: 超出预算时的处理策略
+
+        Returns:
+            StreamBudget: 该流的预算对象，结束时必须调用 close()
+        """
+        if policy not in SUPPORTED_POLICIES:
+            raise ValueError(f"不支持的预算策略: {policy}")
+        self.active_streams += 1
+        return StreamBudget(self, limit, policy)
+
+    def stats(self) -> dict:
+        return {
+            "active_streams": self.active_streams,
+            "used_bytes": self.used,
+            "peak_bytes": self.peak,
+            "limit_bytes": self.limit,
+            "exceeded_total": self.exceeded_total,
+        }
+
+
+class StreamBudget:
+    """单个流的内存预算"""
+
+    __slots__ = ("parent", "limit", "policy", "used", "exceeded", "closed")
+
+    def __init__(self, parent: MemoryBudget, limit: int, policy: str):
+        self.parent = parent
+        self.limit = limit
+        self.policy = policy
+        self.used = 0
+        self.exceeded = False
+        self.closed = False
+
+    def charge(self, size: int, enforce: bool = True) -> bool:
+        """记录新缓存的字节数
+
+        Args:
+            size: 字节数
+            enforce: 是否执行预算检查；为 False 时只记账（用于已由队列长度约束的数据）
+
+        Returns:
+            bool: 是否成功记账；超出预算且策略为 truncate 时返回 False
+
+        Raises:
+            BudgetExceededError: 超出预算且策略为 abort
+        """
+        parent = self.parent
+        if enforce and (
+            self.used + size > self.limit or parent.used + size > parent.limit
+        ):
+            if not self.exceeded:
+                self.exceeded = True
+                parent.exceeded_total += 1
+                logger.warning(
+                    f"流内存预算耗尽: 当前 {self.used}/{self.limit} 字节, "
+                    f"全局 {parent.used}/{parent.limit} 字节, 策略 {self.policy}"
+                )
+            if self.policy == "abort":
+                raise BudgetExceededError("stream memory budget exceeded")
+            return False
+
+        self.used += size
+        parent.used += size
+        if parent.used > parent.peak:
+            parent.peak = parent.used
+        return True
+
+    def release(self, size: int) -> None:
+        """释放已发送或已丢弃数据的记账"""
+        size = min(size, self.used)
+        self.used -= size
+        self.parent.used -= size
+
+    def close(self) -> None:
+        """流结束时归还全部预算"""
+        if self.closed:
+            return
+        self.closed = True
+        self.release(self.used)
+        self.parent.active_streams -= 1
+
+
+class ReasoningBuffer:
+    """保留给第二阶段的推理内容，按流预算记账
+
+    长度增量统计，日志无需反复拼接全部内容。
+    """
+
+    __slots__ = ("budget", "parts", "length", "truncated")
+
+    def __init__(self, budget: StreamBudget):
+        self.budget = budget
+        self.parts = []
+        self.length = 0
+        self.truncated = False
+
+    def append(self, content: str) -> None:
+        """追加推理内容，超出预算时按策略截断或抛出 BudgetExceededError"""
+        if self.truncated:
+            return
+        if self.budget.charge(len(content.encode("utf-8"))):
+            self.parts.append(content)
+            self.length += len(content)
+        else:
+            self.truncated = True
+            logger.warning(f"推理内容超出流内存预算，已截断保留 {self.length} 字符")
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+# 全局预算实例
+memory_budget = MemoryBudget()
+
+
+def _collect_budget_metrics():
+    for name, value in memory_budget.stats().items():
+        yield f"stream_memory_{name}", {}, value
+
+
+metrics.register_collector(_collect_budget_metrics)
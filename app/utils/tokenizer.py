@@ -0,0 +1,106 @@
+"""Token 计数
+
+tiktoken 延迟导入，编码文件从本地缓存目录加载（TOKENIZER_CACHE_DIR，对应 tiktoken 的
+TIKTOKEN_CACHE_DIR）。镜像构建时预先下载到该目录，运行时无需访问网络；服务启动时在
+lifespan 中预热。预热完成前以及编码无法加载时（例如离线且缓存缺失）按字符数估算，不会阻塞请求。
+"""
+
+import os
+import threading
+from pathlib import Path
+
+from app.utils.event_loop import OFFLOAD_TOKENIZE_CHARS, run_cpu
+from app.utils.logger import logger
+
+# 与 gpt-4o 相同的编码
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# tiktoken 编码文件缓存目录
+TOKENIZER_CACHE_DIR = os.getenv(
+    "TOKENIZER_CACHE_DIR",
+    str(Path(__file__).resolve().parent.parent.parent / ".tiktoken_cache"),
+)
+# 估算模式下平均每个 token 的字符数
+FALLBACK_CHARS_PER_TOKEN = 4
+
+_lock = threading.Lock()
+_encoding = None
+_loaded = False
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+
+
+def _load(blocking: bool = True):
+    """加载编码，失败时返回 None
+
+    Args:
+        blocking: 其他线程正在加载时是否等待；为 False 时直接返回 None
+    """
+    global _encoding, _loaded
+    if not _lock.acquire(blocking=blocking):
+        return None
+    try:
+        if _loaded:
+            return _encoding
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", TOKENIZER_CACHE_DIR)
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            logger.warning(
+                f"无法加载 tokenizer {TOKENIZER_ENCODING}（缓存目录 {os.environ['TIKTOKEN_CACHE_DIR']}）: {e}，"
+                "将按字符数估算 token"
+            )
+            _encoding = None
+        _loaded = True
+        return _encoding
+    finally:
+        _lock.release()
+
+
+def warmup() -> bool:
+    """加载并预热编码
+
+    Returns:
+        bool: 是否成功加载了真实编码
+    """
+    encoding = _load()
+    if encoding is None:
+        return False
+    encoding.encode("warmup")
+    return True
+
+
+def start_warmup() -> None:
+    """在后台线程中预热编码，已经加载或正在加载时不做任何事"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _loaded or _warmup_thread is not None:
+            return
+        _warmup_thread = threading.Thread(target=warmup, name="tokenizer-warmup", daemon=True)
+        _warmup_thread.start()
+
+
+def is_loaded() -> bool:
+    return _loaded
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的 token 数
+
+    预热尚未完成时不在调用方线程中加载编码（调用方可能是事件循环），而是在后台开始预热并
+    先按字符数估算。
+    """
+    if not _loaded:
+        start_warmup()
+        encoding = None
+    else:
+        encoding = _encoding
+    if encoding is None:
+        return (len(text) + FALLBACK_CHARS_PER_TOKEN - 1) // FALLBACK_CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+async def count_tokens_offloaded(text: str) -> int:
+    """计算文本的 token 数，较长的文本在 CPU 线程池中计算（tiktoken 编码时释放 GIL）"""
+    return await run_cpu("tokenize", len(text), OFFLOAD_TOKENIZE_CHARS, count_tokens, text)
@@ -0,0 +1,287 @@
+"""请求阶段追踪
+
+每个 HTTP 请求创建一个 Trace，通过 contextvar 在鉴权、参数解析和上游客户端之间传递，
+记录以下阶段：
+
+- auth / parse: 鉴权与请求体解析耗时
+- reasoning / answer: 推理与回答阶段上游请求的起止（开始发送请求到停止读取响应）
+- {stage}_connect: 从开始请求到收到上游响应头
+- {stage}_first_token: 从收到响应头到收到首个响应数据
+- total: 请求总耗时
+
+非流式响应通过 Server-Timing 响应头返回；流式响应在结束时追加一条 SSE 注释
+`: server-timing ...`。配置 TRACE_LOG_FILE 后，每个请求额外以 OTLP JSON 格式写入一行到
+按大小轮转的本地文件，写入在后台线程中完成。trace id 通过 traceparent 请求头传递给上游，
+请求自带的 traceparent 会被沿用。
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.utils.logger import logger
+
+# 是否启用请求追踪
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# OTLP JSON 追踪日志文件，留空则不写文件
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "")
+# 单个追踪日志文件的最大字节数
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+# 保留的历史追踪日志文件数
+TRACE_LOG_BACKUP_COUNT = int(os.getenv("TRACE_LOG_BACKUP_COUNT", "5"))
+
+SERVICE_NAME = "deepclaude"
+
+# Server-Timing 中按此顺序输出的耗时
+_TIMING_ORDER = (
+    "auth",
+    "parse",
+    "reasoning_connect",
+    "reasoning_first_token",
+    "reasoning",
+    "answer_connect",
+    "answer_first_token",
+    "answer",
+    "total",
+)
+
+
+class Trace:
+    """单个请求的追踪数据
+
+    时间点使用 perf_counter 记录，导出时换算为 Unix 纳秒时间戳。
+    """
+
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "name",
+        "start_unix_ns",
+        "start",
+        "end",
+        "spans",
+        "events",
+    )
+
+    def __init__(self, name: str, traceparent: Optional[str] = None):
+        self.trace_id = None
+        self.parent_span_id = None
+        if traceparent:
+            parts = traceparent.strip().split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                self.trace_id = parts[1].lower()
+                self.parent_span_id = parts[2].lower()
+        self.trace_id = self.trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.name = name
+        self.start_unix_ns = time.time_ns()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        # 阶段名 -> [开始, 结束]
+        self.spans: Dict[str, List[Optional[float]]] = {}
+        # 事件名 -> 首次发生时间
+        self.events: Dict[str, float] = {}
+
+    def start_span(self, name: str) -> None:
+        """开始一个阶段，同名阶段只记录第一次"""
+        if name not in self.spans:
+            self.spans[name] = [time.perf_counter(), None]
+
+    def end_span(self, name: str) -> None:
+        span = self.spans.get(name)
+        if span is not None and span[1] is None:
+            span[1] = time.perf_counter()
+
+    def event(self, name: str) -> None:
+        """记录事件，同名事件只记录第一次"""
+        if name not in self.events:
+            self.events[name] = time.perf_counter()
+
+    def traceparent(self) -> str:
+        """传给上游的 W3C traceparent 请求头"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def timings(self) -> Dict[str, float]:
+        """各阶段耗时（毫秒）"""
+        now = time.perf_counter()
+        result = {}
+        for name, (start, end) in self.spans.items():
+            result[name] = ((end or now) - start) * 1000
+            connect = self.events.get(f"{name}_connect")
+            if connect is not None:
+                result[f"{name}_connect"] = (connect - start) * 1000
+                first = self.events.get(f"{name}_first_token")
+                if first is not None:
+                    result[f"{name}_first_token"] = (first - connect) * 1000
+        result["total"] = ((self.end or now) - self.start) * 1000
+        return result
+
+    def server_timing(self) -> str:
+        """Server-Timing 格式的耗时"""
+        timings = self.timings()
+        return ", ".join(
+            f"{name};dur={timings[name]:.1f}" for name in _TIMING_ORDER if name in timings
+        )
+
+    def to_otlp(self) -> dict:
+        """导出为 OTLP JSON（resourceSpans）"""
+
+        def unix_ns(t: float) -> str:
+            return str(self.start_unix_ns + int((t - self.start) * 1e9))
+
+        end = self.end or time.perf_counter()
+        root = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2,  # SERVER
+            "startTimeUnixNano": unix_ns(self.start),
+            "endTimeUnixNano": unix_ns(end),
+            "events": [
+                {"name": name, "timeUnixNano": unix_ns(t)}
+                for name, t in sorted(self.events.items(), key=lambda item: item[1])
+            ],
+        }
+        if self.parent_span_id:
+            root["parentSpanId"] = self.parent_span_id
+        spans = [root]
+        for name, (start, span_end) in self.spans.items():
+            spans.append(
+                {
+                    "traceId": self.trace_id,
+                    "spanId": secrets.token_hex(8),
+                    "parentSpanId": self.span_id,
+                    "name": name,
+                    "kind": 1,  # INTERNAL
+                    "startTimeUnixNano": unix_ns(start),
+                    "endTimeUnixNano": unix_ns(span_end or end),
+                }
+            )
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": "app.utils.tracing"}, "spans": spans}],
+                }
+            ]
+        }
+
+    def finish(self) -> None:
+        """结束追踪并写入追踪日志，重复调用无效"""
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if _span_logger is not None:
+            _span_logger.info(json.dumps(self.to_otlp(), ensure_ascii=False))
+
+
+current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+@contextmanager
+def span(name: str):
+    """在当前请求的追踪中记录一个阶段，没有追踪时不做任何事"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    trace.start_span(name)
+    try:
+        yield
+    finally:
+        trace.end_span(name)
+
+
+def _setup_span_logger() -> Optional[logging.Logger]:
+    """创建写追踪日志的 logger，文件写入由 QueueListener 在后台线程中完成"""
+    if not TRACING_ENABLED or not TRACE_LOG_FILE:
+        return None
+    directory = os.path.dirname(TRACE_LOG_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        TRACE_LOG_FILE,
+        maxBytes=TRACE_LOG_MAX_BYTES,
+        backupCount=TRACE_LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+
+    span_logger = logging.getLogger("DeepClaude.trace")
+    span_logger.setLevel(logging.INFO)
+    span_logger.propagate = False
+    span_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.info(f"请求追踪日志写入 {TRACE_LOG_FILE}")
+    return span_logger
+
+
+_span_logger = _setup_span_logger()
+
+
+class TraceMiddleware:
+    """为每个 HTTP 请求创建 Trace 的 ASGI 中间件
+
+    非流式响应添加 Server-Timing 响应头；text/event-stream 响应在最后一个 body 消息中
+    追加 Server-Timing 注释。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope.get("headers", ()):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        trace = Trace(f"{scope['method']} {scope['path']}", traceparent)
+        token = current_trace.set(trace)
+        is_stream = False
+
+        async def send_with_timing(message):
+            nonlocal is_stream
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                for key, value in headers:
+                    if key.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        is_stream = True
+                        break
+                if not is_stream:
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            elif (
+                is_stream
+                and message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+            ):
+                trailer = f": server-timing {trace.server_timing()}\n\n".encode("latin-1")
+                message = {**message, "body": message.get("body", b"") + trailer}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            trace.finish()
@@ -0,0 +1,297 @@
+"""按 API 密钥和模型统计用量
+
+请求结束时只把已有的文本（消息、推理内容、回答片段）放入有界队列，不在事件循环中计算 token。
+后台线程负责计算 token，按 (密钥, 模型, 分钟) 在内存中聚合，每 USAGE_FLUSH_INTERVAL 秒批量
+写入存储，进程崩溃时最多丢失一个刷新周期内的用量。队列已满时丢弃记录并计数，不阻塞请求。
+
+存储可通过 USAGE_SINK 替换：sqlite（默认）或 "模块路径:类名"，类需继承 UsageSink 且可无参构造。
+密钥只以 SHA-256 摘要的前 12 位保存。
+"""
+
+import hashlib
+import importlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.tokenizer import count_tokens
+
+# 是否记录用量
+USAGE_LEDGER_ENABLED = os.getenv("USAGE_LEDGER_ENABLED", "false").lower() == "true"
+# 存储实现
+USAGE_SINK = os.getenv("USAGE_SINK", "sqlite")
+# SQLite 文件路径
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", "usage.db")
+# 批量写入间隔（秒）
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+# 待统计请求的队列长度
+USAGE_QUEUE_SIZE = int(os.getenv("USAGE_QUEUE_SIZE", "10000"))
+
+# 当前请求使用的 API 密钥，由鉴权时设置
+current_api_key: ContextVar[Optional[str]] = ContextVar("current_api_key", default=None)
+
+# 一行用量：(密钥摘要, 模型, 分钟起始时间戳, 请求数, prompt_tokens, reasoning_tokens, completion_tokens)
+UsageRow = Tuple[str, str, int, int, int, int, int]
+
+_GROUP_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+def key_id(api_key: Optional[str]) -> str:
+    """API 密钥的摘要，用作用量记录的键"""
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def _message_text(messages: Sequence[dict]) -> str:
+    parts = []
+    for message in messages or ():
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(p.get("text", "") for p in content if isinstance(p, dict))
+    return "\n".join(parts)
+
+
+def _count(text: Union[str, Iterable[str], None]) -> int:
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = "".join(part for part in text if isinstance(part, str))
+    return count_tokens(text)
+
+
+class UsageSink(ABC):
+    """用量存储接口，write 与 query 可能在不同线程中调用"""
+
+    @abstractmethod
+    def write(self, rows: List[UsageRow]) -> None:
+        """累加写入一批用量"""
+
+    @abstractmethod
+    def query(
+        self,
+        key: Optional[str] = None,
+        model: Optional[str] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        group: str = "day",
+    ) -> List[dict]:
+        """按时间粒度汇总用量
+
+        Args:
+            key: 密钥摘要，None 表示全部
+            model: 模型名称，None 表示全部
+            start: 起始时间戳（含）
+            end: 结束时间戳（不含）
+            group: minute, hour, day 或 total
+        """
+
+    def close(self) -> None:
+        """释放资源"""
+
+
+class SQLiteSink(UsageSink):
+    """本地 SQLite 存储"""
+
+    def __init__(self, path: str = USAGE_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "key TEXT NOT NULL, model TEXT NOT NULL, minute INTEGER NOT NULL, "
+            "requests INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, "
+            "reasoning_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+            "PRIMARY KEY (key, model, minute))"
+        )
+        self._conn.commit()
+
+    def write(self, rows: List[UsageRow]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key, model, minute) DO UPDATE SET "
+                "requests = requests + excluded.requests, "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "reasoning_tokens = reasoning_tokens + excluded.reasoning_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens",
+                rows,
+            )
+            self._conn.commit()
+
+    def query(self, key=None, model=None, start=None, end=None, group="day") -> List[dict]:
+        if group == "total":
+            period = "0"
+        else:
+            seconds = _GROUP_SECONDS[group]
+            period = f"(minute / {seconds}) * {seconds}"
+        conditions, params = [], []
+        for column, op, value in (
+            ("key", "=", key),
+            ("model", "=", model),
+            ("minute", ">=", start),
+            ("minute", "<", end),
+        ):
+            if value is not None:
+                conditions.append(f"{column} {op} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = (
+            f"SELECT key, model, {period} AS period, SUM(requests), SUM(prompt_tokens), "
+            f"SUM(reasoning_tokens), SUM(completion_tokens) FROM usage {where} "
+            "GROUP BY key, model, period ORDER BY period, key, model"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {
+                "key": row[0],
+                "model": row[1],
+                "period": row[2] if group != "total" else None,
+                "requests": row[3],
+                "prompt_tokens": row[4],
+                "reasoning_tokens": row[5],
+                "completion_tokens": row[6],
+            }
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_SINK_FACTORIES = {"sqlite": SQLiteSink}
+
+
+def get_sink(name: str = USAGE_SINK) -> UsageSink:
+    """按名称创建存储
+
+    Args:
+        name: sqlite 或 "模块路径:类名"
+
+    Raises:
+        ValueError: 不支持的存储
+    """
+    if name in _SINK_FACTORIES:
+        return _SINK_FACTORIES[name]()
+    module_name, sep, class_name = name.partition(":")
+    if not sep:
+        raise ValueError(f"不支持的用量存储: {name}")
+    sink = getattr(importlib.import_module(module_name), class_name)()
+    if not isinstance(sink, UsageSink):
+        raise ValueError(f"{name} 不是 UsageSink")
+    return sink
+
+
+class UsageLedger:
+    """用量聚合与后台批量写入"""
+
+    def __init__(
+        self,
+        enabled: bool = USAGE_LEDGER_ENABLED,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        queue_size: int = USAGE_QUEUE_SIZE,
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.sink: Optional[UsageSink] = None
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._pending: Dict[Tuple[str, str, int], List[int]] = {}
+
+    def start(self, sink: Optional[UsageSink] = None) -> None:
+        """创建存储并启动后台线程，未启用时不做任何事"""
+        if not self.enabled or self._thread is not None:
+            return
+        self.sink = sink or get_sink()
+        self._thread = threading.Thread(target=self._run, name="usage-ledger", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """写入剩余的用量并停止后台线程"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self.sink.close()
+
+    def record(
+        self,
+        model: str,
+        messages: Sequence[dict],
+        reasoning: Union[str, Iterable[str], None],
+        answer: Union[str, Iterable[str]],
+    ) -> None:
+        """记录一次请求的用量，只入队不计算
+
+        Args:
+            model: 响应中的模型名称
+            messages: 请求的消息列表
+            reasoning: 推理内容或推理片段列表
+            answer: 回答内容或回答片段列表
+        """
+        if self._thread is None:
+            return
+        item = (current_api_key.get(), model, int(time.time() // 60) * 60, messages, reasoning, answer)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            metrics.inc("usage_ledger_dropped_total")
+
+    def query(self, **kwargs) -> List[dict]:
+        """查询已写入存储的用量，最近一个刷新周期内的请求可能尚未包含"""
+        if self.sink is None:
+            return []
+        return self.sink.query(**kwargs)
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self._flush()
+                return
+            if item:
+                try:
+                    self._aggregate(*item)
+                except Exception as e:
+                    metrics.inc("usage_ledger_errors_total")
+                    logger.error(f"统计用量失败，丢弃该请求: {e}")
+            if time.monotonic() >= deadline:
+                self._flush()
+                deadline = time.monotonic() + self.flush_interval
+
+    def _aggregate(self, api_key, model, minute, messages, reasoning, answer) -> None:
+        counts = (1, _count(_message_text(messages)), _count(reasoning), _count(answer))
+        totals = self._pending.setdefault((key_id(api_key), model, minute), [0, 0, 0, 0])
+        for i, count in enumerate(counts):
+            totals[i] += count
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        rows = [(*key, *totals) for key, totals in self._pending.items()]
+        self._pending = {}
+        try:
+            self.sink.write(rows)
+            metrics.inc("usage_ledger_flushed_rows_total", len(rows))
+        except Exception as e:
+            metrics.inc("usage_ledger_write_errors_total")
+            logger.error(f"写入用量失败，丢弃 {len(rows)} 行: {e}")
+
+
+usage_ledger = UsageLedger()
@@ -0,0 +1,5 @@
+"""WebSocket 多路复用接口"""
+
+from .multiplexer import WebSocketSession, sse_to_frames
+
+__all__ = ["WebSocketSession", "sse_to_frames"]
@@ -0,0 +1,202 @@
+"""WebSocket 多路复用
+
+一条 WebSocket 连接只鉴权一次，之后可以并发承载多个对话流，每个流用客户端指定的 id 区分。
+
+客户端消息（JSON 文本帧）：
+    {"type": "auth", "api_key": "..."}            握手时未通过请求头或 api_key 参数鉴权时，首条消息必须是它
+    {"type": "chat", "id": "r1", "body": {...}}    body 与 /v1/chat/completions 的请求体相同，始终流式返回
+    {"type": "cancel", "id": "r1"}                 取消该流，上游请求立即关闭
+    {"type": "ping"}
+
+服务端消息：
+    {"type": "ready"}                              鉴权通过
+    {"id": "r1", "r": "..."}                       推理内容增量
+    {"id": "r1", "c": "..."}                       回答内容增量
+    {"id": "r1", "error": "..."}                   错误（流随后结束）
+    {"id": "r1", "done": true}                     流结束
+    {"id": "r1", "cancelled": true}                流已取消
+    {"type": "pong"}
+"""
+
+import asyncio
+import json
+import os
+from typing import AsyncGenerator, Callable, Dict, Optional
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from app.clients.scheduler import current_priority, resolve_priority
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.usage_ledger import current_api_key
+
+# 单条连接允许同时进行的流数
+WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", "16"))
+# 连接建立后等待 auth 消息的秒数
+WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+# 每条连接待发送帧的队列长度，客户端读取过慢时各个流暂停读取上游
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+
+StreamOpener = Callable[[dict], AsyncGenerator[bytes, None]]
+
+_DONE = b"data: [DONE]"
+
+
+def _dumps(frame: dict) -> str:
+    return json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+
+
+def sse_to_frames(stream_id: str, chunk: bytes):
+    """把流水线输出的 SSE chunk 转换为精简帧，忽略 SSE 注释"""
+    for line in chunk.split(b"\n"):
+        if not line.startswith(b"data: "):
+            continue
+        if line.startswith(_DONE):
+            continue
+        data = json.loads(line[6:])
+        error = data.get("error")
+        if error:
+            yield {"id": stream_id, "error": error.get("message", "")}
+            continue
+        for choice in data.get("choices") or ():
+            delta = choice.get("delta") or {}
+            if delta.get("reasoning_content"):
+                yield {"id": stream_id, "r": delta["reasoning_content"]}
+            if delta.get("content"):
+                yield {"id": stream_id, "c": delta["content"]}
+
+
+class WebSocketSession:
+    """一条 WebSocket 连接上的多个对话流"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        open_stream: StreamOpener,
+        authenticate: Callable[[Optional[str]], bool],
+        api_key: Optional[str] = None,
+    ):
+        """初始化会话
+
+        Args:
+            websocket: 连接对象
+            open_stream: 根据请求体打开流水线输出的函数
+            authenticate: 校验 API 密钥的函数
+            api_key: 握手时已校验通过的密钥，None 表示需要 auth 消息
+        """
+        self.websocket = websocket
+        self.open_stream = open_stream
+        self.authenticate = authenticate
+        self.api_key = api_key
+        self.streams: Dict[str, asyncio.Task] = {}
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+
+    async def run(self) -> None:
+        """处理连接直到客户端断开"""
+        await self.websocket.accept()
+        metrics.inc("ws_connections_total")
+        writer = asyncio.create_task(self._write())
+        try:
+            if self.api_key is None and not await self._wait_auth():
+                await self.outbox.join()
+                await self.websocket.close(code=1008)
+                return
+            await self.outbox.put({"type": "ready"})
+            while True:
+                message = await self.websocket.receive_text()
+                await self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in self.streams.values():
+                task.cancel()
+                metrics.inc("ws_streams_total", outcome="disconnected")
+            await asyncio.gather(*self.streams.values(), return_exceptions=True)
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+
+    async def _wait_auth(self) -> bool:
+        try:
+            async with asyncio.timeout(WS_AUTH_TIMEOUT):
+                message = json.loads(await self.websocket.receive_text())
+        except (TimeoutError, ValueError):
+            message = None
+        if (
+            isinstance(message, dict)
+            and message.get("type") == "auth"
+            and self.authenticate(message.get("api_key"))
+        ):
+            self.api_key = message["api_key"]
+            return True
+        logger.warning("WebSocket 鉴权失败")
+        await self.outbox.put({"type": "error", "error": "Invalid API key"})
+        return False
+
+    async def _write(self) -> None:
+        """唯一的发送任务，保证帧不会交错"""
+        while True:
+            frame = await self.outbox.get()
+            try:
+                await self.websocket.send_text(_dumps(frame))
+            finally:
+                self.outbox.task_done()
+
+    async def _handle(self, message: str) -> None:
+        try:
+            command = json.loads(message)
+        except ValueError:
+            command = None
+        if not isinstance(command, dict):
+            await self.outbox.put({"type": "error", "error": "Invalid JSON"})
+            return
+        kind = command.get("type")
+        stream_id = command.get("id")
+
+        if kind == "ping":
+            await self.outbox.put({"type": "pong"})
+        elif kind == "cancel":
+            # 任务可能尚未开始运行，因此在这里登记并通知，而不是在任务内部
+            task = self.streams.pop(stream_id, None)
+            if task is not None:
+                task.cancel()
+                metrics.inc("ws_streams_total", outcome="cancelled")
+                await self.outbox.put({"id": stream_id, "cancelled": True})
+        elif kind == "chat":
+            body = command.get("body")
+            if not isinstance(stream_id, str) or not isinstance(body, dict):
+                await self.outbox.put({"id": stream_id, "error": "chat 消息需要 id 和 body"})
+            elif stream_id in self.streams:
+                await self.outbox.put({"id": stream_id, "error": "id 已在使用"})
+            elif len(self.streams) >= WS_MAX_STREAMS:
+                await self.outbox.put({"id": stream_id, "error": "并发流数量超过限制"})
+            else:
+                self.streams[stream_id] = asyncio.create_task(self._run_stream(stream_id, body))
+        else:
+            await self.outbox.put({"id": stream_id, "error": f"未知的消息类型: {kind}"})
+
+    async def _run_stream(self, stream_id: str, body: dict) -> None:
+        """运行单个流，任务被取消时流水线生成器随之关闭，上游连接立即释放"""
+        # 每个任务有独立的上下文，只影响本任务
+        api_key = self.api_key.replace("Bearer ", "").strip()
+        current_api_key.set(api_key)
+        current_priority.set(resolve_priority(api_key))
+        try:
+            stream = self.open_stream(body)
+            try:
+                async for chunk in stream:
+                    for frame in sse_to_frames(stream_id, chunk):
+                        await self.outbox.put(frame)
+            finally:
+                await stream.aclose()
+            self._finish(stream_id, "done")
+            await self.outbox.put({"id": stream_id, "done": True})
+        except Exception as e:
+            logger.error(f"WebSocket 流 {stream_id} 处理失败: {e}")
+            self._finish(stream_id, "error")
+            await self.outbox.put({"id": stream_id, "error": str(e)})
+
+    def _finish(self, stream_id: str, outcome: str) -> None:
+        # 同一个 id 可能已被取消后重新使用，只移除当前任务
+        if self.streams.get(stream_id) is asyncio.current_task():
+            del self.streams[stream_id]
+        metrics.inc("ws_streams_total", outcome=outcome)
@@ -0,0 +1,94 @@
+"""审计日志请求路径开销基准测试
+
+测量 AuditLog.record 在请求路径上的单次耗时：未启用、启用且后台线程正常写入、
+启用但磁盘很慢（每批写入额外等待 --disk-delay 秒）三种情况，并统计写入跟不上时被覆盖的记录数。
+磁盘慢时 record 的耗时应与正常写入相同，多出的记录计入丢弃数而不是阻塞请求。
+
+用法:
+    python benchmarks/bench_audit_log.py --records 50000 --rate 10000 --disk-delay 0.2
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.utils.audit_log import AuditLog  # noqa: E402
+from app.utils.chat_request import SamplingParams  # noqa: E402
+
+
+def make_payload(answer_chars: int):
+    messages = [
+        {"role": "system", "content": "你是一个乐于助人的助手。"},
+        {"role": "user", "content": "请解释一下 TCP 拥塞控制中的 AIMD 算法。" * 4},
+    ]
+    params = SamplingParams(0.7, 1.0, 0.0, 0.0)
+    reasoning = ["推理片段 "] * (answer_chars // 5)
+    answer = ["回答片段 "] * (answer_chars // 5)
+    return messages, params, reasoning, answer
+
+
+def bench(log: AuditLog, records: int, rate: int, payload) -> float:
+    """按每秒 rate 条的速度调用 record，返回每次调用的平均纳秒数（不含等待时间）"""
+    messages, params, reasoning, answer = payload
+    record = log.record
+    step = 100
+    elapsed = 0
+    start = time.perf_counter()
+    for first in range(0, records, step):
+        delay = start + first / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        begin = time.perf_counter_ns()
+        for i in range(first, min(first + step, records)):
+            record(f"chatcmpl-{i}", "deepclaude", "deepclaude", "claude", True,
+                   messages, params, reasoning, answer)
+        elapsed += time.perf_counter_ns() - begin
+    return elapsed / records
+
+
+def run_case(name: str, records: int, rate: int, payload, directory: str, disk_delay: float = 0.0, **kwargs):
+    enabled = name != "disabled"
+    log = AuditLog(enabled=enabled, directory=os.path.join(directory, name), **kwargs)
+    if disk_delay:
+        write = log._write
+
+        def slow_write(data: bytes) -> None:
+            time.sleep(disk_delay)
+            write(data)
+
+        log._write = slow_write
+    log.start()
+    ns = bench(log, records, rate, payload)
+    dropped = log._dropped
+    log.stop()
+    size = 0
+    if enabled:
+        for entry in os.scandir(log.directory):
+            size += entry.stat().st_size
+    print(f"{name:>10} {ns:>12.0f} {dropped:>10} {size / 1e6:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--rate", type=int, default=10000, help="每秒记录数")
+    parser.add_argument("--answer-chars", type=int, default=2000)
+    parser.add_argument("--ring-size", type=int, default=10000)
+    parser.add_argument("--disk-delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    payload = make_payload(args.answer_chars)
+    options = dict(ring_size=args.ring_size, batch=500, flush_interval=0.1)
+    print(f"{'case':>10} {'ns/record':>12} {'dropped':>10} {'file MB':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        run_case("disabled", args.records, args.rate, payload, directory, **options)
+        run_case("enabled", args.records, args.rate, payload, directory, **options)
+        run_case("slow_disk", args.records, args.rate, payload, directory, args.disk_delay, **options)
+
+
+if __name__ == "__main__":
+    main()
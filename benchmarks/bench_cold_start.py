@@ -0,0 +1,86 @@
+"""冷启动基准测试
+
+分别测量：
+- 在新进程中 import app.main 的耗时
+- 从启动 uvicorn 子进程到 /ready 返回 200 的耗时
+
+上游 API 密钥使用占位值，不会访问上游。
+
+用法:
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENV = {
+    **os.environ,
+    "PYTHONPATH": ROOT,
+    "DEEPSEEK_API_KEY": os.getenv("DEEPSEEK_API_KEY", "bench"),
+    "CLAUDE_API_KEY": os.getenv("CLAUDE_API_KEY", "bench"),
+    "ALLOW_API_KEY": os.getenv("ALLOW_API_KEY", "bench"),
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure_import() -> float:
+    code = "import time; s = time.perf_counter(); import app.main; print(time.perf_counter() - s)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=ENV, capture_output=True, text=True, check=True
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_ready(port: int) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=ENV,
+    )
+    try:
+        while time.perf_counter() - start < 60:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("服务未在 60 秒内就绪")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=18600)
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    readies = [measure_ready(args.port) for _ in range(args.runs)]
+    print(f"{'phase':<14} {'p50':>8} {'max':>8}")
+    for name, values in (("import", imports), ("spawn->ready", readies)):
+        print(
+            f"{name:<14} {percentile(values, 0.5) * 1000:>6.0f}ms {max(values) * 1000:>6.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""推理 chunk 直通基准测试
+
+用内存中的假传输回放原生推理格式（reasoning_content）的上游 SSE，比较每个推理 token 的 CPU 时间：
+- tasks: 解析 JSON -> 构造字典 -> json.dumps（tasks 编排模式的现有路径）
+- encoder: 解析 JSON -> ChunkEncoder 只转义文本（lean 编排模式的现有路径）
+- passthrough: 只扫描 reasoning_content 字符串，直接拼接上游 choices 字节
+
+同时校验直通输出与解析结果一致。
+
+用法:
+    python benchmarks/bench_reasoning_passthrough.py --tokens 200000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.clients.deepseek_client import DeepSeekClient  # noqa: E402
+from app.clients.transports import Transport  # noqa: E402
+from app.utils.sse import ChunkEncoder  # noqa: E402
+
+# 英文、中文和需要转义的字符混合
+SAMPLE_TOKENS = ["Let", " me", " think", "。", "首先", "，", ' "x"', "\n", " 考虑", " a\\b"]
+
+
+def build_upstream(tokens: int) -> list:
+    """构造与 DeepSeek 官方接口格式一致的 SSE chunk 列表"""
+    chunks = []
+    for i in range(tokens):
+        data = {
+            "id": "0f3c9a1e-7b2d-4c8e-9a55-2f1e0d6c7b3a",
+            "object": "chat.completion.chunk",
+            "created": 1738000000,
+            "model": "deepseek-reasoner",
+            "system_fingerprint": "fp_7e73fd9a08",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": None, "reasoning_content": SAMPLE_TOKENS[i % len(SAMPLE_TOKENS)]},
+                    "logprobs": None,
+                    "finish_reason": None,
+                }
+            ],
+        }
+        chunks.append(f"data: {json.dumps(data, separators=(',', ':'))}\n\n".encode())
+    end = {
+        "id": "0f3c9a1e-7b2d-4c8e-9a55-2f1e0d6c7b3a",
+        "choices": [{"index": 0, "delta": {"content": "ok", "reasoning_content": None}}],
+    }
+    chunks.append(f"data: {json.dumps(end)}\n\n".encode())
+    chunks.append(b"data: [DONE]\n\n")
+    return chunks
+
+
+class ReplayTransport(Transport):
+    name = "replay"
+
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+
+    async def stream(self, url, headers, data, timeout, on_connect=None):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def make_client(chunks: list) -> DeepSeekClient:
+    return DeepSeekClient("key", "http://replay/v1/chat/completions", transport=ReplayTransport(chunks))
+
+
+async def run_tasks(client: DeepSeekClient) -> int:
+    emitted = 0
+    async for content_type, content in client.stream_chat([], "deepseek-reasoner"):
+        if content_type == "reasoning":
+            response = {
+                "id": "chatcmpl-1",
+                "object": "chat.completion.chunk",
+                "created": 1738000000,
+                "model": "deepseek-reasoner",
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"role": "assistant", "reasoning_content": content, "content": ""},
+                    }
+                ],
+            }
+            emitted += len(f"data: {json.dumps(response)}\n\n".encode("utf-8"))
+        elif content_type == "content":
+            break
+    return emitted
+
+
+async def run_encoder(client: DeepSeekClient) -> int:
+    encoder = ChunkEncoder("chatcmpl-1", 1738000000, "deepseek-reasoner", "claude")
+    emitted = 0
+    async for content_type, content in client.stream_chat([], "deepseek-reasoner"):
+        if content_type == "reasoning":
+            emitted += len(encoder.reasoning(content))
+        elif content_type == "content":
+            break
+    return emitted
+
+
+async def run_passthrough(client: DeepSeekClient) -> int:
+    encoder = ChunkEncoder("chatcmpl-1", 1738000000, "deepseek-reasoner", "claude")
+    emitted = 0
+    async for content_type, content in client.stream_chat(
+        [], "deepseek-reasoner", True, encoder.reasoning_head
+    ):
+        if content_type == "reasoning_frame":
+            emitted += len(content[0])
+        elif content_type == "reasoning":
+            emitted += len(encoder.reasoning(content))
+        elif content_type == "content":
+            break
+    return emitted
+
+
+async def verify(chunks: list) -> None:
+    """直通输出的推理文本和 choices 必须与完整解析一致"""
+    encoder = ChunkEncoder("chatcmpl-1", 1738000000, "deepseek-reasoner", "claude")
+    frames = []
+    async for content_type, content in make_client(chunks).stream_chat(
+        [], "deepseek-reasoner", True, encoder.reasoning_head
+    ):
+        if content_type == "reasoning_frame":
+            frames.append(content)
+        elif content_type == "content":
+            break
+    assert len(frames) == len(chunks) - 2, "部分推理 chunk 未走直通路径"
+    for (frame, text), chunk in zip(frames, chunks):
+        upstream = json.loads(chunk[6:])
+        output = json.loads(frame[6:])
+        assert text == upstream["choices"][0]["delta"]["reasoning_content"]
+        assert output["choices"] == upstream["choices"]
+        assert (output["id"], output["model"]) == ("chatcmpl-1", "deepseek-reasoner")
+
+
+def measure(name: str, runner, chunks: list, tokens: int, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        client = make_client(chunks)
+        start = time.process_time()
+        asyncio.run(runner(client))
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_token = best / tokens * 1e6
+    print(f"{name:<12} {best:8.3f} s CPU  {per_token:6.2f} µs/token")
+    return per_token
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chunks = build_upstream(args.tokens)
+    asyncio.run(verify(chunks[:1000] + chunks[-2:]))
+
+    baseline = measure("tasks", run_tasks, chunks, args.tokens, args.repeat)
+    encoder = measure("encoder", run_encoder, chunks, args.tokens, args.repeat)
+    passthrough = measure("passthrough", run_passthrough, chunks, args.tokens, args.repeat)
+    print(
+        f"passthrough 相对 tasks 节省 {(1 - passthrough / baseline) * 100:.0f}%，"
+        f"相对 encoder 节省 {(1 - passthrough / encoder) * 100:.0f}%"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""请求体解码基准测试
+
+在三类接近真实的请求体上比较：
+- stdlib: json.loads 解码为字典后逐个 get 校验（原有路径）
+- typed: decode_chat_request（安装了 orjson 时使用 orjson）解码并校验为 ChatRequest
+
+并测量大请求体解码期间事件循环的最长停顿：inline（在事件循环中解码）与
+read_chat_request 在线程中解码（CHAT_DECODE_OFFLOAD_BYTES）。
+
+用法:
+    python benchmarks/bench_request_decode.py --repeat 200
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.utils import chat_request  # noqa: E402
+from app.utils.chat_request import decode_chat_request, read_chat_request  # noqa: E402
+
+WORDS = "the reasoning model 推理 模型 should consider every 步骤 carefully before answering".split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def build_payloads() -> dict:
+    rng = random.Random(0)
+    small = {
+        "model": "deepclaude",
+        "stream": True,
+        "temperature": 0.7,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": _text(rng, 60)},
+        ],
+    }
+    history = {
+        "model": "deepclaude",
+        "stream": True,
+        "messages": [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": _text(rng, 120)}
+            for i in range(400)
+        ],
+    }
+    image = base64.b64encode(rng.randbytes(768 * 1024)).decode()
+    vision = {
+        "model": "gpt-4o",
+        "stream": True,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": _text(rng, 40)},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}},
+                ],
+            }
+        ],
+    }
+    return {
+        name: json.dumps(body, ensure_ascii=False).encode()
+        for name, body in (("small", small), ("history", history), ("vision", vision))
+    }
+
+
+def decode_stdlib(raw: bytes) -> tuple:
+    """原有路径：json.loads + 逐字段 get"""
+    body = json.loads(raw)
+    messages = body.get("messages")
+    model = body.get("model")
+    if not model:
+        raise ValueError("必须指定模型名称")
+    temperature = body.get("temperature", 0.5)
+    top_p = body.get("top_p", 0.9)
+    presence_penalty = body.get("presence_penalty", 0.0)
+    frequency_penalty = body.get("frequency_penalty", 0.0)
+    stream = body.get("stream", False)
+    return messages, (temperature, top_p, presence_penalty, frequency_penalty, stream)
+
+
+def measure(func, raw: bytes, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(raw)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+
+async def max_loop_stall(raw: bytes, offload: bool, repeat: int) -> float:
+    """解码期间事件循环两次调度之间的最长间隔（毫秒）"""
+    stalls = []
+    done = False
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    for _ in range(repeat):
+        if offload:
+            await read_chat_request(raw)
+        else:
+            decode_chat_request(raw)
+        await asyncio.sleep(0)
+    done = True
+    await task
+    return max(stalls) * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"decoder: {chat_request._loads.__module__}")
+    payloads = build_payloads()
+    print(f"{'payload':<10} {'bytes':>10} {'stdlib µs':>11} {'typed µs':>10} {'saving':>7}")
+    for name, raw in payloads.items():
+        assert decode_chat_request(raw).messages == decode_stdlib(raw)[0]
+        baseline = measure(decode_stdlib, raw, args.repeat)
+        typed = measure(decode_chat_request, raw, args.repeat)
+        print(
+            f"{name:<10} {len(raw):>10} {baseline:>11.1f} {typed:>10.1f} "
+            f"{(1 - typed / baseline) * 100:>6.0f}%"
+        )
+
+    raw = payloads["history"] if len(payloads["history"]) > len(payloads["vision"]) else payloads["vision"]
+    chat_request.CHAT_DECODE_OFFLOAD_BYTES = 1
+    inline = asyncio.run(max_loop_stall(raw, False, 20))
+    offloaded = asyncio.run(max_loop_stall(raw, True, 20))
+    print(f"max loop stall ({len(raw)} bytes): inline {inline:.2f} ms, offloaded {offloaded:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""流式编排模式基准测试：tasks vs lean
+
+用假的上游客户端替换 DeepSeek / Claude，测量：
+- 每个处于打开状态的流占用的内存（tracemalloc）
+- 单核吞吐（每 CPU 秒输出的 token 数）
+
+用法:
+    python benchmarks/bench_stream_orchestrator.py --streams 1000 10000 --tokens 200
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.pipeline import Pipeline, StageSpec  # noqa: E402
+from app.pipeline.providers import ClaudeProvider, DeepSeekProvider  # noqa: E402
+from app.utils.chat_request import SamplingParams  # noqa: E402
+
+
+class FakeRequest:
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+class FakeDeepSeek:
+    def __init__(self, tokens: int, gate: asyncio.Event = None):
+        self.tokens = tokens
+        self.gate = gate
+
+    async def stream_chat(self, messages, model, is_origin_reasoning=True, frame_head=None):
+        for i in range(self.tokens):
+            if self.gate is not None and i == 1:
+                await self.gate.wait()
+            await asyncio.sleep(0)
+            yield "reasoning", "think "
+        yield "content", ""
+
+
+class FakeClaude:
+    provider = "anthropic"
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+    async def stream_chat(self, messages, params, model, stream=True, system_prompt=None):
+        for _ in range(self.tokens):
+            await asyncio.sleep(0)
+            yield "answer", "word "
+
+
+def make_service(mode: str, tokens: int, gate: asyncio.Event = None) -> Pipeline:
+    """与 models.yaml 中 deepclaude 相同的推理 -> 回答流水线"""
+    reasoner = DeepSeekProvider("deepseek", FakeDeepSeek(tokens, gate), "deepseek-reasoner")
+    writer = ClaudeProvider("claude", FakeClaude(tokens), "claude-3-5-sonnet-20241022")
+    stages = [
+        StageSpec("reasoning", reasoner, None, (), None, False),
+        StageSpec("answer", writer, None, ("reasoning",), None, False, sink=True),
+    ]
+    return Pipeline("deepclaude", stages, orchestrator=mode)
+
+
+def open_stream(service: Pipeline):
+    return service.stream(
+        FakeRequest(),
+        [{"role": "user", "content": "hello"}],
+        SamplingParams(0.5, 0.9, 0.0, 0.0),
+        "deepclaude",
+    )
+
+
+async def measure_memory(mode: str, streams: int) -> float:
+    """打开 streams 个流，每个流读到第一个 chunk 后停住，返回每个流的平均字节数"""
+    gate = asyncio.Event()
+    service = make_service(mode, 10, gate)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    generators = [open_stream(service) for _ in range(streams)]
+    await asyncio.gather(*(gen.__anext__() for gen in generators))
+    await asyncio.sleep(0.2)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    gate.set()
+    for gen in generators:
+        await gen.aclose()
+    return used / streams
+
+
+async def measure_throughput(mode: str, streams: int, tokens: int) -> float:
+    """并发跑完 streams 个流，返回每 CPU 秒输出的 token 数"""
+    service = make_service(mode, tokens)
+
+    async def drain():
+        count = 0
+        async for _ in open_stream(service):
+            count += 1
+        return count
+
+    cpu_start = time.process_time()
+    chunks = await asyncio.gather(*(drain() for _ in range(streams)))
+    cpu_used = time.process_time() - cpu_start
+    return sum(chunks) / cpu_used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--modes", nargs="+", default=["tasks", "lean"])
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'streams':>8} {'bytes/stream':>14} {'tokens/cpu-s':>14}")
+    for streams in args.streams:
+        for mode in args.modes:
+            per_stream = asyncio.run(measure_memory(mode, streams))
+            throughput = asyncio.run(measure_throughput(mode, streams, args.tokens))
+            print(f"{mode:<6} {streams:>8} {per_stream:>14.0f} {throughput:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""<think> 标签解析吞吐基准测试
+
+对比旧实现（每个 delta 都对累积内容做一次完整的标签检查，O(n^2)）与
+ThinkTagParser（每个字符常数开销）在长推理轨迹上的吞吐。
+
+用法:
+    python benchmarks/bench_think_parser.py --chars 20000 200000 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.think_tag_parser import ThinkTagParser  # noqa: E402
+
+
+def make_deltas(chars: int, seed: int = 0) -> list:
+    """构造一条长推理轨迹，按 1~6 个字符随机切分为 delta"""
+    rng = random.Random(seed)
+    words = ["reason", "step", "therefore", "推理", "检查", "<", "/", "think", ">"]
+    body = []
+    size = 0
+    while size < chars:
+        word = rng.choice(words) + " "
+        body.append(word)
+        size += len(word)
+    text = "<think>" + "".join(body) + "</think>final answer"
+
+    deltas = []
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, 6)
+        deltas.append(text[i : i + step])
+        i += step
+    return deltas
+
+
+def legacy(deltas: list) -> int:
+    """旧实现的核心循环：累积内容并对整段内容做标签检查"""
+    accumulated = ""
+    events = 0
+    for content in deltas:
+        accumulated += content
+        _ = "<think>" in accumulated and "</think>" in accumulated
+        events += 1
+    return events
+
+
+def streaming(deltas: list) -> int:
+    parser = ThinkTagParser()
+    events = 0
+    for content in deltas:
+        events += len(parser.feed(content))
+    return events + len(parser.finish())
+
+
+def bench(func, deltas: list) -> float:
+    start = time.perf_counter()
+    func(deltas)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars", type=int, nargs="+", default=[20000, 200000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'chars':>10} {'legacy MB/s':>12} {'parser MB/s':>12}")
+    for chars in args.chars:
+        deltas = make_deltas(chars)
+        total_mb = sum(len(d.encode("utf-8")) for d in deltas) / 1e6
+        legacy_s = bench(legacy, deltas)
+        parser_s = bench(streaming, deltas)
+        print(f"{chars:>10} {total_mb / legacy_s:>12.1f} {total_mb / parser_s:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""上游传输基准测试：aiohttp (HTTP/1.1) vs httpx HTTP/2 (h2c)
+
+在子进程中启动 benchmarks/h2_server.py，以不同并发数同时发起流式请求，
+统计服务端接受的连接数以及首 token 时间 (TTFT) 的分位数。
+
+用法:
+    python benchmarks/bench_transport.py --concurrency 100 500 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.clients.transports import AiohttpTransport, HTTP2Transport  # noqa: E402
+
+SERVER = os.path.join(os.path.dirname(__file__), "h2_server.py")
+TIMEOUT = aiohttp.ClientTimeout(total=600, connect=60, sock_read=120)
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def wait_for_port(port: int) -> None:
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"测试服务器未在端口 {port} 启动")
+
+
+async def run(transport, port: int, concurrency: int) -> dict:
+    url = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+    async def one() -> float:
+        start = time.perf_counter()
+        ttft = None
+        async for _ in transport.stream(url, {}, {"stream": True}, TIMEOUT):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        return ttft
+
+    ttfts = await asyncio.gather(*(one() for _ in range(concurrency)))
+    stats = b""
+    async for chunk in transport.stream(f"http://127.0.0.1:{port}/stats", {}, {}, TIMEOUT):
+        stats += chunk
+    await transport.close()
+    return {
+        "connections": json.loads(stats)["connections"],
+        "ttft_p50": percentile(ttfts, 0.5),
+        "ttft_p99": percentile(ttfts, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--port", type=int, default=18443)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--max-connections", type=int, default=100)
+    args = parser.parse_args()
+
+    cases = [
+        ("aiohttp", "h1", lambda: AiohttpTransport(args.max_connections)),
+        ("h2c", "h2c", lambda: HTTP2Transport(args.max_connections, prior_knowledge=True)),
+    ]
+    print(f"{'transport':<9} {'streams':>8} {'conns':>6} {'ttft p50':>9} {'ttft p99':>9}")
+    for concurrency in args.concurrency:
+        for name, proto, factory in cases:
+            server = subprocess.Popen(
+                [
+                    sys.executable, SERVER, "--proto", proto, "--port", str(args.port),
+                    "--tokens", str(args.tokens), "--delay", str(args.delay),
+                ]
+            )
+            try:
+                asyncio.run(wait_for_port(args.port))
+                result = asyncio.run(run(factory(), args.port, concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+            print(
+                f"{name:<9} {concurrency:>8} {result['connections']:>6} "
+                f"{result['ttft_p50'] * 1000:>7.0f}ms {result['ttft_p99'] * 1000:>7.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
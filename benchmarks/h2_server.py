@@ -0,0 +1,185 @@
+"""本地 SSE 测试服务器，用于传输层基准测试
+
+- h2c: 基于 h2 的明文 HTTP/2 服务器（prior knowledge），处理流量控制
+- h1: 基于 aiohttp 的 HTTP/1.1 服务器，作为对照
+
+每个 POST 请求返回 --tokens 个 OpenAI 格式的 SSE chunk，间隔 --delay 秒。
+POST /stats 返回服务器接受过的连接数和处理过的请求数。
+
+用法:
+    python benchmarks/h2_server.py --proto h2c --port 18443
+"""
+
+import argparse
+import asyncio
+import json
+
+from aiohttp import web
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+import h2.settings
+
+
+def sse_chunk(i: int) -> bytes:
+    payload = {"choices": [{"index": 0, "delta": {"content": f"tok{i} "}}]}
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+class H2Protocol(asyncio.Protocol):
+    """单条 HTTP/2 连接"""
+
+    def __init__(self, stats: dict, tokens: int, delay: float, max_streams: int):
+        self.stats = stats
+        self.tokens = tokens
+        self.delay = delay
+        self.conn = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        self.conn.local_settings = h2.settings.Settings(
+            client=False,
+            initial_values={h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: max_streams},
+        )
+        self.transport = None
+        self.paths = {}
+        self.window_open = asyncio.Event()
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.stats["connections"] += 1
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.flush()
+
+    def connection_lost(self, exc):
+        for task in self.tasks:
+            task.cancel()
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data and not self.transport.is_closing():
+            self.transport.write(data)
+
+    def data_received(self, data: bytes):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                self.paths[event.stream_id] = dict(event.headers).get(":path", "/")
+            elif isinstance(event, h2.events.DataReceived):
+                self.conn.acknowledge_received_data(
+                    event.flow_controlled_length, event.stream_id
+                )
+            elif isinstance(event, h2.events.StreamEnded):
+                task = asyncio.create_task(self.respond(event.stream_id))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            elif isinstance(event, h2.events.WindowUpdated):
+                self.window_open.set()
+            elif isinstance(event, h2.events.StreamReset):
+                self.paths.pop(event.stream_id, None)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.flush()
+
+    async def send(self, stream_id: int, data: bytes, end: bool = False):
+        """按流量控制窗口分片发送数据"""
+        while True:
+            window = min(
+                self.conn.local_flow_control_window(stream_id),
+                self.conn.max_outbound_frame_size,
+            )
+            if window <= 0 and data:
+                self.window_open.clear()
+                await self.window_open.wait()
+                continue
+            piece, data = data[:window], data[window:]
+            self.conn.send_data(stream_id, piece, end_stream=end and not data)
+            self.flush()
+            if not data:
+                return
+
+    async def respond(self, stream_id: int):
+        self.stats["requests"] += 1
+        path = self.paths.pop(stream_id, "/")
+        try:
+            if path == "/stats":
+                body = json.dumps(self.stats).encode("utf-8")
+                self.conn.send_headers(
+                    stream_id, [(":status", "200"), ("content-type", "application/json")]
+                )
+                await self.send(stream_id, body, end=True)
+                return
+
+            self.conn.send_headers(
+                stream_id, [(":status", "200"), ("content-type", "text/event-stream")]
+            )
+            self.flush()
+            for i in range(self.tokens):
+                await asyncio.sleep(self.delay)
+                await self.send(stream_id, sse_chunk(i))
+            await self.send(stream_id, b"data: [DONE]\n\n", end=True)
+        except h2.exceptions.StreamClosedError:
+            pass
+
+
+async def serve_h2c(host: str, port: int, tokens: int, delay: float, max_streams: int):
+    stats = {"connections": 0, "requests": 0}
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(
+        lambda: H2Protocol(stats, tokens, delay, max_streams), host, port
+    )
+    async with server:
+        await server.serve_forever()
+
+
+async def serve_h1(host: str, port: int, tokens: int, delay: float):
+    stats = {"connections": 0, "requests": 0}
+    peers = set()
+
+    async def handle(request: web.Request):
+        peer = request.transport.get_extra_info("peername")
+        if peer not in peers:
+            peers.add(peer)
+            stats["connections"] = len(peers)
+        stats["requests"] += 1
+        if request.path == "/stats":
+            return web.json_response(stats)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(tokens):
+            await asyncio.sleep(delay)
+            await response.write(sse_chunk(i))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/{tail:.*}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port, backlog=4096).start()
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--proto", choices=["h2c", "h1"], default="h2c")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18443)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--max-streams", type=int, default=128)
+    args = parser.parse_args()
+
+    if args.proto == "h2c":
+        coro = serve_h2c(args.host, args.port, args.tokens, args.delay, args.max_streams)
+    else:
+        coro = serve_h1(args.host, args.port, args.tokens, args.delay)
+    try:
+        asyncio.run(coro)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()